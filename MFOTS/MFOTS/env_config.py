@@ -13,5 +13,19 @@ class Config(BaseSettings):
     REDIS_HOST: str = 'localhost'
     REDIS_PORT: int = 6379
 
+    # Приём кадров от датчиков вместо чтения json.json (main/sensor_ingest.py)
+    SENSOR_INGEST_HOST: str = '0.0.0.0'
+    SENSOR_UDP_PORT: int | None = None
+    SENSOR_TCP_PORT: int | None = None
+    # Датчик, объекты которого лежат в json.json: поле lane объектов — номер
+    # полосы этого датчика (если у объекта нет своего поля sensor)
+    FILE_SENSOR_ID: int | None = None
+
+    # Аренда ведущего процесса (main/leader.py), сек
+    LEADER_LEASE_TTL: float = 10.0
+
+    # Уровень журнала сервера: DEBUG, INFO, WARNING, ERROR
+    LOG_LEVEL: str = 'INFO'
+
 
 CONFIG = Config()
@@ -95,6 +95,14 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Кэш ответов HTTP API метрик (dynamic_data/metrics_api.py); отдельная база Redis
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"redis://{CONFIG.REDIS_HOST}:{CONFIG.REDIS_PORT}/1",
+    },
+}
+
 
 
 
@@ -171,3 +179,29 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Журнал: сообщения приложений в stderr с уровнем CONFIG.LOG_LEVEL.
+# Горячий цикл рассылки пишет только ошибки; замеры времени — на /metrics.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {
+            'format': '%(asctime)s %(levelname)s %(name)s: %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'default',
+        },
+    },
+    'loggers': {
+        app: {
+            'handlers': ['console'],
+            'level': CONFIG.LOG_LEVEL,
+            'propagate': False,
+        }
+        for app in ('main', 'dynamic_data', 'traffic_light', 'cars')
+    },
+}
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class DynamicDataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dynamic_data'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .topology import TOPOLOGY_MODELS, topology_changed
+
+        # Изменение топологии через ORM сбрасывает её кэш во всех процессах.
+        # QuerySet.update() и bulk_create сигналов не посылают.
+        for model in TOPOLOGY_MODELS:
+            post_save.connect(topology_changed, sender=model, dispatch_uid=f'topology_save_{model.__name__}')
+            post_delete.connect(topology_changed, sender=model, dispatch_uid=f'topology_delete_{model.__name__}')
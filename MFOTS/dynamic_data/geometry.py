@@ -0,0 +1,158 @@
+from datetime import timedelta
+from typing import Optional, Tuple
+
+import numpy as np
+
+from django.db import transaction
+
+from .models import VehicleDetection
+from .rollups import rebuild_rollups
+from .topology import Topology, get_topology
+
+# Привязка обнаружений к полосам и зонам по координатам point_x/point_y.
+#
+# Координаты — в системе датчика: x поперёк дороги, y вдоль неё. Полоса
+# занимает по x отрезок [center - width/2, center + width/2), зона полосы —
+# по y отрезок [zone_offset, zone_offset + width). Полосы одного датчика и
+# зоны одной полосы не пересекаются.
+#
+# ZoneIndex хранит левые границы всех полос (и всех зон) в одном
+# отсортированном массиве: к координате прибавляется номер датчика (полосы),
+# умноженный на span, так что отрезки разных датчиков не перекрываются.
+# Пачка точек привязывается одним np.searchsorted без цикла по строкам.
+
+NO_MATCH = -1
+DEFAULT_BATCH_SIZE = 100_000
+
+
+def _span(edges) -> float:
+    # Ширина «ячейки» одного датчика (полосы): больше размаха всех границ
+    return 2.0 * (max((abs(edge) for edge in edges), default=0.0) + 1.0)
+
+
+def _lookup(starts, ends, ids, keys, valid):
+    # Номер отрезка, которому принадлежит ключ, и его id; NO_MATCH — ключ вне отрезков
+    if not starts.size:
+        missing = np.full(keys.shape, NO_MATCH, dtype=np.int64)
+        return missing, missing
+    position = np.searchsorted(starts, keys, side='right') - 1
+    found = valid & (position >= 0)
+    position = np.where(found, position, 0)
+    found &= keys < ends[position]
+    return np.where(found, ids[position], NO_MATCH), np.where(found, position, NO_MATCH)
+
+
+class ZoneIndex:
+    """Индекс полос и зон топологии для пакетной привязки точек."""
+
+    def __init__(self, topology: Topology):
+        lanes = sorted(topology.lanes.values(), key=lambda lane: (lane.sensor_id, lane.center - lane.width / 2))
+        self.sensor_ids = np.array(sorted({lane.sensor_id for lane in lanes}), dtype=np.int64)
+        sensor_position = {sensor_id: i for i, sensor_id in enumerate(self.sensor_ids.tolist())}
+
+        self.lane_span = _span([lane.center + side * lane.width / 2 for lane in lanes for side in (-1, 1)])
+        lane_base = np.array([sensor_position[lane.sensor_id] * self.lane_span for lane in lanes], dtype=np.float64)
+        self.lane_starts = lane_base + [lane.center - lane.width / 2 for lane in lanes]
+        self.lane_ends = lane_base + [lane.center + lane.width / 2 for lane in lanes]
+        self.lane_ids = np.array([lane.id for lane in lanes], dtype=np.int64)
+
+        zones = [(i, zone) for i, lane in enumerate(lanes) for zone in sorted(lane.zones, key=lambda z: z.zone_offset)]
+        self.zone_span = _span([zone.zone_offset + side * zone.width for _, zone in zones for side in (0, 1)])
+        zone_base = np.array([i * self.zone_span for i, _ in zones], dtype=np.float64)
+        self.zone_starts = zone_base + [zone.zone_offset for _, zone in zones]
+        self.zone_ends = zone_base + [zone.zone_offset + zone.width for _, zone in zones]
+        self.zone_ids = np.array([zone.id for _, zone in zones], dtype=np.int64)
+
+    def assign(self, sensor_ids, x, y) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Полосы и зоны для пачки точек (массивы одной длины). Возвращает
+        (id полос, id зон); NO_MATCH — точка вне полос (зон).
+        """
+        sensor_ids = np.asarray(sensor_ids, dtype=np.int64)
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        sensor_position = np.searchsorted(self.sensor_ids, sensor_ids)
+        known = sensor_position < self.sensor_ids.size
+        sensor_position = np.where(known, sensor_position, 0)
+        if self.sensor_ids.size:
+            known &= self.sensor_ids[sensor_position] == sensor_ids
+
+        # Точка дальше всех границ не должна попасть в ячейку соседнего датчика
+        half = self.lane_span / 2
+        lane_keys = sensor_position * self.lane_span + np.clip(x, -half, half)
+        lane_ids, lane_position = _lookup(self.lane_starts, self.lane_ends, self.lane_ids, lane_keys, known)
+
+        half = self.zone_span / 2
+        zone_keys = lane_position * self.zone_span + np.clip(y, -half, half)
+        zone_ids, _ = _lookup(self.zone_starts, self.zone_ends, self.zone_ids, zone_keys, lane_position != NO_MATCH)
+        return lane_ids, zone_ids
+
+
+_index: Tuple[Optional[Topology], Optional[ZoneIndex]] = (None, None)
+
+
+def get_zone_index() -> ZoneIndex:
+    """Индекс текущей топологии; перестраивается после сброса кэша топологии."""
+    global _index
+    topology = get_topology()
+    cached_topology, index = _index
+    if cached_topology is not topology:
+        index = ZoneIndex(topology)
+        _index = (topology, index)
+    return index
+
+
+def assign_lanes(sensor_ids, x, y) -> Tuple[np.ndarray, np.ndarray]:
+    """Полосы и зоны для пачки точек по текущей топологии (см. ZoneIndex.assign)."""
+    return get_zone_index().assign(sensor_ids, x, y)
+
+
+def lane_mismatches(sensor_ids, lane_ids, x, y) -> int:
+    """Сколько точек лежит не на той полосе, которую указал датчик."""
+    assigned, _ = assign_lanes(sensor_ids, x, y)
+    return int(np.count_nonzero(assigned != np.asarray(lane_ids, dtype=np.int64)))
+
+
+def relane_detections(sensor_ids=None, start=None, end=None, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """
+    Переназначает полосы сохранённых обнаружений по координатам (после
+    перекалибровки датчика). Точки вне всех полос не меняются; агрегаты
+    затронутых полос пересчитываются в той же транзакции. Возвращает отчёт.
+    """
+    queryset = VehicleDetection.objects.all()
+    if sensor_ids:
+        queryset = queryset.filter(sensor_id__in=sensor_ids)
+    if start is not None:
+        queryset = queryset.filter(detection_time__gte=start)
+    if end is not None:
+        queryset = queryset.filter(detection_time__lt=end)
+
+    index = get_zone_index()
+    report = {'rows': 0, 'changed': 0, 'unassigned': 0}
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id')
+                    .values_list('id', 'sensor_id', 'lane_id', 'point_x', 'point_y', 'detection_time')[:batch_size])
+        if not rows:
+            break
+        ids, sensors, lanes, x, y, times = (np.array(column, dtype=dtype) for column, dtype in
+                                            zip(zip(*rows), (np.int64, np.int64, np.int64, np.float64, np.float64,
+                                                             object)))
+        assigned, _ = index.assign(sensors, x, y)
+        changed = (assigned != NO_MATCH) & (assigned != lanes)
+        report['rows'] += len(rows)
+        report['changed'] += int(np.count_nonzero(changed))
+        report['unassigned'] += int(np.count_nonzero(assigned == NO_MATCH))
+        if not dry_run and changed.any():
+            # Одно UPDATE на каждую новую полосу пачки
+            with transaction.atomic():
+                for lane_id in np.unique(assigned[changed]).tolist():
+                    moved = ids[changed & (assigned == lane_id)].tolist()
+                    VehicleDetection.objects.filter(id__in=moved).update(lane_id=lane_id)
+                # Агрегаты прежних и новых полос перенесённых строк
+                moved_times = times[changed]
+                rebuild_rollups(np.concatenate([lanes[changed], assigned[changed]]).tolist(),
+                                min(moved_times), max(moved_times) + timedelta(microseconds=1))
+        last_id = rows[-1][0]
+    return report
@@ -0,0 +1,180 @@
+import io
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from .geometry import lane_mismatches
+from .models import VehicleDetection
+from .topology import get_topology
+
+logger = logging.getLogger(__name__)
+
+# Пакетная запись строк rows_data в VehicleDetection.
+#
+# Строки копятся в буфере и записываются одной командой PostgreSQL COPY
+# (или bulk_create для других СУБД) по batch_size строк либо раз в
+# flush_interval секунд: неполный буфер записывает поток-таймер, даже если
+# новые строки не приходят. Поле lane строки, как в выгрузках, — номер полосы
+# датчика; датчик — поле sensor строки или sensor_id ингестора. Полоса
+# (dynamic_data.Lane) находится по кэшу топологии (topology.py), без запроса к
+# базе на каждую строку.
+# С check_lanes=True перед записью полосы всей пачки сверяются с геометрией
+# (geometry.py); расхождения считаются в stats['lane_mismatches'].
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_FLUSH_INTERVAL = 1.0
+METHODS = ('copy', 'bulk_create')
+
+COPY_COLUMNS = ('sensor_id', 'lane_id', 'obj_id', 'speed_mps', 'detection_time', 'point_x', 'point_y')
+
+
+def _decimal(value):
+    return f'{float(value or 0):.2f}'
+
+
+class DetectionIngestor:
+    """
+    Буферизованная запись обнаружений. Использование:
+
+        with DetectionIngestor(sensor_id=3, batch_size=5000) as ingestor:
+            ingestor.add_many(rows)
+
+    Таймер записи запускается при входе в with (или вызовом start()) и
+    останавливается в close(). Если блок with завершился исключением, уже
+    добавленные строки всё равно записываются; ошибка этой записи только
+    журналируется, наружу выходит исходное исключение.
+    """
+
+    def __init__(self, sensor_id=None, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 method='copy', check_lanes=False):
+        if method not in METHODS:
+            raise ValueError(f"Неизвестный способ записи: {method}")
+        # COPY есть только в PostgreSQL
+        if method == 'copy' and connection.vendor != 'postgresql':
+            method = 'bulk_create'
+        self.sensor_id = sensor_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.method = method
+        self.check_lanes = check_lanes
+        self.stats = {'rows': 0, 'skipped': 0, 'flushes': 0, 'flush_s': 0.0, 'lane_mismatches': 0}
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        # Буфер делят add() и поток-таймер
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._timer = None
+
+    def start(self):
+        """Запускает поток, записывающий неполный буфер раз в flush_interval секунд."""
+        if self._timer is None and self.flush_interval != float('inf'):
+            self._timer = threading.Thread(target=self._run_timer, name='detection-ingest-flush', daemon=True)
+            self._timer.start()
+
+    def _run_timer(self):
+        try:
+            while not self._stopped.wait(self.flush_interval):
+                try:
+                    self.flush_if_due()
+                except Exception as e:
+                    # Буфер не очищен: следующая запись повторит попытку
+                    logger.error("Ошибка записи обнаружений по таймеру: %s", e)
+        finally:
+            # Соединение с базой у потока своё
+            connection.close()
+
+    def add(self, row):
+        """Добавляет строку rows_data; строки неизвестных датчиков и полос пропускаются."""
+        lane = get_topology().lane_for(row.get('sensor', self.sensor_id), row.get('lane'))
+        with self._lock:
+            if lane is None:
+                self.stats['skipped'] += 1
+                return
+            self._buffer.append((lane.sensor_id, lane.id, row['obj_id'], row.get('obj_speed'),
+                                 row['time'], row.get('point_x'), row.get('point_y')))
+            if len(self._buffer) >= self.batch_size:
+                self.flush()
+            else:
+                self.flush_if_due()
+
+    def add_many(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush_if_due(self):
+        """Записывает буфер, если с прошлой записи прошло flush_interval секунд."""
+        with self._lock:
+            if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._buffer:
+                started = time.perf_counter()
+                if self.check_lanes:
+                    sensors, lanes, _, _, _, x, y = zip(*self._buffer)
+                    self.stats['lane_mismatches'] += lane_mismatches(
+                        sensors, lanes, [float(v or 0) for v in x], [float(v or 0) for v in y])
+                self._write(self._buffer)
+                self.stats['rows'] += len(self._buffer)
+                self.stats['flushes'] += 1
+                self.stats['flush_s'] += time.perf_counter() - started
+                self._buffer = []
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        """Останавливает таймер и записывает оставшиеся строки."""
+        self._stopped.set()
+        if self._timer is not None:
+            self._timer.join()
+            self._timer = None
+        self.flush()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+            return
+        try:
+            self.close()
+        except Exception as e:
+            logger.error("Не удалось записать %d обнаружений после ошибки: %s", len(self._buffer), e)
+
+    def _write(self, buffer):
+        with transaction.atomic():
+            if self.method == 'copy':
+                self._copy(buffer)
+            else:
+                self._bulk_create(buffer)
+
+    def _copy(self, buffer):
+        # Текстовый формат COPY: поля через табуляцию; время строк — UTC
+        data = io.StringIO()
+        for sensor_id, lane_id, obj_id, speed, time_str, x, y in buffer:
+            data.write(f'{sensor_id}\t{lane_id}\t{int(obj_id)}\t{_decimal(speed)}\t'
+                       f'{time_str}+00\t{_decimal(x)}\t{_decimal(y)}\n')
+        data.seek(0)
+        table = connection.ops.quote_name(VehicleDetection._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({', '.join(COPY_COLUMNS)}) FROM STDIN", data)
+
+    def _bulk_create(self, buffer):
+        VehicleDetection.objects.bulk_create([
+            VehicleDetection(
+                sensor_id=sensor_id,
+                lane_id=lane_id,
+                obj_id=int(obj_id),
+                speed_mps=Decimal(_decimal(speed)),
+                detection_time=datetime.fromisoformat(time_str).replace(tzinfo=timezone.utc),
+                point_x=Decimal(_decimal(x)),
+                point_y=Decimal(_decimal(y)),
+            )
+            for sensor_id, lane_id, obj_id, speed, time_str, x, y in buffer
+        ], batch_size=self.batch_size)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from dynamic_data.rollups import DEFAULT_BATCH_SIZE, run_aggregator, update_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновляет агрегаты LaneMetricRollup (1 мин, 15 мин, 1 ч) по строкам "
+        "VehicleDetection, появившимся после прошлого запуска."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="один проход вместо фонового цикла")
+        parser.add_argument('--interval', type=float, default=60, help="пауза между проходами, сек")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not options['once']:
+            self.stdout.write(f"Агрегатор запущен, проход раз в {options['interval']} с")
+            run_aggregator(options['interval'], options['batch_size'])
+        total = 0
+        while True:
+            report = update_rollups(options['batch_size'])
+            total += report['rows']
+            if report['rows'] < options['batch_size']:
+                break
+        self.stdout.write(self.style.SUCCESS(f"Обработано строк: {total}, водяной знак: {report['last_id']}"))
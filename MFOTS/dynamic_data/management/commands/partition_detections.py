@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError
+
+from dynamic_data.partitions import INTERVALS, rotate
+
+
+class Command(BaseCommand):
+    help = (
+        "Секционирует VehicleDetection по detection_time: при первом запуске переводит "
+        "таблицу в секционированную, затем создаёт секции наперёд и удаляет устаревшие. "
+        "Запускайте по расписанию (например, раз в сутки)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', choices=INTERVALS, default='day', help="размер секции")
+        parser.add_argument('--ahead', type=int, default=7, help="сколько секций создавать наперёд")
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help="хранить данные за столько дней; без параметра секции не удаляются")
+
+    def handle(self, *args, **options):
+        try:
+            report = rotate(options['interval'], options['ahead'], options['retention_days'])
+        except (ValueError, NotSupportedError) as e:
+            raise CommandError(str(e))
+        if report['converted']:
+            self.stdout.write("Таблица переведена в секционированную")
+        for name in report['created']:
+            self.stdout.write(f"Создана секция {name}")
+        for name in report['dropped']:
+            self.stdout.write(f"Удалена секция {name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Секций создано: {len(report['created'])}, удалено: {len(report['dropped'])}"
+        ))
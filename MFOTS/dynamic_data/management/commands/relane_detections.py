@@ -0,0 +1,39 @@
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from dynamic_data.geometry import DEFAULT_BATCH_SIZE, relane_detections
+
+
+class Command(BaseCommand):
+    help = (
+        "Переназначает полосы сохранённых обнаружений VehicleDetection по "
+        "координатам point_x/point_y и текущей геометрии полос."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sensor', type=int, action='append', dest='sensors', help="id датчика (можно несколько)")
+        parser.add_argument('--start', help="начало периода, ISO 8601")
+        parser.add_argument('--end', help="конец периода, ISO 8601")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="только посчитать, ничего не менять")
+
+    def handle(self, *args, **options):
+        period = {}
+        for name in ('start', 'end'):
+            value = options[name]
+            if value is None:
+                continue
+            moment = parse_datetime(value)
+            if moment is None:
+                raise CommandError(f"Неверное время {name}: {value}")
+            # Время без часового пояса считается UTC
+            period[name] = timezone.make_aware(moment, dt_timezone.utc) if timezone.is_naive(moment) else moment
+        report = relane_detections(options['sensors'], batch_size=options['batch_size'],
+                                   dry_run=options['dry_run'], **period)
+        changed = "нужно изменить" if options['dry_run'] else "изменено"
+        self.stdout.write(self.style.SUCCESS(
+            f"Строк: {report['rows']}, {changed}: {report['changed']}, вне полос: {report['unassigned']}"
+        ))
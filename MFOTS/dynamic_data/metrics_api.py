@@ -0,0 +1,161 @@
+import gzip
+import hashlib
+import json
+import math
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from .models import RollupWatermark
+from .rollups import RECHECK_WINDOW, WATERMARK_NAME, rollup_metrics, rollups_queryset
+
+# Ответы HTTP API метрик (агрегаты LaneMetricRollup за период).
+#
+# Ключ кэша строится из параметров запроса и версии данных периода. Период,
+# все интервалы которого старше окна перепроверки агрегатора (RECHECK_WINDOW
+# до последнего обработанного обнаружения), закрыт: его агрегаты меняет только
+# rebuild_rollups, поэтому версия — число пересчётов. У открытого периода
+# версия — ещё и водяной знак агрегатора. Пока версия не меняется, тот же
+# запрос отдаётся из кэша (Redis, настройка CACHES), а ETag позволяет клиенту
+# получить 304 без тела. ETag сжатого ответа отличается суффиксом -gzip: тела
+# разные, и кэши по пути не должны их путать. В кэше тело хранится сжатым gzip.
+# Большие периоды отдаются потоково (StreamingHttpResponse) — тело не
+# собирается целиком в памяти; если оно укладывается в CACHE_MAX_BYTES, то по
+# окончании отдачи тоже кладётся в кэш.
+
+CACHE_PREFIX = 'api:metrics:'
+CACHE_TTL = 3600
+CACHE_MAX_BYTES = 8 << 20
+STREAM_POINTS = 20_000  # с какого числа точек ответ отдаётся потоково
+STREAM_CHUNK_ROWS = 2000
+GZIP_LEVEL = 6
+
+
+def data_version():
+    """Водяной знак агрегатора: (последний обработанный id, самое позднее обнаружение, пересчёты, время обновления)."""
+    row = (RollupWatermark.objects.filter(name=WATERMARK_NAME)
+           .values_list('last_id', 'last_time', 'rebuilds', 'updated_at').first())
+    return row or (0, None, 0, None)
+
+
+def is_closed(end, resolution, last_time):
+    """Не изменятся ли агрегаты периода, кончающегося в end, при следующих проходах агрегатора."""
+    if last_time is None:
+        return False
+    # Последний интервал периода может заканчиваться позже end
+    bucket_end = math.ceil(end.timestamp() / resolution) * resolution
+    return datetime.fromtimestamp(bucket_end, timezone.utc) <= last_time - timedelta(seconds=RECHECK_WINDOW)
+
+
+def cache_key(kind, ident, start, end, resolution, version):
+    raw = f'{kind}:{ident}:{start.isoformat()}:{end.isoformat()}:{resolution}:{version}'
+    return CACHE_PREFIX + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def accepts_gzip(header):
+    """Принимает ли клиент gzip по заголовку Accept-Encoding (с учётом q=0)."""
+    qualities = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+
+def iter_body(header, lane_ids, start, end, resolution):
+    """JSON ответа частями: header и "lanes": {id полосы: [точки]}."""
+    yield json.dumps(header)[:-1] + ', "lanes": {'
+    for i, lane_id in enumerate(lane_ids):
+        yield (', ' if i else '') + json.dumps(str(lane_id)) + ': ['
+        batch = []
+        first = True
+        queryset = rollups_queryset([lane_id], start, end, resolution)
+        for rollup in queryset.iterator(chunk_size=STREAM_CHUNK_ROWS):
+            batch.append(json.dumps(rollup_metrics(rollup)))
+            if len(batch) >= STREAM_CHUNK_ROWS:
+                yield ('' if first else ', ') + ', '.join(batch)
+                first = False
+                batch = []
+        if batch:
+            yield ('' if first else ', ') + ', '.join(batch)
+        yield ']'
+    yield '}}'
+
+
+def _stream(chunks, key, use_gzip):
+    # Сжимаем по ходу отдачи; сжатое тело копится для кэша, пока не превысит предел
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    stored = []
+    stored_size = 0
+    for chunk in chunks:
+        data = chunk.encode()
+        compressed = compressor.compress(data)
+        if stored is not None and compressed:
+            stored.append(compressed)
+            stored_size += len(compressed)
+            if stored_size > CACHE_MAX_BYTES:
+                stored = None
+        if use_gzip:
+            if compressed:
+                yield compressed
+        else:
+            yield data
+    tail = compressor.flush()
+    if use_gzip:
+        yield tail
+    if stored is not None:
+        cache.set(key, b''.join(stored) + tail, CACHE_TTL)
+
+
+def metrics_response(request, kind, ident, lane_ids, start, end, resolution):
+    """Ответ с метриками полос lane_ids: из кэша, 304 или вычисленный заново."""
+    last_id, last_time, rebuilds, updated_at = data_version()
+    if is_closed(end, resolution, last_time):
+        version, last_modified = f'closed:{rebuilds}', None
+    else:
+        version = f'{last_id}:{rebuilds}'
+        last_modified = int(updated_at.timestamp()) if updated_at is not None else None
+    key = cache_key(kind, ident, start, end, resolution, version)
+    use_gzip = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    etag = f'"{key[len(CACHE_PREFIX):]}{"-gzip" if use_gzip else ""}"'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    cached = cache.get(key)
+    if cached is not None:
+        response = HttpResponse(cached if use_gzip else gzip.decompress(cached),
+                                content_type='application/json')
+    else:
+        header = {kind: ident, 'start': start.isoformat(), 'end': end.isoformat(), 'resolution': resolution}
+        chunks = iter_body(header, lane_ids, start, end, resolution)
+        points = len(lane_ids) * (end - start).total_seconds() / resolution
+        if points > STREAM_POINTS:
+            response = StreamingHttpResponse(_stream(chunks, key, use_gzip), content_type='application/json')
+        else:
+            body = ''.join(chunks).encode()
+            compressed = gzip.compress(body, GZIP_LEVEL)
+            cache.set(key, compressed, CACHE_TTL)
+            response = HttpResponse(compressed if use_gzip else body, content_type='application/json')
+
+    if use_gzip:
+        response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Браузер хранит ответ, но каждый раз сверяется по ETag
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -1,3 +1,4 @@
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 import uuid
 
@@ -43,12 +44,50 @@ class VehicleDetection(models.Model):
     point_x = models.DecimalField(max_digits=10, decimal_places=2)
     point_y = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        # Таблица секционируется по detection_time командой partition_detections
+        indexes = [
+            # «обнаружения на полосе за период»
+            models.Index(fields=['lane', 'detection_time'], name='detection_lane_time_idx'),
+            # Время записи растёт вместе с физическим порядком строк: BRIN занимает
+            # килобайты и отсекает блоки при выборках по диапазону времени
+            BrinIndex(fields=['detection_time'], name='detection_time_brin'),
+        ]
+
 class TrafficQueue(models.Model):
     lane = models.ForeignKey(Lane, on_delete=models.CASCADE)
     max_length = models.DecimalField(max_digits=10, decimal_places=2)
     start_time = models.DateTimeField()
     growth_rate = models.DecimalField(max_digits=10, decimal_places=4)
 
+class LaneMetricRollup(models.Model):
+    # Агрегаты обнаружений полосы за интервал bucket_start + resolution секунд;
+    # заполняются командой aggregate_rollups (dynamic_data/rollups.py)
+    RESOLUTION_CHOICES = [(60, '1 минута'), (900, '15 минут'), (3600, '1 час')]
+
+    lane = models.ForeignKey(Lane, on_delete=models.CASCADE)
+    resolution = models.IntegerField(choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    vehicles = models.IntegerField()          # различные машины (obj_id) за интервал
+    detections = models.IntegerField()        # строк обнаружений
+    speed_sum = models.DecimalField(max_digits=16, decimal_places=2)
+    cars_seconds_sum = models.IntegerField()  # сумма числа машин по секундам интервала
+    cars_max = models.IntegerField()          # наибольшее число машин за одну секунду
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lane', 'resolution', 'bucket_start'],
+                                    name='rollup_lane_resolution_bucket'),
+        ]
+
+class RollupWatermark(models.Model):
+    # До какого id VehicleDetection обработаны агрегаты
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    last_time = models.DateTimeField(null=True)  # самое позднее обработанное detection_time
+    rebuilds = models.IntegerField(default=0)    # сколько раз агрегаты пересчитывались за прошлые периоды
+    updated_at = models.DateTimeField(auto_now=True)
+
 class TrafficLight(models.Model):
     intersection = models.ForeignKey(Intersection, on_delete=models.CASCADE)
     current_phase = models.CharField(max_length=20)
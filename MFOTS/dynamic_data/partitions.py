@@ -0,0 +1,250 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+from django.db import NotSupportedError, connection, models
+from django.db.backends.utils import truncate_name
+
+from .models import VehicleDetection
+
+# Секционирование VehicleDetection по detection_time (PostgreSQL, PARTITION BY RANGE).
+#
+# Таблица модели превращается в секционированную один раз (convert_to_partitioned),
+# дальше команда partition_detections по расписанию заранее создаёт секции на
+# ahead интервалов вперёд и удаляет секции старше срока хранения — DROP TABLE
+# секции вместо DELETE по всей таблице. Секции называются <таблица>_pYYYYMMDD
+# (по дням) или <таблица>_pYYYYMM (по месяцам).
+#
+# Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+# поэтому он становится (id, detection_time); Django по-прежнему считает ключом id.
+# Столбцы, внешние ключи и индексы секционированной таблицы строятся по
+# model._meta (типы столбцов — из бэкенда базы), без внутренних методов
+# schema editor. Столбец id — bigint со значением по умолчанию из своей
+# последовательности (OWNED BY), а не identity: так Django создавала
+# BigAutoField до версии 4.1 и по-прежнему с этим работает
+# (pg_get_serial_sequence, sqlsequencereset).
+#
+# Преобразование выполняется командой, а не миграцией: миграции проекта
+# создаются при развёртывании (makemigrations в entrypoint.sh). Состояние
+# миграций при этом не меняется — модель та же, меняется только физическая
+# таблица. Миграции, меняющие VehicleDetection после преобразования,
+# выполняются на секционированной таблице; AddIndex и новые столбцы
+# PostgreSQL переносит на секции сам.
+#
+# Нужен PostgreSQL не ниже MIN_POSTGRES_VERSION (первичные и внешние ключи
+# секционированных таблиц); проверено на 16.
+# Строка, для времени которой секции нет, не запишется — команду нужно
+# запускать чаще, чем истекает запас ahead.
+
+INTERVALS = ('day', 'month')
+MIN_POSTGRES_VERSION = 120000  # 12, как и у Django 5.0
+_SUFFIX_FORMAT = {'day': '%Y%m%d', 'month': '%Y%m'}
+_SUFFIX_RE = {'day': re.compile(r'_p(\d{8})$'), 'month': re.compile(r'_p(\d{6})$')}
+
+
+def table_name():
+    return VehicleDetection._meta.db_table
+
+
+def period_start(day, interval):
+    return day if interval == 'day' else day.replace(day=1)
+
+
+def next_period(start, interval):
+    if interval == 'day':
+        return start + timedelta(days=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(table, start, interval):
+    return f'{table}_p{start.strftime(_SUFFIX_FORMAT[interval])}'
+
+
+def _bound(day):
+    # Границы секций — полночь UTC
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).isoformat()
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def existing_partitions(cursor, table):
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+        [table],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def ensure_partitions(cursor, table, first_day, last_day, interval):
+    """Создаёт недостающие секции, покрывающие дни с first_day по last_day. Возвращает созданные."""
+    existing = set(existing_partitions(cursor, table))
+    created = []
+    start = period_start(first_day, interval)
+    while start <= last_day:
+        end = next_period(start, interval)
+        name = partition_name(table, start, interval)
+        if name not in existing:
+            cursor.execute(
+                f"CREATE TABLE {connection.ops.quote_name(name)} PARTITION OF {connection.ops.quote_name(table)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [_bound(start), _bound(end)],
+            )
+            created.append(name)
+        start = end
+    return created
+
+
+def drop_old_partitions(cursor, table, keep_from, interval):
+    """Удаляет секции, целиком лежащие раньше дня keep_from. Возвращает удалённые."""
+    dropped = []
+    for name in existing_partitions(cursor, table):
+        match = _SUFFIX_RE[interval].search(name)
+        if match is None:
+            continue
+        start = datetime.strptime(match.group(1), _SUFFIX_FORMAT[interval]).date()
+        if next_period(start, interval) <= keep_from:
+            cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+            dropped.append(name)
+    return dropped
+
+
+def check_server():
+    """NotSupportedError, если база не PostgreSQL нужной версии."""
+    if connection.vendor != 'postgresql':
+        raise NotSupportedError("Секционирование VehicleDetection поддерживается только в PostgreSQL")
+    connection.ensure_connection()
+    if connection.pg_version < MIN_POSTGRES_VERSION:
+        raise NotSupportedError(f"Нужен PostgreSQL {MIN_POSTGRES_VERSION // 10000} или новее, "
+                                f"сервер — {connection.pg_version}")
+
+
+def _column_sql(field):
+    # Тип — как его задаёт бэкенд; у автоинкрементного ключа — тип без identity
+    # (bigint у BigAutoField), значение по умолчанию задаётся последовательностью
+    db_type = field.rel_db_type(connection) if field.primary_key else field.db_type(connection)
+    parts = [connection.ops.quote_name(field.column), db_type]
+    if not field.null:
+        parts.append('NOT NULL')
+    return ' '.join(parts)
+
+
+def _foreign_key_sql(model, field):
+    quote = connection.ops.quote_name
+    table = model._meta.db_table
+    target_table = field.target_field.model._meta.db_table
+    target_column = field.target_field.column
+    name = truncate_name(f'{table}_{field.column}_fk_{target_table}_{target_column}',
+                         connection.ops.max_name_length())
+    # Как у внешних ключей, которые создаёт Django: проверка в конце транзакции
+    return (f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} FOREIGN KEY ({quote(field.column)}) "
+            f"REFERENCES {quote(target_table)} ({quote(target_column)}) DEFERRABLE INITIALLY DEFERRED")
+
+
+def model_indexes(model):
+    """Индексы таблицы модели: по полям с db_index (внешние ключи) и из Meta.indexes."""
+    table = model._meta.db_table
+    indexes = [
+        models.Index(fields=[field.name], name=truncate_name(f'{table}_{field.column}_idx',
+                                                             connection.ops.max_name_length()))
+        for field in model._meta.local_concrete_fields
+        if field.db_index and not field.unique and not field.primary_key
+    ]
+    return indexes + list(model._meta.indexes)
+
+
+def convert_to_partitioned(interval, ahead=7, today=None):
+    """
+    Переносит обычную таблицу VehicleDetection в секционированную с тем же
+    именем: секции под все имеющиеся данные и на ahead интервалов вперёд,
+    тот же набор индексов и внешних ключей. Выполняется в одной транзакции.
+    """
+    model = VehicleDetection
+    table = table_name()
+    old_table = f'{table}_unpartitioned'
+    quote = connection.ops.quote_name
+    fields = model._meta.local_concrete_fields
+    columns = ', '.join(quote(field.column) for field in fields)
+    pk_column = model._meta.pk.column
+    sequence = truncate_name(f'{table}_{pk_column}_seq', connection.ops.max_name_length())
+    key_column = model._meta.get_field('detection_time').column
+    today = today or datetime.now(timezone.utc).date()
+    check_server()
+
+    with connection.schema_editor() as editor:
+        cursor = editor.connection.cursor()
+        # Отложенные проверки внешних ключей (если вызвана внутри транзакции со
+        # вставками) выполняются сейчас: таблицу с ними нельзя удалить
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"SELECT min(detection_time), max(detection_time) FROM {quote(table)}")
+        first, last = cursor.fetchone()
+
+        editor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}")
+        editor.execute(
+            f"CREATE TABLE {quote(table)} ({', '.join(_column_sql(field) for field in fields)}) "
+            f"PARTITION BY RANGE ({quote(key_column)})"
+        )
+
+        first_day = min(first.astimezone(timezone.utc).date(), today) if first else today
+        last_day = max(last.astimezone(timezone.utc).date(), today) if last else today
+        for _ in range(ahead):
+            last_day = next_period(period_start(last_day, interval), interval)
+        created = ensure_partitions(cursor, table, first_day, last_day, interval)
+
+        editor.execute(f"INSERT INTO {quote(table)} ({columns}) SELECT {columns} FROM {quote(old_table)}")
+        # Вместе со старой таблицей удаляется и её последовательность, имя освобождается
+        editor.execute(f"DROP TABLE {quote(old_table)}")
+        editor.execute(f"CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.{quote(pk_column)}")
+        editor.execute(
+            f"SELECT setval(%s, coalesce(max({quote(pk_column)}), 0) + 1, false) FROM {quote(table)}",
+            [sequence],
+        )
+        # Значение по умолчанию переходит и на созданные секции
+        editor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN {quote(pk_column)} "
+                       f"SET DEFAULT nextval(%s::regclass)", [sequence])
+        # После удаления старой таблицы: имя её первичного ключа освобождается
+        editor.execute(f"ALTER TABLE {quote(table)} ADD PRIMARY KEY ({quote(pk_column)}, {quote(key_column)})")
+
+        # Внешние ключи и индексы модели; индекс на секционированной таблице
+        # создаётся и на всех секциях
+        for field in model._meta.local_concrete_fields:
+            if field.remote_field and field.db_constraint:
+                editor.execute(_foreign_key_sql(model, field))
+        for index in model_indexes(model):
+            editor.add_index(model, index)
+    return created
+
+
+def rotate(interval='day', ahead=7, retention_days=None, today=None):
+    """
+    Обслуживание секций: переводит таблицу в секционированную (при первом
+    запуске), создаёт секции на ahead интервалов вперёд и удаляет секции
+    старше retention_days дней.
+    """
+    table = table_name()
+    today = today or datetime.now(timezone.utc).date()
+    report = {'converted': False, 'created': [], 'dropped': []}
+
+    with connection.cursor() as cursor:
+        partitioned = is_partitioned(cursor, table)
+    if not partitioned:
+        report['converted'] = True
+        report['created'] = convert_to_partitioned(interval, ahead, today)
+
+    with connection.cursor() as cursor:
+        existing = existing_partitions(cursor, table)
+        other = [name for name in existing if not _SUFFIX_RE[interval].search(name)]
+        if other:
+            raise ValueError(f"Секции {', '.join(other)} созданы с другим интервалом, ожидается {interval}")
+        last_day = today
+        for _ in range(ahead):
+            last_day = next_period(period_start(last_day, interval), interval)
+        report['created'] += ensure_partitions(cursor, table, today, last_day, interval)
+        if retention_days is not None:
+            report['dropped'] = drop_old_partitions(cursor, table, today - timedelta(days=retention_days), interval)
+    return report
+
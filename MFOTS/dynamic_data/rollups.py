@@ -0,0 +1,199 @@
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+
+from .models import LaneMetricRollup, RollupWatermark, VehicleDetection
+
+# Агрегаты обнаружений по полосам с разрешением 1 мин, 15 мин и 1 ч.
+#
+# update_rollups обрабатывает только строки VehicleDetection с id больше
+# водяного знака (RollupWatermark): находит интервалы, в которые попали новые
+# строки, и пересчитывает эти интервалы целиком из сырых данных (INSERT ...
+# ON CONFLICT DO UPDATE). Поэтому число различных машин за 15 минут и час
+# точное, а не сумма минутных значений.
+#
+# Строки пишут несколько процессов (DetectionIngestor на каждый датчик), и
+# транзакции фиксируются не в порядке id: строка с меньшим id может стать
+# видна уже после того, как водяной знак её обогнал. Поэтому каждый проход
+# ещё раз пересчитывает интервалы последних RECHECK_WINDOW секунд по
+# detection_time (от самого позднего обработанного обнаружения). Строка,
+# зафиксированная позже, чем через RECHECK_WINDOW после более новых данных,
+# в агрегаты не попадёт — до следующего rebuild_rollups.
+#
+# rebuild_rollups пересчитывает агрегаты заданных полос за период заново
+# (после relane_detections, который переносит строки между полосами).
+#
+# Чтение (read_rollups) выбирает разрешение по длине периода: самое подробное,
+# при котором точек на полосу не больше max_points.
+
+RESOLUTIONS = tuple(resolution for resolution, _ in LaneMetricRollup.RESOLUTION_CHOICES)
+WATERMARK_NAME = 'vehicle_detection'
+DEFAULT_BATCH_SIZE = 500_000  # строк VehicleDetection за один проход
+DEFAULT_MAX_POINTS = 500
+RECHECK_WINDOW = 15 * 60  # сек detection_time, пересчитываемые каждым проходом
+CAR_LENGTH = 4.5  # м, как в main.py
+
+_ROLLUP_SQL = """
+WITH touched AS ({touched}),
+detected AS (
+    SELECT d.lane_id, t.bucket, d.obj_id, d.speed_mps, date_trunc('second', d.detection_time) AS second
+    FROM {detections} d
+    JOIN touched t ON d.lane_id = t.lane_id
+     AND d.detection_time >= t.bucket
+     AND d.detection_time < t.bucket + %(resolution)s * interval '1 second'
+),
+seconds AS (
+    SELECT lane_id, bucket, count(DISTINCT obj_id) AS cars
+    FROM detected GROUP BY lane_id, bucket, second
+),
+buckets AS (
+    SELECT lane_id, bucket, count(DISTINCT obj_id) AS vehicles, count(*) AS detections,
+           sum(speed_mps) AS speed_sum
+    FROM detected GROUP BY lane_id, bucket
+)
+INSERT INTO {rollups} (lane_id, resolution, bucket_start, vehicles, detections, speed_sum,
+                       cars_seconds_sum, cars_max)
+SELECT b.lane_id, %(resolution)s, b.bucket, b.vehicles, b.detections, b.speed_sum,
+       sum(s.cars), max(s.cars)
+FROM buckets b JOIN seconds s ON s.lane_id = b.lane_id AND s.bucket = b.bucket
+GROUP BY b.lane_id, b.bucket, b.vehicles, b.detections, b.speed_sum
+ON CONFLICT (lane_id, resolution, bucket_start) DO UPDATE SET
+    vehicles = EXCLUDED.vehicles,
+    detections = EXCLUDED.detections,
+    speed_sum = EXCLUDED.speed_sum,
+    cars_seconds_sum = EXCLUDED.cars_seconds_sum,
+    cars_max = EXCLUDED.cars_max
+"""
+
+_BUCKET_SQL = "to_timestamp(floor(extract(epoch FROM {time}) / %(resolution)s) * %(resolution)s)"
+
+# Интервалы новых строк (id в (low, high]) и последних RECHECK_WINDOW секунд
+_TOUCHED_NEW_SQL = f"""
+    SELECT DISTINCT lane_id, {_BUCKET_SQL.format(time='detection_time')} AS bucket
+    FROM {{detections}}
+    WHERE (id > %(low)s AND id <= %(high)s) OR detection_time >= %(since)s
+"""
+
+# Все интервалы полос lanes, пересекающиеся с [start, end)
+_TOUCHED_RANGE_SQL = f"""
+    SELECT lane_id, bucket
+    FROM unnest(%(lanes)s::bigint[]) AS lane_id,
+         generate_series({_BUCKET_SQL.format(time='%(start)s::timestamptz')},
+                         %(end)s::timestamptz - interval '1 microsecond',
+                         %(resolution)s * interval '1 second') AS bucket
+"""
+
+_DELETE_RANGE_SQL = f"""
+DELETE FROM {{rollups}}
+WHERE lane_id = ANY(%(lanes)s) AND resolution = %(resolution)s
+  AND bucket_start >= {_BUCKET_SQL.format(time='%(start)s::timestamptz')} AND bucket_start < %(end)s
+"""
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return {'detections': quote(VehicleDetection._meta.db_table), 'rollups': quote(LaneMetricRollup._meta.db_table)}
+
+
+def update_rollups(batch_size=DEFAULT_BATCH_SIZE):
+    """Один проход агрегатора: не больше batch_size новых строк. Возвращает отчёт."""
+    tables = _tables()
+    sql = _ROLLUP_SQL.format(touched=_TOUCHED_NEW_SQL.format(**tables), **tables)
+
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+        low = watermark.last_id
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT max(id), count(*), max(detection_time) FROM "
+                f"(SELECT id, detection_time FROM {tables['detections']} WHERE id > %s ORDER BY id LIMIT %s) AS batch",
+                [low, batch_size],
+            )
+            high, rows, newest = cursor.fetchone()
+            if watermark.last_time is not None and (newest is None or newest < watermark.last_time):
+                newest = watermark.last_time
+            if newest is None:
+                return {'rows': 0, 'last_id': low}
+            # Без новых строк проход только перепроверяет последние интервалы
+            since = newest - timedelta(seconds=RECHECK_WINDOW)
+            for resolution in RESOLUTIONS:
+                cursor.execute(sql, {'resolution': resolution, 'low': low, 'high': high or low, 'since': since})
+        watermark.last_id = high or low
+        watermark.last_time = newest
+        watermark.save()
+    return {'rows': rows, 'last_id': watermark.last_id}
+
+
+def rebuild_rollups(lane_ids, start, end):
+    """
+    Пересчитывает агрегаты полос lane_ids всех разрешений в интервалах,
+    пересекающихся с [start, end), из сырых данных; интервалы, где строк
+    больше нет, удаляются.
+    """
+    tables = _tables()
+    sql = _ROLLUP_SQL.format(touched=_TOUCHED_RANGE_SQL, **tables)
+    delete_sql = _DELETE_RANGE_SQL.format(**tables)
+    params = {'lanes': sorted(set(lane_ids)), 'start': start, 'end': end}
+    with transaction.atomic():
+        # Тот же замок, что у update_rollups: проходы не пересекаются
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+        with connection.cursor() as cursor:
+            for resolution in RESOLUTIONS:
+                cursor.execute(delete_sql, dict(params, resolution=resolution))
+                cursor.execute(sql, dict(params, resolution=resolution))
+        # Закрытые периоды в кэше API (metrics_api) устаревают
+        watermark.rebuilds += 1
+        watermark.save()
+
+
+def run_aggregator(interval=60, batch_size=DEFAULT_BATCH_SIZE):
+    """Фоновый агрегатор: догоняет новые строки и ждёт interval секунд."""
+    while True:
+        report = update_rollups(batch_size)
+        if report['rows'] < batch_size:
+            time.sleep(interval)
+
+
+def choose_resolution(start, end, max_points=DEFAULT_MAX_POINTS):
+    """Самое подробное разрешение, при котором на период приходится не больше max_points точек."""
+    span = (end - start).total_seconds()
+    for resolution in RESOLUTIONS:
+        if span / resolution <= max_points:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def rollup_metrics(rollup, car_length=CAR_LENGTH):
+    """Метрики одного интервала для ответа API."""
+    resolution = rollup.resolution
+    return {
+        'time': rollup.bucket_start.isoformat(),
+        'vehicles': rollup.vehicles,
+        'flow_per_hour': rollup.vehicles * 3600 / resolution,
+        'avg_speed': float(rollup.speed_sum) / rollup.detections if rollup.detections else 0,
+        # Секунды без обнаружений считаются секундами без очереди
+        'avg_queue_length_m': rollup.cars_seconds_sum / resolution * car_length,
+        'max_queue_length_m': rollup.cars_max * car_length,
+    }
+
+
+def rollups_queryset(lane_ids, start, end, resolution):
+    # Интервал, начавшийся до start, тоже пересекается с периодом
+    return (LaneMetricRollup.objects
+            .filter(lane_id__in=lane_ids, resolution=resolution,
+                    bucket_start__gt=start - timedelta(seconds=resolution), bucket_start__lt=end)
+            .order_by('lane_id', 'bucket_start'))
+
+
+def read_rollups(lane_ids, start, end, resolution=None, max_points=DEFAULT_MAX_POINTS):
+    """
+    Агрегаты полос lane_ids за [start, end). Без resolution разрешение
+    выбирается по длине периода (choose_resolution).
+    """
+    if resolution is None:
+        resolution = choose_resolution(start, end, max_points)
+    lanes = {str(lane_id): [] for lane_id in lane_ids}
+    for rollup in rollups_queryset(lane_ids, start, end, resolution):
+        lanes[str(rollup.lane_id)].append(rollup_metrics(rollup))
+    return {'resolution': resolution, 'lanes': lanes}
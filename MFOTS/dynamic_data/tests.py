@@ -1,3 +1,297 @@
-from django.test import TestCase
+import time
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.db import NotSupportedError, connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import partitions, topology
+from .geometry import NO_MATCH, ZoneIndex, relane_detections
+from .ingest import DetectionIngestor
+from .metrics_api import accepts_gzip, metrics_response
+from .models import Intersection, Lane, LaneMetricRollup, RollupWatermark, Sensor, VehicleDetection
+from .rollups import RECHECK_WINDOW, WATERMARK_NAME, update_rollups
+from .topology import LaneInfo, Topology, ZoneInfo
+
+
+def _lane(lane_id, sensor_id, number):
+    return LaneInfo(lane_id, sensor_id, 1, number, number * 3.5, 3.5, 0, True, ())
+
+
+TOPOLOGY = Topology([_lane(11, 1, 0), _lane(12, 1, 1), _lane(21, 2, 0)])
+
+
+def _row(lane, obj_id=1, **extra):
+    return dict({'lane': lane, 'obj_id': obj_id, 'obj_speed': 10.5, 'time': '2025-01-01 00:00:00.100000',
+                 'point_x': 1.0, 'point_y': 2.0}, **extra)
+
+
+class DetectionIngestorTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('dynamic_data.ingest.get_topology', return_value=TOPOLOGY)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.written = []
+
+    def _ingestor(self, **kwargs):
+        ingestor = DetectionIngestor(method='bulk_create', **kwargs)
+        ingestor._write = lambda buffer: self.written.extend(buffer)
+        return ingestor
+
+    def test_lane_number_resolved_through_sensor(self):
+        ingestor = self._ingestor(sensor_id=1)
+        ingestor.add_many([_row(0), _row(1), _row(0, sensor=2), _row(5), _row(1, sensor=2)])
+        ingestor.close()
+        # (датчик, id полосы) строк; номера 5 у датчика 1 и 1 у датчика 2 нет
+        self.assertEqual([(sensor, lane) for sensor, lane, *_ in self.written], [(1, 11), (1, 12), (2, 21)])
+        self.assertEqual(ingestor.stats['skipped'], 2)
+
+    def test_rows_without_sensor_are_skipped(self):
+        ingestor = self._ingestor()
+        ingestor.add(_row(0))
+        ingestor.close()
+        self.assertEqual(self.written, [])
+        self.assertEqual(ingestor.stats['skipped'], 1)
+
+    def test_timer_flushes_idle_buffer(self):
+        with self._ingestor(sensor_id=1, flush_interval=0.05) as ingestor:
+            ingestor.add(_row(0))
+            deadline = time.monotonic() + 2
+            while not self.written and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(self.written), 1)
+        self.assertEqual(ingestor.stats['rows'], 1)
+
+    def test_exception_in_block_flushes_buffered_rows(self):
+        with self.assertRaises(KeyError):
+            with self._ingestor(sensor_id=1, flush_interval=float('inf')) as ingestor:
+                ingestor.add(_row(0))
+                ingestor.add({'lane': 1})
+        self.assertEqual(len(self.written), 1)
+
+
+class TopologyCacheTests(SimpleTestCase):
+    def setUp(self):
+        # Без подписки на канал Redis: сбросы вызываются явно
+        patcher = mock.patch('dynamic_data.topology._start_listener')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        topology.invalidate()
+        self.addCleanup(topology.invalidate)
+
+    def test_loaded_once_until_invalidated(self):
+        first, second = Topology([_lane(11, 1, 0)]), Topology([_lane(12, 1, 0)])
+        with mock.patch('dynamic_data.topology.load_topology', side_effect=[first, second]) as load:
+            self.assertIs(topology.get_topology(), first)
+            self.assertIs(topology.get_topology(), first)
+            topology.invalidate()
+            self.assertIs(topology.get_topology(), second)
+        self.assertEqual(load.call_count, 2)
+
+    def test_invalidation_during_load_discards_snapshot(self):
+        stale, fresh = Topology([_lane(11, 1, 0)]), Topology([_lane(12, 1, 0)])
+        snapshots = [stale, fresh]
+
+        def load():
+            snapshot = snapshots.pop(0)
+            if snapshot is stale:
+                # Модель изменилась, пока шёл запрос
+                topology.invalidate()
+            return snapshot
+
+        with mock.patch('dynamic_data.topology.load_topology', side_effect=load):
+            self.assertIs(topology.get_topology(), fresh)
+            self.assertIs(topology.get_topology(), fresh)
+
+
+class ZoneIndexTests(SimpleTestCase):
+    def setUp(self):
+        zones = (ZoneInfo(101, 10.0, 1, 0.0), ZoneInfo(102, 5.0, 1, 20.0), ZoneInfo(103, 5.0, 1, 25.0))
+        # Полосы с промежутком, датчик с отрицательными смещениями и полоса без зон
+        self.lanes = [
+            LaneInfo(11, 1, 1, 0, 0.0, 3.5, 0, True, zones[:2]),
+            LaneInfo(12, 1, 1, 1, 5.0, 3.0, 0, True, zones[2:]),
+            LaneInfo(21, 7, 1, 0, -40.0, 4.0, 0, True, (ZoneInfo(201, 2.5, 1, -3.0),)),
+            LaneInfo(22, 7, 1, 1, -36.0, 4.0, 0, True, ()),
+        ]
+        self.index = ZoneIndex(Topology(self.lanes))
+
+    def _expected(self, sensor_id, x, y):
+        # Перебор полос и зон точки за точкой
+        for lane in self.lanes:
+            if lane.sensor_id == sensor_id and lane.center - lane.width / 2 <= x < lane.center + lane.width / 2:
+                for zone in lane.zones:
+                    if zone.zone_offset <= y < zone.zone_offset + zone.width:
+                        return lane.id, zone.id
+                return lane.id, NO_MATCH
+        return NO_MATCH, NO_MATCH
+
+    def test_matches_point_by_point_lookup(self):
+        rng = np.random.default_rng(0)
+        size = 5000
+        sensor_ids = rng.choice([1, 3, 7, 8], size)
+        x = rng.uniform(-50, 50, size)
+        y = rng.uniform(-10, 40, size)
+        # Точки на границах отрезков и далеко за пределами всех границ
+        x[:8] = [-1.75, 1.7, 3.5, 6.5, -42.0, -38.0, 1e6, -1e6]
+        sensor_ids[:8] = [1, 1, 1, 1, 7, 7, 1, 7]
+        y[:8] = [0.0, 10.0, 25.0, 30.0, -3.0, 0.0, 0.0, 0.0]
+
+        lane_ids, zone_ids = self.index.assign(sensor_ids, x, y)
+        expected = [self._expected(*point) for point in zip(sensor_ids.tolist(), x.tolist(), y.tolist())]
+        self.assertEqual(list(zip(lane_ids.tolist(), zone_ids.tolist())), expected)
+        self.assertEqual(expected[:8], [(11, 101), (11, NO_MATCH), (12, 103), (NO_MATCH, NO_MATCH),
+                                        (21, 201), (22, NO_MATCH), (NO_MATCH, NO_MATCH), (NO_MATCH, NO_MATCH)])
+
+    def test_empty_topology_and_batch(self):
+        lane_ids, zone_ids = ZoneIndex(Topology([])).assign([1, 2], [0.0, 1.0], [0.0, 1.0])
+        self.assertEqual(lane_ids.tolist(), [NO_MATCH, NO_MATCH])
+        self.assertEqual(zone_ids.tolist(), [NO_MATCH, NO_MATCH])
+        lane_ids, zone_ids = self.index.assign([], [], [])
+        self.assertEqual((lane_ids.size, zone_ids.size), (0, 0))
+
+
+class DetectionTestCase(TestCase):
+    START = datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+
+    def setUp(self):
+        patcher = mock.patch('dynamic_data.topology._start_listener')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        topology.invalidate()
+        self.addCleanup(topology.invalidate)
+        intersection = Intersection.objects.create(name='test')
+        self.sensor = Sensor.objects.create(
+            mounting_height=6, rotate_x=0, rotate_y=0, rotate_z=0, x_coordinate=0, y_coordinate=0,
+            sensor_type='radar', sensor_ip='127.0.0.1', port=0, command_port=0, firmware_version='1',
+            intersection=intersection)
+        self.lanes = [Lane.objects.create(sensor=self.sensor, center=number * 3.5, direction=0, width=3.5,
+                                          active=True, intersection=intersection) for number in range(2)]
+
+    def _detect(self, lane, obj_id, seconds, point_x=0, **extra):
+        return VehicleDetection.objects.create(
+            sensor=self.sensor, lane=lane, obj_id=obj_id, speed_mps=10, point_x=point_x, point_y=0,
+            detection_time=self.START + timedelta(seconds=seconds), **extra)
+
+
+
+@skipUnless(connection.vendor == 'postgresql', "агрегаты считаются SQL PostgreSQL")
+class RollupTests(DetectionTestCase):
+    def _vehicles(self, lane, resolution=60):
+        return dict(LaneMetricRollup.objects.filter(lane=lane, resolution=resolution)
+                    .values_list('bucket_start', 'vehicles'))
+
+    def test_row_committed_behind_watermark_is_aggregated(self):
+        late = self._detect(self.lanes[0], 1, 5)
+        newer = self._detect(self.lanes[0], 2, 10)
+        # Строка late ещё не зафиксирована: агрегатор видит только newer
+        late_id = late.id
+        late.delete()
+        self.assertEqual(update_rollups()['last_id'], newer.id)
+        self.assertEqual(self._vehicles(self.lanes[0]), {self.START: 1})
+
+        self._detect(self.lanes[0], 1, 5, id=late_id)
+        self.assertEqual(update_rollups()['rows'], 0)
+        self.assertEqual(self._vehicles(self.lanes[0]), {self.START: 2})
+
+    def test_relane_recomputes_rollups_of_both_lanes(self):
+        self._detect(self.lanes[0], 1, 5)
+        # Точка лежит на полосе 1, хотя датчик указал полосу 0
+        self._detect(self.lanes[0], 2, 70, point_x=3.5)
+        update_rollups()
+        self.assertEqual(self._vehicles(self.lanes[0]), {self.START: 1, self.START + timedelta(minutes=1): 1})
+
+        self.assertEqual(relane_detections()['changed'], 1)
+        self.assertEqual(self._vehicles(self.lanes[0]), {self.START: 1})
+        self.assertEqual(self._vehicles(self.lanes[1]), {self.START + timedelta(minutes=1): 1})
+        self.assertEqual(self._vehicles(self.lanes[0], 3600), {self.START: 1})
+        self.assertEqual(self._vehicles(self.lanes[1], 3600), {self.START: 1})
+
+
+@skipUnless(connection.vendor == 'postgresql', "секционирование есть только в PostgreSQL")
+class PartitionTests(DetectionTestCase):
+    def _column(self, cursor, column):
+        cursor.execute(
+            "SELECT a.attidentity, pg_get_expr(d.adbin, d.adrelid) FROM pg_attribute a "
+            "LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum "
+            "WHERE a.attrelid = to_regclass(%s) AND a.attname = %s",
+            [partitions.table_name(), column],
+        )
+        return cursor.fetchone()
+
+    def test_conversion_keeps_rows_and_continues_ids(self):
+        old = [self._detect(self.lanes[number % 2], number, number * 86400) for number in range(3)]
+        report = partitions.rotate('day', ahead=1, today=date(2025, 1, 3))
+        self.assertTrue(report['converted'])
+
+        table = partitions.table_name()
+        with connection.cursor() as cursor:
+            self.assertTrue(partitions.is_partitioned(cursor, table))
+            self.assertEqual(partitions.existing_partitions(cursor, table),
+                             [f'{table}_p2025010{day}' for day in range(1, 5)])
+            identity, default = self._column(cursor, 'id')
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+            sequence = cursor.fetchone()[0]
+        # Обычный bigint с последовательностью, без identity
+        self.assertEqual(identity, '')
+        self.assertEqual(default, f"nextval('{sequence.split('.')[-1]}'::regclass)")
+
+        self.assertEqual(list(VehicleDetection.objects.order_by('id').values_list('id', 'obj_id')),
+                         [(row.id, row.obj_id) for row in old])
+        new = self._detect(self.lanes[0], 9, 3 * 86400 + 60)
+        self.assertEqual(new.id, old[-1].id + 1)
+
+    def test_requires_supported_server(self):
+        with mock.patch.object(partitions, 'MIN_POSTGRES_VERSION', connection.pg_version + 1):
+            with self.assertRaises(NotSupportedError):
+                partitions.rotate('day')
+        with connection.cursor() as cursor:
+            self.assertFalse(partitions.is_partitioned(cursor, partitions.table_name()))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class MetricsApiTests(DetectionTestCase):
+    def setUp(self):
+        super().setUp()
+        for minute in range(3):
+            LaneMetricRollup.objects.create(
+                lane=self.lanes[0], resolution=60, bucket_start=self.START + timedelta(minutes=minute),
+                vehicles=minute + 1, detections=minute + 1, speed_sum=10, cars_seconds_sum=1, cars_max=1)
+        self.watermark = RollupWatermark.objects.create(name=WATERMARK_NAME, last_id=10,
+                                                        last_time=self.START + timedelta(minutes=3))
+
+    def _get(self, end_minutes, encoding='gzip', **headers):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=encoding, **headers)
+        end = self.START + timedelta(minutes=end_minutes)
+        return metrics_response(request, 'lane', self.lanes[0].id, [self.lanes[0].id], self.START, end, 60)
+
+    def test_accept_encoding_quality(self):
+        self.assertTrue(accepts_gzip('gzip, deflate'))
+        self.assertTrue(accepts_gzip('br;q=1.0, gzip;q=0.5'))
+        self.assertTrue(accepts_gzip('*'))
+        self.assertFalse(accepts_gzip('gzip;q=0, identity'))
+        self.assertFalse(accepts_gzip('*;q=0.5, gzip; q=0'))
+        self.assertFalse(accepts_gzip(''))
+
+    def test_etag_differs_per_encoding(self):
+        compressed, plain = self._get(3), self._get(3, encoding='gzip;q=0')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(compressed['ETag'], plain['ETag'][:-1] + '-gzip"')
+        # ETag одного представления не подходит для другого
+        self.assertEqual(self._get(3, encoding='identity', HTTP_IF_NONE_MATCH=compressed['ETag']).status_code, 200)
+        self.assertEqual(self._get(3, HTTP_IF_NONE_MATCH=compressed['ETag']).status_code, 304)
+
+    def test_closed_range_survives_aggregator_passes(self):
+        self.watermark.last_time = self.START + timedelta(seconds=RECHECK_WINDOW + 120)
+        self.watermark.save()
+        closed, open_ = self._get(2), self._get(3)
+        self.watermark.last_id = 20
+        self.watermark.save()
+        self.assertEqual(self._get(2)['ETag'], closed['ETag'])
+        self.assertNotEqual(self._get(3)['ETag'], open_['ETag'])
+        # Пересчёт прошлых периодов меняет и закрытые
+        self.watermark.rebuilds += 1
+        self.watermark.save()
+        self.assertNotEqual(self._get(2)['ETag'], closed['ETag'])
@@ -0,0 +1,197 @@
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import redis
+from django.db import transaction
+
+from MFOTS.env_config import CONFIG
+
+from .models import DetectionZone, Intersection, Lane, Sensor
+
+logger = logging.getLogger(__name__)
+
+# Кэш топологии в памяти процесса: датчик -> полосы -> зоны, полоса -> перекрёсток.
+#
+# Загружается одним запросом при первом обращении и дальше отвечает без
+# обращений к базе. Сохранение или удаление Sensor, Lane, DetectionZone и
+# Intersection сбрасывает кэш в этом процессе и (после фиксации транзакции)
+# публикует сообщение в канал Redis TOPOLOGY_CHANNEL; все процессы (Daphne,
+# Gunicorn, команды), у которых загружен кэш, подписаны на канал и сбрасывают
+# его одновременно. Следующее обращение загружает топологию заново.
+#
+# Номер полосы датчика — позиция полосы среди полос этого датчика,
+# упорядоченных по center (поперечному смещению), начиная с 0.
+
+TOPOLOGY_CHANNEL = 'topology:invalidate'
+RECONNECT_DELAY = 1.0
+
+
+class ZoneInfo(NamedTuple):
+    id: int
+    width: float
+    classes: int
+    zone_offset: float
+
+
+class LaneInfo(NamedTuple):
+    id: int
+    sensor_id: int
+    intersection_id: int
+    number: int
+    center: float
+    width: float
+    direction: int
+    active: bool
+    zones: Tuple[ZoneInfo, ...]
+
+
+class Topology:
+    """Неизменяемый снимок топологии; замена снимка целиком потокобезопасна."""
+
+    def __init__(self, lanes: List[LaneInfo], sensor_ips: Optional[Dict[str, int]] = None):
+        self.sensor_ips: Dict[str, int] = sensor_ips or {}
+        self.lanes: Dict[int, LaneInfo] = {lane.id: lane for lane in lanes}
+        self.by_sensor_lane: Dict[Tuple[int, int], LaneInfo] = {(lane.sensor_id, lane.number): lane for lane in lanes}
+        self.intersection_lanes: Dict[int, List[int]] = {}
+        self.sensor_lanes: Dict[int, List[int]] = {}
+        for lane in lanes:
+            self.intersection_lanes.setdefault(lane.intersection_id, []).append(lane.id)
+            self.sensor_lanes.setdefault(lane.sensor_id, []).append(lane.id)
+
+    def sensor_for_ip(self, ip) -> Optional[int]:
+        """Датчик по адресу sensor_ip (только датчики, у которых есть полосы)."""
+        return self.sensor_ips.get(ip)
+
+    def lane(self, lane_id) -> Optional[LaneInfo]:
+        return self.lanes.get(lane_id)
+
+    def lane_for(self, sensor_id, number) -> Optional[LaneInfo]:
+        """Полоса по id датчика и номеру полосы датчика."""
+        return self.by_sensor_lane.get((sensor_id, number))
+
+    def zones_for(self, sensor_id, number) -> Tuple[ZoneInfo, ...]:
+        lane = self.by_sensor_lane.get((sensor_id, number))
+        return lane.zones if lane is not None else ()
+
+
+def load_topology() -> Topology:
+    """Загружает топологию одним запросом (полосы с зонами через LEFT JOIN)."""
+    rows = (Lane.objects
+            .order_by('sensor_id', 'center', 'id', 'detectionzone__id')
+            .values_list('id', 'sensor_id', 'sensor__sensor_ip', 'intersection_id', 'center', 'width',
+                         'direction', 'active', 'detectionzone__id', 'detectionzone__width', 'detectionzone__classes',
+                         'detectionzone__zone_offset'))
+    lanes = []
+    sensor_ips = {}
+    current = None
+    zones = []
+    number = 0
+    for lane_id, sensor_id, sensor_ip, intersection_id, center, width, direction, active, zone_id, *zone in rows:
+        if current is None or current[0] != lane_id:
+            if current is not None:
+                lanes.append(LaneInfo(*current, tuple(zones)))
+                number = number + 1 if current[1] == sensor_id else 0
+            current = (lane_id, sensor_id, intersection_id, number, float(center), float(width), direction, active)
+            zones = []
+            sensor_ips[sensor_ip] = sensor_id
+        if zone_id is not None:
+            zone_width, classes, zone_offset = zone
+            zones.append(ZoneInfo(zone_id, float(zone_width), classes, float(zone_offset)))
+    if current is not None:
+        lanes.append(LaneInfo(*current, tuple(zones)))
+    return Topology(lanes, sensor_ips)
+
+
+_current: Optional[Topology] = None
+# Номер сброса кэша: снимок, во время загрузки которого кэш сбросили, устарел
+_generation = 0
+_state_lock = threading.Lock()  # _current и _generation
+_load_lock = threading.Lock()   # загружает один поток
+_listener: Optional[threading.Thread] = None
+
+
+def _redis():
+    return redis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=0)
+
+
+def get_topology() -> Topology:
+    """Текущая топология; при первом обращении или после сброса загружается из базы."""
+    topology = _current
+    if topology is None:
+        topology = _reload()
+    return topology
+
+
+async def aget_topology() -> Topology:
+    """get_topology для цикла событий: загруженный кэш отдаётся без ухода в поток."""
+    topology = _current
+    if topology is None:
+        from channels.db import database_sync_to_async
+
+        topology = await database_sync_to_async(get_topology)()
+    return topology
+
+
+def _reload() -> Topology:
+    global _current
+    with _load_lock:
+        _start_listener()
+        while True:
+            with _state_lock:
+                if _current is not None:
+                    return _current
+                generation = _generation
+            topology = load_topology()
+            with _state_lock:
+                # Сброс во время загрузки (сигнал или сообщение канала): загружаем заново
+                if generation == _generation:
+                    _current = topology
+                    return topology
+
+
+def invalidate() -> None:
+    """Сбрасывает кэш этого процесса."""
+    global _current, _generation
+    with _state_lock:
+        _generation += 1
+        _current = None
+
+
+def _listen() -> None:
+    while True:
+        try:
+            pubsub = _redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(TOPOLOGY_CHANNEL)
+            # Пока подписки не было, сообщения могли потеряться
+            invalidate()
+            for _ in pubsub.listen():
+                invalidate()
+        except redis.RedisError as e:
+            logger.warning("Ошибка подписки на %s: %s", TOPOLOGY_CHANNEL, e)
+            time.sleep(RECONNECT_DELAY)
+
+
+def _start_listener() -> None:
+    # Процесс подписывается на сброс кэша, только когда кэш ему действительно нужен
+    global _listener
+    if _listener is None:
+        _listener = threading.Thread(target=_listen, name='topology-listener', daemon=True)
+        _listener.start()
+
+
+def _publish() -> None:
+    try:
+        _redis().publish(TOPOLOGY_CHANNEL, '1')
+    except redis.RedisError as e:
+        logger.warning("Не удалось оповестить о смене топологии: %s", e)
+
+
+def topology_changed(sender, **kwargs) -> None:
+    """Обработчик post_save/post_delete моделей топологии."""
+    invalidate()
+    transaction.on_commit(_publish)
+
+
+TOPOLOGY_MODELS = (Sensor, Lane, DetectionZone, Intersection)
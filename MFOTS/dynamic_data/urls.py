@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('rollups/', views.lane_rollups, name='lane-rollups'),
+    path('lanes/<int:lane_id>/metrics/', views.lane_metrics, name='lane-metrics'),
+    path('intersections/<int:intersection_id>/metrics/', views.intersection_metrics, name='intersection-metrics'),
+]
@@ -1,3 +1,82 @@
-from django.shortcuts import render
+from datetime import timezone as dt_timezone
 
-# Create your views here.
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET
+
+from .metrics_api import metrics_response
+from .models import Intersection
+from .rollups import RESOLUTIONS, choose_resolution, read_rollups
+from .topology import get_topology
+
+
+def _parse_ids(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def _parse_time(value):
+    # Время без часового пояса считается UTC
+    moment = parse_datetime(value)
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+def _parse_range(request):
+    """start, end и resolution из параметров запроса; ValueError с текстом ошибки."""
+    try:
+        start = _parse_time(request.GET.get('start', ''))
+        end = _parse_time(request.GET.get('end', ''))
+        resolution = request.GET.get('resolution')
+        resolution = int(resolution) if resolution else None
+    except ValueError:
+        raise ValueError("Неверный формат параметров")
+    if start is None or end is None or start >= end:
+        raise ValueError("Нужны параметры start и end (start < end)")
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution должен быть одним из {list(RESOLUTIONS)}")
+    return start, end, resolution
+
+
+@require_GET
+def lane_rollups(request):
+    """
+    GET /api/rollups/?lanes=1,2&start=2025-03-20T00:00:00Z&end=2025-03-27T00:00:00Z[&resolution=900]
+    Агрегаты полос за период; без resolution разрешение выбирается по длине периода.
+    """
+    try:
+        lane_ids = _parse_ids(request.GET.get('lanes', ''))
+        start, end, resolution = _parse_range(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not lane_ids:
+        return JsonResponse({'error': "Нужен параметр lanes"}, status=400)
+    return JsonResponse(read_rollups(lane_ids, start, end, resolution))
+
+
+@require_GET
+def lane_metrics(request, lane_id):
+    """GET /api/lanes/<id>/metrics/?start=...&end=...[&resolution=...] — метрики полосы за период."""
+    try:
+        start, end, resolution = _parse_range(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if get_topology().lane(lane_id) is None:
+        raise Http404("Полоса не найдена")
+    resolution = resolution or choose_resolution(start, end)
+    return metrics_response(request, 'lane', lane_id, [lane_id], start, end, resolution)
+
+
+@require_GET
+def intersection_metrics(request, intersection_id):
+    """GET /api/intersections/<id>/metrics/?start=...&end=...[&resolution=...] — метрики всех полос перекрёстка."""
+    try:
+        start, end, resolution = _parse_range(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not Intersection.objects.filter(id=intersection_id).exists():
+        raise Http404("Перекрёсток не найден")
+    lane_ids = sorted(get_topology().intersection_lanes.get(intersection_id, []))
+    resolution = resolution or choose_resolution(start, end)
+    return metrics_response(request, 'intersection', intersection_id, lane_ids, start, end, resolution)
@@ -1,7 +1,4 @@
-import os
-import threading
 from django.apps import AppConfig
-from .utils import read_json_and_store_in_redis, update_redis_periodically
 from .consumers import start_background_task
 
 
@@ -10,10 +7,6 @@ class MainConfig(AppConfig):
     name = 'main'
 
     def ready(self):
-        # Читаем JSON и сохраняем в Redis при старте
-        read_json_and_store_in_redis('json.json')
-        print("Json прочитан")
-        # Запускаем поток для периодического обновления данных в Redis
-        threading.Thread(target=update_redis_periodically, args=('json.json',), daemon=True).start()
-        # Запускаем фоновую задачу для отправки вычислений через WebSocket
-        start_background_task()
\ No newline at end of file
+        # Загрузка JSON в Redis (только изменения) и отправка вычислений через
+        # WebSocket выполняются фоновыми задачами, запуск приложения их не ждёт
+        start_background_task('json.json')
\ No newline at end of file
@@ -1,50 +1,325 @@
-from .utils import calculate_formulas
+from .instrumentation import (
+    BROADCAST_ERRORS, BROADCAST_LAG, CLIENT_FRAMES, FRAMES, STAGE_SECONDS, TICK_SECONDS, TICKS_SKIPPED, WS_CLIENTS,
+    WS_SUBSCRIPTIONS,
+)
+from .subscriptions import (
+    GLOBAL_KEY, active_subscriptions, add_subscriber, calculate_subscriptions, group_name,
+    remove_subscriber, snapshot_key, subscription_keys,
+)
+from .leader import Lease, run_as_leader
+from .live_metrics import engine as live_engine
+from .sensor_ingest import consume_observations, expire_periodically, run_sensor_ingest
+from .utils import aupdate_redis_periodically, async_redis_client
+from MFOTS.env_config import CONFIG
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from channels.layers import get_channel_layer
-from asgiref.sync import sync_to_async
-import threading
 import asyncio
-import time
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Период рассылки, сек. Тики привязаны к расписанию (next_tick += TICK_INTERVAL),
+# поэтому время расчёта не накапливается: рассылка идёт раз в секунду,
+# а не раз в «секунду плюс время расчёта».
+TICK_INTERVAL = 1.0
+
+# Кадры рассылки — JSON вида
+#   {"type": "snapshot"|"delta", "key": "lane:5", "seq": n, "data": {...}},
+# где key — ключ подписки (см. subscriptions.py). snapshot содержит все поля,
+# delta — только изменившиеся (удалённое поле — null). Полный снимок рассылается
+# раз в SNAPSHOT_EVERY отправленных кадров ключа и при подписке клиента
+# (последний снимок хранится в Redis); SNAPSHOT_EVERY = 1 — рассылать полный
+# снимок каждый раз.
+#
+# Клиент управляет подписками сообщениями
+#   {"action": "subscribe"|"unsubscribe", "intersections": [1], "lanes": [5], "all": true}.
+# Сразу после подключения клиент подписан на общий ключ 'all'.
+SNAPSHOT_EVERY = 30
+
+
+class TickStats:
+    """Статистика тиков рассылки: время расчёта и отставание от расписания."""
+
+    def __init__(self):
+        self.ticks = 0
+        self.skipped = 0          # тиков пропущено из-за долгого расчёта
+        self.last_latency = 0.0   # время расчёта и отправки последнего тика, сек
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.last_lag = 0.0       # насколько последний тик начался позже расписания, сек
+
+    def record(self, latency, lag):
+        self.ticks += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+        self.last_lag = lag
+
+    def snapshot(self):
+        return {
+            'ticks': self.ticks,
+            'skipped': self.skipped,
+            'last_latency': self.last_latency,
+            'max_latency': self.max_latency,
+            'avg_latency': self.total_latency / self.ticks if self.ticks else 0.0,
+            'last_lag': self.last_lag,
+        }
+
+
+tick_stats = TickStats()
+
+
+_MISSING = object()
+
+
+def _encode(frame):
+    return json.dumps(frame, separators=(',', ':'))
+
+
+class DeltaEncoder:
+    """
+    Готовит кадры рассылки одного ключа: каждый кадр сериализуется один раз
+    и уходит всем клиентам готовым текстом. Без изменений кадр не формируется.
+    """
+
+    def __init__(self, key=GLOBAL_KEY, snapshot_every=SNAPSHOT_EVERY):
+        self.key = key
+        self.snapshot_every = snapshot_every
+        self.state = {}
+        self.seq = 0
+        self._since_snapshot = None
+
+    def encode(self, calculation):
+        """Возвращает (кадр для рассылки или None, полный снимок или None)."""
+        delta = {key: value for key, value in calculation.items() if self.state.get(key, _MISSING) != value}
+        delta.update({key: None for key in self.state if key not in calculation})
+        full = self._since_snapshot is None or self._since_snapshot + 1 >= self.snapshot_every
+        if not delta and not full:
+            return None, None
+        self.state = dict(calculation)
+        self.seq += 1
+        snapshot = _encode({'type': 'snapshot', 'key': self.key, 'seq': self.seq, 'data': self.state})
+        if full:
+            self._since_snapshot = 0
+            return snapshot, snapshot
+        self._since_snapshot += 1
+        return _encode({'type': 'delta', 'key': self.key, 'seq': self.seq, 'data': delta}), snapshot
+
+
+def merge_frames(older, newer):
+    """
+    Объединяет кадр, ещё не отправленный медленному клиенту, с новым кадром
+    того же ключа: промежуточный кадр не отправляется, а его изменения не теряются.
+    """
+    newer_frame = json.loads(newer)
+    if newer_frame['type'] == 'snapshot':
+        return newer
+    older_frame = json.loads(older)
+    older_frame['data'].update(newer_frame['data'])
+    older_frame['seq'] = newer_frame['seq']
+    return _encode(older_frame)
+
+
+def _log_send_failure(task):
+    # Ошибка отправки иначе осталась бы незамеченной до сборки задачи
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Ошибка отправки кадров клиенту: %r", task.exception())
+
 
 class TestConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        """Подключает клиента к группе 'calculations'."""
+        """Подключает клиента и подписывает его на общий ключ 'all'."""
+        self._keys = set()
+        self._seq = {}      # ключ -> номер последнего поставленного кадра
+        self._pending = {}  # ключ -> кадр, ожидающий отправки
+        self._sender = None
+        WS_CLIENTS.inc()
         await self.accept()
-        await self.channel_layer.group_add("calculations", self.channel_name)
+        await self._subscribe([GLOBAL_KEY])
 
     async def disconnect(self, close_code):
-        """Отключает клиента от группы."""
-        await self.channel_layer.group_discard("calculations", self.channel_name)
+        """Отключает клиента от всех групп."""
+        WS_CLIENTS.dec()
+        if self._sender is not None:
+            self._sender.cancel()
+        await self._unsubscribe(list(self._keys))
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """Обрабатывает сообщения подписки."""
+        try:
+            message = json.loads(text_data)
+            action = message.get('action')
+            if action not in ('subscribe', 'unsubscribe'):
+                raise ValueError("Неизвестное действие, ожидается subscribe или unsubscribe")
+            keys = subscription_keys(message)
+        except (TypeError, ValueError, AttributeError) as e:
+            await self.send(text_data=_encode({'type': 'error', 'message': str(e)}))
+            return
+        if action == 'subscribe':
+            await self._subscribe(keys)
+        else:
+            await self._unsubscribe(keys)
+
+    async def _subscribe(self, keys):
+        keys = [key for key in dict.fromkeys(keys) if key not in self._keys]
+        if not keys:
+            return
+        self._keys.update(keys)
+        WS_SUBSCRIPTIONS.inc(len(keys))
+        for key in keys:
+            await self.channel_layer.group_add(group_name(key), self.channel_name)
+        await add_subscriber(keys)
+        # Новому подписчику — последний снимок, дальше он получает дельты
+        snapshots = await async_redis_client.mget([snapshot_key(key) for key in keys])
+        for snapshot in snapshots:
+            if snapshot is not None:
+                frame = json.loads(snapshot)
+                self._queue_frame(snapshot.decode(), frame['key'], frame['seq'], 'snapshot')
+
+    async def _unsubscribe(self, keys):
+        keys = [key for key in dict.fromkeys(keys) if key in self._keys]
+        if not keys:
+            return
+        self._keys.difference_update(keys)
+        WS_SUBSCRIPTIONS.dec(len(keys))
+        for key in keys:
+            self._seq.pop(key, None)
+            self._pending.pop(key, None)
+            await self.channel_layer.group_discard(group_name(key), self.channel_name)
+        await remove_subscriber(keys)
 
     async def send_calculation(self, event):
-        """Отправляет вычисления клиенту."""
-        calculation = event['calculation']
-        await self.send(text_data=json.dumps(calculation))
+        """Ставит готовый кадр в очередь отправки клиенту."""
+        if event['key'] in self._keys:
+            self._queue_frame(event['text'], event['key'], event['seq'], event['frame'])
+
+    def _queue_frame(self, text, key, seq, kind):
+        # Дельта не новее уже поставленного кадра (например, снимка при подписке)
+        # пропускается. Снимок принимается всегда: после перезапуска рассылки
+        # номера начинаются заново и могут совпасть с уже поставленным.
+        if kind != 'snapshot' and seq <= self._seq.get(key, 0):
+            return
+        self._seq[key] = seq
+        # Пока клиент не принял прошлый кадр ключа, новые объединяются в один
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = text
+        else:
+            CLIENT_FRAMES.inc(result='merged')
+            self._pending[key] = merge_frames(pending, text)
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.create_task(self._send_pending())
+            self._sender.add_done_callback(_log_send_failure)
 
-def start_background_task():
-    print("Запуск фоновой задачи при старте Django.")
+    async def _send_pending(self):
+        while self._pending:
+            key = next(iter(self._pending))
+            text = self._pending.pop(key)
+            with STAGE_SECONDS.time(stage='client_send'):
+                await self.send(text_data=text)
+            CLIENT_FRAMES.inc(result='sent')
+
+
+def _sensor_ingest_enabled():
+    return CONFIG.SENSOR_UDP_PORT is not None or CONFIG.SENSOR_TCP_PORT is not None
+
+
+def leader_tasks(file_path='json.json'):
+    """Задачи ведущего процесса: загрузка объектов в Redis и рассылка."""
     channel_layer = get_channel_layer()
+    # Загрузка в Redis и рассылка работают в одном цикле событий, без потоков
+    # Каждое чтение файла (или пачка кадров датчиков) также пополняет потоковый расчёт метрик очереди
+    if _sensor_ingest_enabled():
+        # Кадры принимают все процессы (start_background_task); ведущий
+        # читает их строки из потока Redis, начиная с окна live_metrics
+        ingest = [consume_observations(live_engine.observe_items, since=live_engine.window),
+                  expire_periodically()]
+    else:
+        # Полосы объектов файла — те же id dynamic_data.Lane, что у подписок и кадров датчиков
+        ingest = [aupdate_redis_periodically(file_path, observer=live_engine.observe_items,
+                                             resolve_lanes=True, sensor_id=CONFIG.FILE_SENSOR_ID)]
+    return ingest + [background_calculations(channel_layer)]
+
+
+def start_background_task(file_path='json.json'):
+    logger.info("Запуск фоновой задачи при старте Django.")
     loop = asyncio.get_event_loop()
-    loop.create_task(background_calculations(channel_layer))
+    if _sensor_ingest_enabled():
+        # Приём кадров не зависит от аренды: датчики шлют на адрес любого процесса
+        loop.create_task(run_sensor_ingest(CONFIG.SENSOR_INGEST_HOST, CONFIG.SENSOR_UDP_PORT,
+                                           CONFIG.SENSOR_TCP_PORT))
+    # Задачи выполняет только ведущий процесс (аренда в Redis), остальные лишь
+    # обслуживают сокеты и подхватывают работу, если ведущий пропадёт
+    lease = Lease(ttl=CONFIG.LEADER_LEASE_TTL)
+    loop.create_task(run_as_leader(lambda: leader_tasks(file_path), lease))
 
-async def background_calculations(channel_layer):
-    print("Глобальная фоновая задача для всех клиентов.")
-    while True:
-        try:
-            # Вычисляем среднюю скорость
-            calculation = await sync_to_async(calculate_formulas)()
-            # Отправляем через Channel Layer
-            print(f"Отправка данных: {calculation}")
+
+async def broadcast(channel_layer, encoders):
+    """
+    Один тик рассылки: считает только ключи, у которых есть подписчики,
+    и отправляет каждой группе её кадр.
+    """
+    keys = await active_subscriptions()
+    # Кодировщики ключей без подписчиков забываем: новый подписчик начнёт со снимка
+    for key in set(encoders) - keys:
+        del encoders[key]
+    if not keys:
+        return
+
+    with STAGE_SECONDS.time(stage='calculate'):
+        calculations = await calculate_subscriptions(keys)
+    frames = []
+    snapshots = {}
+    for key, calculation in calculations.items():
+        encoder = encoders.setdefault(key, DeltaEncoder(key))
+        text, snapshot = encoder.encode(calculation)
+        if snapshot is not None:
+            snapshots[snapshot_key(key)] = snapshot
+        if text is not None:
+            frames.append((key, text, encoder.seq, 'snapshot' if text is snapshot else 'delta'))
+
+    if snapshots:
+        with STAGE_SECONDS.time(stage='redis_write'):
+            await async_redis_client.mset(snapshots)
+    for key, text, seq, kind in frames:
+        # Отправляем через Channel Layer уже сериализованный кадр
+        with STAGE_SECONDS.time(stage='group_send'):
             await channel_layer.group_send(
-                "calculations",
+                group_name(key),
                 {
                     "type": "send_calculation",  # Должно совпадать с методом в консьюмере
-                    "calculation": calculation
+                    "key": key,
+                    "text": text,
+                    "seq": seq,
+                    "frame": kind
                 }
             )
-            print(f"Отправлено вычисление: {calculation}")
-            await asyncio.sleep(1)  # Отправка каждую секунду
+        FRAMES.inc(kind=kind)
+
+
+async def background_calculations(channel_layer, interval=TICK_INTERVAL):
+    logger.info("Глобальная фоновая задача для всех клиентов.")
+    loop = asyncio.get_running_loop()
+    encoders = {}
+    next_tick = loop.time()
+    while True:
+        started = loop.time()
+        try:
+            await broadcast(channel_layer, encoders)
         except Exception as e:
-            print(f"Ошибка фоновой задачи: {str(e)}")
\ No newline at end of file
+            BROADCAST_ERRORS.inc()
+            logger.error("Ошибка фоновой задачи: %s", e)
+        now = loop.time()
+        tick_stats.record(now - started, started - next_tick)
+        TICK_SECONDS.observe(now - started)
+        BROADCAST_LAG.set(started - next_tick)
+
+        next_tick += interval
+        if now >= next_tick:
+            # Расчёт занял больше периода: пропускаем опоздавшие тики, а не отправляем их подряд
+            missed = int((now - next_tick) // interval) + 1
+            tick_stats.skipped += missed
+            TICKS_SKIPPED.inc(missed)
+            next_tick += missed * interval
+        await asyncio.sleep(next_tick - now)
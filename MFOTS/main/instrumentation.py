@@ -0,0 +1,187 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Счётчики и гистограммы горячих путей сервера в текстовом формате Prometheus
+# (отдаются представлением main.views.metrics по /metrics).
+#
+# Значения хранятся в памяти процесса: /metrics показывает тот процесс Daphne,
+# который его обслужил. Рассылку и загрузку в Redis выполняет только ведущий
+# процесс (main/leader.py, mfots_leader 1), у остальных их замеров нет.
+# Запись значения — несколько операций со словарём под блокировкой (разбор
+# файла идёт в отдельном потоке), поэтому замеры можно ставить в горячий цикл.
+
+# Границы корзин гистограмм времени, сек
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Счётчики по корзинам (последняя — +Inf), сумма
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет время блока (в том числе ожидание await внутри него)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))]), cumulative)
+            yield self.name + '_sum', _format_labels(self.labelnames, key), total
+            yield self.name + '_count', _format_labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    """Набор метрик и сборщиков, значения которых вычисляются при запросе."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+
+    def add_collector(self, collector):
+        """collector() возвращает [(имя, тип, описание, [(метки, значение), ...]), ...]."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def render(self):
+        """Текст в формате Prometheus (text/plain; version=0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in metric.samples())
+        for collector in collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    labels = _format_labels(list(labels), list(labels.values()))
+                    lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Этапы: json_load — чтение и разбор файла объектов, diff — сравнение с прошлым
+# чтением, live_metrics — группировка строк и пересчёт метрик очереди,
+# redis_write / redis_read — обмен с Redis, calculate — вычисления рассылки,
+# group_send — отправка кадра группе channel layer, client_send — отправка кадра клиенту.
+STAGE_SECONDS = Histogram('mfots_stage_seconds', 'Время этапов обработки, сек', ['stage'])
+TICK_SECONDS = Histogram('mfots_broadcast_tick_seconds', 'Время расчёта и отправки тика рассылки, сек')
+BROADCAST_LAG = Gauge('mfots_broadcast_lag_seconds', 'Насколько последний тик начался позже расписания, сек')
+TICKS_SKIPPED = Counter('mfots_broadcast_ticks_skipped_total', 'Тики, пропущенные из-за долгого расчёта')
+BROADCAST_ERRORS = Counter('mfots_broadcast_errors_total', 'Ошибки тиков рассылки')
+FRAMES = Counter('mfots_broadcast_frames_total', 'Кадры, отправленные группам', ['kind'])
+WS_CLIENTS = Gauge('mfots_ws_clients', 'Подключённые клиенты WebSocket')
+WS_SUBSCRIPTIONS = Gauge('mfots_ws_subscriptions', 'Подписки клиентов этого процесса')
+CLIENT_FRAMES = Counter('mfots_ws_client_frames_total', 'Кадры клиентам: sent — отправлены, '
+                        'merged — объединены с неотправленным', ['result'])
+ITEMS = Counter('mfots_ingest_items_total', 'Объекты загрузки: changed — записаны, vanished — пропали',
+                ['result'])
+LEADER = Gauge('mfots_leader', 'Процесс ведущий: выполняет загрузку и рассылку (1) '
+               'или только обслуживает сокеты (0)')
+LEADER_CHANGES = Counter('mfots_leader_acquired_total', 'Сколько раз процесс становился ведущим')
+INGEST_ERRORS = Counter('mfots_ingest_errors_total', 'Ошибки загрузки объектов в Redis', ['source'])
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+import redis
+
+from .instrumentation import LEADER, LEADER_CHANGES
+from .utils import async_redis_client
+
+# Выбор ведущего процесса через аренду в Redis.
+#
+# Приложение main загружается в каждом процессе (реплики Daphne, воркеры
+# Gunicorn, команды manage.py), но загрузка объектов, потоковый расчёт метрик и
+# рассылка должны выполняться один раз. Их выполняет только процесс, держащий
+# аренду LEADER_KEY (SET NX PX с уникальным токеном). Ведущий продлевает аренду
+# каждые ttl / 3 секунд; остальные процессы только обслуживают сокеты (кадры
+# приходят им через общий channel layer) и с тем же периодом пытаются взять
+# аренду. Если ведущий завис или упал, аренда истекает и её берёт другой
+# процесс не позже чем через ttl + ttl / 3 секунд.
+#
+# Ведущий, который не смог продлить аренду за ttl секунд, останавливает свои
+# задачи сам. Задачи нового ведущего начинают с полных снимков, а клиенты
+# принимают снимок с меньшим номером кадра (см. TestConsumer._queue_frame).
+
+LEADER_KEY = 'calculations:leader'
+LEASE_TTL = 10.0  # сек
+
+# KEYS[1] — ключ аренды; ARGV: токен, срок в мс
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS[1] — ключ аренды; ARGV[1] — токен
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class Lease:
+    """Аренда в Redis: её держит не больше одного процесса одновременно."""
+
+    def __init__(self, key=LEADER_KEY, ttl=LEASE_TTL, client=None):
+        self.key = key
+        self.ttl = ttl
+        self.client = async_redis_client if client is None else client
+        self.token = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}'
+        self._renew = self.client.register_script(_RENEW_LUA)
+        self._release = self.client.register_script(_RELEASE_LUA)
+
+    async def acquire(self):
+        return bool(await self.client.set(self.key, self.token, nx=True, px=int(self.ttl * 1000)))
+
+    async def renew(self):
+        """Продлевает аренду, если она ещё принадлежит этому процессу."""
+        return bool(await self._renew(keys=[self.key], args=[self.token, int(self.ttl * 1000)]))
+
+    async def release(self):
+        return bool(await self._release(keys=[self.key], args=[self.token]))
+
+    async def holder(self):
+        token = await self.client.get(self.key)
+        return token.decode() if token is not None else None
+
+
+async def _hold(lease, tasks, interval):
+    """Продлевает аренду, пока она наша и задачи работают."""
+    loop = asyncio.get_running_loop()
+    renewed = loop.time()
+    while True:
+        done, _ = await asyncio.wait(tasks, timeout=interval, return_when=asyncio.FIRST_COMPLETED)
+        if done:
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error("Задача ведущего завершилась с ошибкой: %s", task.exception())
+            return
+        try:
+            if not await lease.renew():
+                logger.warning("Аренда %s перешла другому процессу", lease.key)
+                return
+            renewed = loop.time()
+        except redis.RedisError as e:
+            # Пока аренда не истекла, она наша: пробуем продлить ещё раз
+            logger.warning("Не удалось продлить аренду %s: %s", lease.key, e)
+            if loop.time() - renewed >= lease.ttl:
+                return
+
+
+async def run_as_leader(start, lease=None, interval=None):
+    """
+    Ждёт аренды и, получив её, запускает задачи start() (список корутин).
+    При потере аренды задачи отменяются, и процесс снова ждёт своей очереди.
+    """
+    lease = Lease() if lease is None else lease
+    interval = lease.ttl / 3 if interval is None else interval
+    LEADER.set(0)
+    while True:
+        try:
+            acquired = await lease.acquire()
+        except redis.RedisError as e:
+            logger.warning("Не удалось запросить аренду %s: %s", lease.key, e)
+            acquired = False
+        if not acquired:
+            await asyncio.sleep(interval)
+            continue
+
+        logger.info("Процесс %s стал ведущим", lease.token)
+        LEADER.set(1)
+        LEADER_CHANGES.inc()
+        tasks = [asyncio.create_task(coro) for coro in start()]
+        try:
+            await _hold(lease, tasks, interval)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            LEADER.set(0)
+            logger.info("Процесс %s больше не ведущий", lease.token)
+            try:
+                await lease.release()
+            except redis.RedisError:
+                pass
+        await asyncio.sleep(interval)
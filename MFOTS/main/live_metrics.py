@@ -0,0 +1,168 @@
+import time
+from collections import deque
+
+from timestamps import epoch_second, format_second
+
+# Потоковый расчёт метрик очереди по полосам.
+#
+# Те же метрики, что считает пакетный main.py (cars_in_lane, queue_length_m,
+# queue_length_sec, queue_delay, total_flow_intensity, total_capacity), но по
+# мере поступления наблюдений и без повторного прохода по истории: на каждое
+# наблюдение — O(1) (амортизированно) работы с состоянием полосы.
+#
+# Кроме посекундных метрик (число различных машин за последнюю закрытую
+# секунду, как в main.py) для каждой полосы считается интенсивность
+# λ = N / T по скользящему окну (N — различные машины за последние T = window
+# секунд; пока с начала наблюдений прошло меньше window секунд, λ занижена)
+# и оценки очереди за красную фазу по GPT.md:
+#   red_queue_cars       N_queue = λ·T_r
+#   red_queue_length_m   L_q,m   = λ·T_r·L
+#   red_queue_length_sec L_q,s   = λ·T_r / s
+#   red_queue_delay      d       = T_r/2 · 1/(1 − λ/s), None при λ ≥ s
+#
+# Время задаётся самими наблюдениями: секунда закрывается, когда пришло
+# наблюдение более поздней секунды (на любой полосе). Как и в main.py, секунды
+# без наблюдений пропускаются: последняя закрытая секунда — последняя секунда
+# с наблюдениями перед текущей (при чтении json.json раз в 5 секунд — время
+# прошлого чтения). Наблюдения уже закрытых секунд отбрасываются и учитываются в late.
+
+SATURATION_FLOW = 0.25  # машин/сек, как в main.py
+GREEN_TIME = 45
+RED_TIME = 30
+CAR_LENGTH = 4.5
+WINDOW = 60  # окно интенсивности, сек
+
+
+class LaneState:
+    """Состояние одной полосы."""
+    __slots__ = ('second', 'second_uuids', 'last_second', 'last_count', 'last_seen', 'arrivals')
+
+    def __init__(self, second):
+        self.second = second        # текущая (незакрытая) секунда полосы
+        self.second_uuids = set()   # различные машины текущей секунды
+        self.last_second = None     # прошлая секунда полосы с наблюдениями
+        self.last_count = 0         # различные машины в ней
+        self.last_seen = {}         # uuid -> последняя секунда в окне
+        self.arrivals = deque()     # (секунда, uuid) в порядке поступления, для вытеснения из окна
+
+
+class LiveMetrics:
+    def __init__(self, window=WINDOW, red_time=RED_TIME, green_time=GREEN_TIME,
+                 car_length=CAR_LENGTH, cycle_time=None):
+        self.window = window
+        self.red_time = red_time
+        self.green_time = green_time
+        self.car_length = car_length
+        self.cycle_time = cycle_time if cycle_time is not None else green_time + red_time
+        self.lanes = {}
+        self.now = None     # последняя секунда, по которой пришли наблюдения
+        self.closed = None  # последняя закрытая секунда: прошлая секунда с наблюдениями
+        self.late = 0
+
+    def observe(self, lane, uuid, second):
+        """Учитывает машину uuid на полосе lane в секунду second (секунда эпохи)."""
+        lane = str(lane)
+        if self.now is None or second > self.now:
+            self.closed = self.now
+            self.now = second
+        state = self.lanes.get(lane)
+        if state is None:
+            state = self.lanes[lane] = LaneState(second)
+        if second < state.second:
+            self.late += 1
+            return
+        if second > state.second:
+            self._close(state, second)
+        if uuid in state.second_uuids:
+            return
+        state.second_uuids.add(uuid)
+        state.last_seen[uuid] = second
+        state.arrivals.append((second, uuid))
+
+    def observe_items(self, items, now=None):
+        """Учитывает объекты датчика: полоса — 'lane', машина — 'uuid' или 'id', время — 'time' или now."""
+        now = int(time.time() if now is None else now)
+        for item in items:
+            lane = item.get('lane')
+            if lane is None:
+                continue
+            uuid = item.get('uuid', item.get('id'))
+            self.observe(lane, uuid, _item_second(item, now))
+
+    def _close(self, state, second):
+        # Закрываем текущую секунду полосы и вытесняем из окна старые наблюдения
+        if state.second_uuids:
+            state.last_second = state.second
+            state.last_count = len(state.second_uuids)
+            state.second_uuids = set()
+        state.second = second
+        horizon = second - self.window + 1
+        while state.arrivals and state.arrivals[0][0] < horizon:
+            seen_second, uuid = state.arrivals.popleft()
+            if state.last_seen.get(uuid) == seen_second:
+                del state.last_seen[uuid]
+
+    def advance(self):
+        """Закрывает секунды, более ранние, чем последняя наблюдённая."""
+        if self.now is None:
+            return
+        for state in self.lanes.values():
+            if state.second < self.now:
+                self._close(state, self.now)
+
+    def _cars_in_lane(self, state):
+        # Машины полосы в последней закрытой секунде; полоса без наблюдений в ней — 0
+        if self.closed is None:
+            return 0
+        if state.second == self.closed:
+            return len(state.second_uuids)
+        if state.last_second == self.closed:
+            return state.last_count
+        return 0
+
+    def lane_metrics(self, lane):
+        """Метрики полосы: посекундные (как в main.py) и оценки по окну."""
+        state = self.lanes.get(str(lane))
+        cars_in_lane = self._cars_in_lane(state) if state is not None else 0
+        intensity = len(state.last_seen) / self.window if state is not None else 0.0
+        red_queue_cars = intensity * self.red_time
+        return {
+            "cars_in_lane": cars_in_lane,
+            "queue_cars": cars_in_lane,
+            "queue_length_m": cars_in_lane * self.car_length,
+            "queue_length_sec": cars_in_lane / SATURATION_FLOW,
+            "queue_increase": cars_in_lane * self.car_length,
+            "queue_delay": cars_in_lane / (2 * SATURATION_FLOW),
+            "flow_intensity": intensity,
+            "red_queue_cars": red_queue_cars,
+            "red_queue_length_m": red_queue_cars * self.car_length,
+            "red_queue_length_sec": red_queue_cars / SATURATION_FLOW,
+            "red_queue_delay": (self.red_time / 2 / (1 - intensity / SATURATION_FLOW)
+                                if intensity < SATURATION_FLOW else None),
+        }
+
+    def metrics(self):
+        """Метрики последней закрытой секунды по всем полосам — в формате результата main.py."""
+        self.advance()
+        lane_metrics = {lane: self.lane_metrics(lane) for lane in sorted(self.lanes)}
+        return {
+            "timestamp": format_second(self.closed) if self.closed is not None else None,
+            "lane_metrics": lane_metrics,
+            "total_flow_intensity": sum(metrics["cars_in_lane"] for metrics in lane_metrics.values()),
+            "total_capacity": len(lane_metrics) * SATURATION_FLOW * (self.green_time / self.cycle_time),
+        }
+
+
+def _item_second(item, now):
+    # Время строк выгрузки 'YYYY-mm-dd HH:MM:SS.ffffff' (UTC)
+    value = item.get('time')
+    if not isinstance(value, str):
+        return now
+    try:
+        return epoch_second(value)
+    except ValueError:
+        return now
+
+
+# Общий экземпляр для процесса: его наполняет загрузка, читает рассылка
+engine = LiveMetrics()
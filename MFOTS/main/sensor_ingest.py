@@ -0,0 +1,303 @@
+import asyncio
+import json
+import logging
+import time
+
+from .instrumentation import INGEST_ERRORS, REGISTRY, STAGE_SECONDS
+from .utils import EXPIRY_KEY, ITEM_TTL, aexpire_items, astore_items, async_redis_client
+
+# Приём кадров обнаружений напрямую от датчиков (UDP и TCP) вместо чтения json.json.
+#
+# Кадр — JSON: {"sensor": <id>, "rows_data": [...]} , список строк rows_data или
+# одна строка. По UDP кадр — одна датаграмма, по TCP — одна строка текста
+# (кадры разделяются '\n'). Датчик определяется по полю "sensor" или по адресу
+# отправителя (Sensor.sensor_ip), номер полосы датчика переводится в id
+# dynamic_data.Lane через кэш топологии. Кадры неизвестных датчиков отбрасываются.
+#
+# Принятые кадры попадают в ограниченную очередь; одна задача забирает из неё
+# всё накопившееся (до batch_frames кадров), разбирает пачку одним json.loads и
+# пишет её в Redis одним конвейером. Когда очередь заполнена, TCP-соединения
+# перестают читаться (датчик упирается в окно TCP), а UDP-датаграммы
+# отбрасываются и считаются в dropped.
+#
+# Датчики шлют кадры на постоянный адрес, поэтому сервер приёма работает в
+# каждом процессе (start_background_task), а не только у ведущего: смена
+# ведущего не закрывает сокет и не теряет кадры. Сокеты открываются с
+# SO_REUSEPORT, так что несколько процессов одного узла делят порт.
+# Строки каждой пачки вместе со временем приёма добавляются в поток Redis
+# OBSERVATIONS_STREAM; ведущий читает его (consume_observations) и пополняет
+# свой потоковый расчёт метрик (live_metrics), а также удаляет устаревшие
+# объекты (expire_periodically). Поток хранит последние STREAM_RETENTION
+# секунд: новый ведущий восстанавливает по ним окно live_metrics.
+#
+# Счётчики по адресам отправителей хранятся в памяти (counters) и в Redis:
+# хеш STATS_PREFIX + адрес; на /metrics они попадают через collect().
+
+QUEUE_SIZE = 10_000  # кадров
+BATCH_FRAMES = 500
+EXPIRE_INTERVAL = 1.0  # сек; как часто ведущий удаляет устаревшие объекты
+OBSERVATIONS_STREAM = 'ingest:observations'
+STREAM_RETENTION = 120  # сек; не меньше окна live_metrics
+STREAM_READ_COUNT = 100  # пачек за одно чтение потока
+MAX_FRAME_BYTES = 1 << 20
+STATS_PREFIX = 'ingest:sensor:'
+COUNTERS = ('packets', 'rows', 'bytes', 'errors', 'dropped', 'unknown')
+
+logger = logging.getLogger(__name__)
+
+
+def decode_frames(payloads):
+    """Разбирает пачку кадров одним json.loads; при ошибке — по одному. Неразобранные кадры — None."""
+    try:
+        frames = json.loads(b'[' + b','.join(payloads) + b']')
+        # Кадр вида '1, 2' разобрался бы в несколько значений
+        if len(frames) == len(payloads):
+            return frames
+    except ValueError:
+        pass
+    frames = []
+    for payload in payloads:
+        try:
+            frames.append(json.loads(payload))
+        except ValueError:
+            frames.append(None)
+    return frames
+
+
+def frame_rows(frame):
+    """(id датчика из кадра или None, строки кадра); None — кадр неверного вида."""
+    if isinstance(frame, list):
+        return None, frame
+    if isinstance(frame, dict):
+        if 'rows_data' in frame:
+            rows = frame['rows_data']
+            return frame.get('sensor'), rows if isinstance(rows, list) else None
+        return frame.get('sensor'), [frame]
+    return None, None
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.offer(addr[0], data)
+
+
+class SensorIngestServer:
+    """Сервер приёма кадров датчиков: start(), затем serve_forever() или close()."""
+
+    def __init__(self, host='0.0.0.0', udp_port=None, tcp_port=None, queue_size=QUEUE_SIZE,
+                 batch_frames=BATCH_FRAMES, ttl=ITEM_TTL, observer=None):
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self.batch_frames = batch_frames
+        self.ttl = ttl
+        # observer(items, now) получает строки каждой пачки в этом же процессе,
+        # как у JsonIngestor; остальным процессам они доступны через поток
+        self.observer = observer
+        self.queue = asyncio.Queue(queue_size)
+        self.counters = {}  # адрес -> {'sensor': id, 'packets': ..., ...}
+        self._unsent = {}  # адрес -> приращения счётчиков, ещё не записанные в Redis
+        self._transport = None
+        self._tcp_server = None
+        self._writer = None
+
+    def _count(self, addr, field, value=1):
+        counters = self.counters.get(addr)
+        if counters is None:
+            counters = self.counters[addr] = dict({'sensor': None}, **{name: 0 for name in COUNTERS})
+        counters[field] += value
+        unsent = self._unsent.setdefault(addr, {})
+        unsent[field] = unsent.get(field, 0) + value
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self.udp_port is not None:
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _UdpProtocol(self), local_addr=(self.host, self.udp_port), reuse_port=True)
+            self.udp_port = self._transport.get_extra_info('sockname')[1]
+        if self.tcp_port is not None:
+            self._tcp_server = await asyncio.start_server(self._handle_tcp, self.host, self.tcp_port,
+                                                          limit=MAX_FRAME_BYTES, reuse_port=True)
+            self.tcp_port = self._tcp_server.sockets[0].getsockname()[1]
+        self._writer = asyncio.create_task(self._write_loop())
+        REGISTRY.add_collector(self.collect)
+        logger.info("Приём кадров датчиков: UDP %s, TCP %s", self.udp_port, self.tcp_port)
+
+    async def serve_forever(self):
+        # Отмена ожидающего не прерывает запись: её завершает close()
+        await asyncio.shield(self._writer)
+
+    async def close(self):
+        """Перестаёт принимать кадры и дописывает уже принятые."""
+        if self._transport is not None:
+            self._transport.close()
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+        REGISTRY.remove_collector(self.collect)
+        if self._writer is not None and not self._writer.done():
+            await self.queue.put(None)
+            await self._writer
+
+    def offer(self, addr, data):
+        """Кадр UDP: в очередь, а если она заполнена — отбросить."""
+        try:
+            self.queue.put_nowait((addr, data))
+        except asyncio.QueueFull:
+            self._count(addr, 'dropped')
+
+    async def _handle_tcp(self, reader, writer):
+        addr = writer.get_extra_info('peername')[0]
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as e:
+                    line = e.partial
+                    if line.strip():
+                        await self.queue.put((addr, line))
+                    break
+                if line.strip():
+                    # Ожидание места в очереди и есть противодавление: сокет не читается
+                    await self.queue.put((addr, line))
+        except asyncio.LimitOverrunError:
+            self._count(addr, 'errors')
+            logger.warning("Кадр от %s больше %s байт, соединение закрыто", addr, MAX_FRAME_BYTES)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _write_loop(self):
+        while True:
+            frames = [await self.queue.get()]
+            while len(frames) < self.batch_frames and not self.queue.empty():
+                frames.append(self.queue.get_nowait())
+            # None в очереди — сигнал остановки от close()
+            stop = None in frames
+            frames = [frame for frame in frames if frame is not None]
+            try:
+                if frames:
+                    await self.write_batch(frames)
+            except Exception as e:
+                INGEST_ERRORS.inc(source='sensor')
+                logger.error("Ошибка записи кадров датчиков: %s", e)
+            if stop:
+                return
+
+    async def write_batch(self, frames):
+        """Разбирает пачку кадров (адрес, байты) и записывает её строки. Возвращает число строк."""
+        from dynamic_data.topology import aget_topology
+
+        topology = await aget_topology()
+        with STAGE_SECONDS.time(stage='json_load'):
+            decoded = decode_frames([payload for _, payload in frames])
+        rows = []
+        for (addr, payload), frame in zip(frames, decoded):
+            self._count(addr, 'packets')
+            self._count(addr, 'bytes', len(payload))
+            sensor_id, frame_rows_data = frame_rows(frame)
+            if frame_rows_data is None:
+                self._count(addr, 'errors')
+                continue
+            if sensor_id is None:
+                sensor_id = topology.sensor_for_ip(addr)
+            if sensor_id is None:
+                self._count(addr, 'unknown')
+                continue
+            self.counters[addr]['sensor'] = sensor_id
+            valid = 0
+            for row in frame_rows_data:
+                if not isinstance(row, dict) or 'uuid' not in row:
+                    self._count(addr, 'errors')
+                    continue
+                lane = topology.lane_for(sensor_id, row.get('lane'))
+                rows.append(dict(row, id=f"{sensor_id}:{row['uuid']}", sensor=sensor_id,
+                                 lane=lane.id if lane is not None else None))
+                valid += 1
+            self._count(addr, 'rows', valid)
+
+        now = time.time()
+        if rows and self.observer is not None:
+            with STAGE_SECONDS.time(stage='live_metrics'):
+                self.observer(rows, now)
+        # Строки одной машины в пачке — последняя побеждает
+        items = {item['id']: item for item in rows}
+        with STAGE_SECONDS.time(stage='redis_write'):
+            pipe = async_redis_client.pipeline(transaction=False)
+            if items:
+                await astore_items(list(items.values()), pipe)
+                # Объект живёт ttl секунд после последнего кадра с ним
+                pipe.zadd(EXPIRY_KEY, {item_id: now + self.ttl for item_id in items})
+                # Старые записи потока отсекаются по id (время Redis в мс)
+                pipe.xadd(OBSERVATIONS_STREAM, {'time': now, 'rows': json.dumps(rows)},
+                          minid=int((now - STREAM_RETENTION) * 1000), approximate=True)
+            unsent, self._unsent = self._unsent, {}
+            for addr, deltas in unsent.items():
+                for field, value in deltas.items():
+                    pipe.hincrby(STATS_PREFIX + addr, field, value)
+            await pipe.execute()
+        return len(rows)
+
+    def stats(self):
+        return {addr: dict(counters) for addr, counters in self.counters.items()}
+
+    def collect(self):
+        """Счётчики по адресам и заполненность очереди для /metrics."""
+        # Вызывается из потока представления: словарь копируется одной операцией
+        counters = [(addr, dict(values)) for addr, values in list(self.counters.items())]
+        families = [
+            (f'mfots_sensor_{field}_total', 'counter', f'Приём кадров датчиков: {field}',
+             [({'addr': addr, 'sensor': '' if values['sensor'] is None else values['sensor']}, values[field])
+              for addr, values in counters])
+            for field in COUNTERS
+        ]
+        families.append(('mfots_sensor_queue_frames', 'gauge', 'Кадры в очереди приёма',
+                         [({}, self.queue.qsize())]))
+        return families
+
+
+async def run_sensor_ingest(host='0.0.0.0', udp_port=None, tcp_port=None, **kwargs):
+    """Запускает сервер приёма и работает, пока задачу не отменят."""
+    server = SensorIngestServer(host, udp_port, tcp_port, **kwargs)
+    await server.start()
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+async def consume_observations(observer, since=0, block=1.0):
+    """
+    Передаёт observer(items, now) строки из потока OBSERVATIONS_STREAM,
+    начиная с пачек, принятых за since секунд до запуска. Работает, пока
+    задачу не отменят.
+    """
+    last_id = f'{int((time.time() - since) * 1000)}-0' if since else '$'
+    while True:
+        try:
+            response = await async_redis_client.xread({OBSERVATIONS_STREAM: last_id},
+                                                      count=STREAM_READ_COUNT, block=int(block * 1000))
+        except Exception as e:
+            INGEST_ERRORS.inc(source='sensor')
+            logger.error("Ошибка чтения потока обнаружений: %s", e)
+            await asyncio.sleep(block)
+            continue
+        for _, entries in response:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                with STAGE_SECONDS.time(stage='live_metrics'):
+                    observer(json.loads(fields[b'rows']), float(fields[b'time']))
+
+
+async def expire_periodically(interval=EXPIRE_INTERVAL):
+    """Удаляет объекты, по которым давно не было кадров; выполняет ведущий процесс."""
+    while True:
+        try:
+            await aexpire_items()
+        except Exception as e:
+            INGEST_ERRORS.inc(source='sensor')
+            logger.error("Ошибка удаления устаревших объектов: %s", e)
+        await asyncio.sleep(interval)
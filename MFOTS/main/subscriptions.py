@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+import redis
+
+from .instrumentation import STAGE_SECONDS
+from .live_metrics import engine as live_engine
+from .utils import _average, acalculate_formulas, acalculate_lane_stats, async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Подписки клиентов WebSocket.
+#
+# Ключ подписки — 'all' (общая средняя скорость и метрики очереди), 'intersection:<id>'
+# (перекрёсток dynamic_data.Intersection: средняя скорость и скорости его полос)
+# или 'lane:<id>' (полоса dynamic_data.Lane). На каждый ключ — своя группа
+# channel layer, и рассылка считает только ключи, у которых есть подписчики.
+#
+# Число подписчиков по ключам каждый процесс держит в памяти и в своём хэше
+# Redis SUBSCRIPTIONS_PREFIX + PROCESS_ID со сроком SUBSCRIPTIONS_TTL. Пока у
+# процесса есть подписчики, он раз в SUBSCRIPTIONS_TTL / 3 секунд переписывает
+# хэш из памяти и продлевает срок; процессы с подписчиками перечислены в
+# SUBSCRIBERS_KEY (процесс -> время последнего продления). Рассылка суммирует
+# хэши живых процессов, так что подписки упавшего или убитого процесса
+# перестают считаться через SUBSCRIPTIONS_TTL секунд.
+
+GLOBAL_KEY = 'all'
+SUBSCRIBERS_KEY = 'calculations:subscribers'
+SUBSCRIPTIONS_PREFIX = 'calculations:subscriptions:'
+SUBSCRIPTIONS_TTL = 30.0  # сек
+PROCESS_ID = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}'
+
+_counts = {}       # ключ -> подписчики этого процесса
+_heartbeat = None  # задача продления хэша процесса
+
+
+def subscription_keys(message):
+    """
+    Ключи подписки из сообщения клиента:
+    {"intersections": [1, 2], "lanes": [5], "all": true}.
+    Бросает ValueError, если номера указаны неверно.
+    """
+    keys = [GLOBAL_KEY] if message.get('all') else []
+    for kind, field in (('intersection', 'intersections'), ('lane', 'lanes')):
+        ids = message.get(field) or []
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ValueError(f"Поле {field} должно быть списком целых чисел")
+        keys += [f'{kind}:{i}' for i in ids]
+    return keys
+
+
+def group_name(key):
+    # Имя группы channel layer: буквы, цифры, '-', '_' и '.'
+    if key == GLOBAL_KEY:
+        return 'calculations'
+    return 'calculations.' + key.replace(':', '.')
+
+
+def snapshot_key(key):
+    return f'calculations:snapshot:{key}'
+
+
+def _process_key():
+    return SUBSCRIPTIONS_PREFIX + PROCESS_ID
+
+
+def _touch(pipe):
+    pipe.pexpire(_process_key(), int(SUBSCRIPTIONS_TTL * 1000))
+    pipe.zadd(SUBSCRIBERS_KEY, {PROCESS_ID: time.time()})
+
+
+def _start_heartbeat():
+    global _heartbeat
+    if _heartbeat is None or _heartbeat.done():
+        _heartbeat = asyncio.get_running_loop().create_task(_heartbeat_loop())
+
+
+async def add_subscriber(keys):
+    if not keys:
+        return
+    for key in keys:
+        _counts[key] = _counts.get(key, 0) + 1
+    _start_heartbeat()
+    pipe = async_redis_client.pipeline(transaction=True)
+    pipe.hset(_process_key(), mapping={key: _counts[key] for key in keys})
+    _touch(pipe)
+    await pipe.execute()
+
+
+async def remove_subscriber(keys):
+    if not keys:
+        return
+    empty = []
+    for key in keys:
+        count = _counts.get(key, 0) - 1
+        if count > 0:
+            _counts[key] = count
+        else:
+            _counts.pop(key, None)
+            empty.append(key)
+    remaining = {key: _counts[key] for key in keys if key in _counts}
+    pipe = async_redis_client.pipeline(transaction=True)
+    if not _counts:
+        pipe.delete(_process_key())
+        pipe.zrem(SUBSCRIBERS_KEY, PROCESS_ID)
+    else:
+        # Ключ без подписчиков удаляем, чтобы рассылка его больше не считала
+        if empty:
+            pipe.hdel(_process_key(), *empty)
+        if remaining:
+            pipe.hset(_process_key(), mapping=remaining)
+        _touch(pipe)
+    await pipe.execute()
+
+
+async def write_subscriptions():
+    """Переписывает хэш процесса из памяти и продлевает его срок."""
+    pipe = async_redis_client.pipeline(transaction=True)
+    pipe.delete(_process_key())
+    if _counts:
+        pipe.hset(_process_key(), mapping=dict(_counts))
+        _touch(pipe)
+    else:
+        pipe.zrem(SUBSCRIBERS_KEY, PROCESS_ID)
+    await pipe.execute()
+
+
+async def _heartbeat_loop():
+    # Работает, пока у процесса есть подписчики; add_subscriber запускает её снова
+    while _counts:
+        await asyncio.sleep(SUBSCRIPTIONS_TTL / 3)
+        try:
+            await write_subscriptions()
+        except redis.RedisError as e:
+            logger.warning("Не удалось продлить подписки процесса %s: %s", PROCESS_ID, e)
+
+
+async def active_subscriptions():
+    """Ключи, у которых есть подписчики в живых процессах."""
+    with STAGE_SECONDS.time(stage='redis_read'):
+        pipe = async_redis_client.pipeline(transaction=False)
+        # Процессы, не продлевавшие подписки SUBSCRIPTIONS_TTL секунд, забываем
+        pipe.zremrangebyscore(SUBSCRIBERS_KEY, '-inf', time.time() - SUBSCRIPTIONS_TTL)
+        pipe.zrange(SUBSCRIBERS_KEY, 0, -1)
+        _, processes = await pipe.execute()
+        pipe = async_redis_client.pipeline(transaction=False)
+        for process in processes:
+            pipe.hgetall(SUBSCRIPTIONS_PREFIX + process.decode())
+        hashes = await pipe.execute() if processes else []
+    totals = {}
+    for counts in hashes:
+        for key, count in counts.items():
+            key = key.decode()
+            totals[key] = totals.get(key, 0) + int(count)
+    return {key for key, total in totals.items() if total > 0}
+
+
+async def intersection_lanes():
+    """Полосы каждого перекрёстка: id перекрёстка -> список id полос."""
+    from dynamic_data.topology import aget_topology
+
+    return (await aget_topology()).intersection_lanes
+
+
+async def calculate_subscriptions(keys):
+    """Вычисления для каждого ключа подписки: ключ -> словарь для рассылки."""
+    intersections = [int(key.split(':', 1)[1]) for key in keys if key.startswith('intersection:')]
+    lanes = {int(key.split(':', 1)[1]) for key in keys if key.startswith('lane:')}
+    topology = await intersection_lanes() if intersections else {}
+    for intersection in intersections:
+        lanes.update(topology.get(intersection, []))
+    with STAGE_SECONDS.time(stage='redis_read'):
+        stats = await acalculate_lane_stats(sorted(lanes))
+        formulas = await acalculate_formulas() if GLOBAL_KEY in keys else None
+
+    # Метрики очереди — из потокового расчёта (live_metrics), без обхода истории
+    live = live_engine.metrics()
+
+    calculations = {}
+    if GLOBAL_KEY in keys:
+        calculations[GLOBAL_KEY] = dict(formulas, **live)
+    for key in keys:
+        kind, _, ident = key.partition(':')
+        if kind == 'lane':
+            calculations[key] = dict({'average_speed': _average(*stats[ident])}, **live_engine.lane_metrics(ident))
+        elif kind == 'intersection':
+            members = [str(lane) for lane in topology.get(int(ident), [])]
+            total = sum(stats[lane][0] for lane in members)
+            count = sum(stats[lane][1] for lane in members)
+            lane_metrics = {lane: live_engine.lane_metrics(lane) for lane in members}
+            calculations[key] = {
+                'average_speed': _average(total, count),
+                'lane_speeds': {lane: _average(*stats[lane]) for lane in members},
+                'timestamp': live['timestamp'],
+                'lane_metrics': lane_metrics,
+                'total_flow_intensity': sum(metrics['cars_in_lane'] for metrics in lane_metrics.values()),
+            }
+    return calculations
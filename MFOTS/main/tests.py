@@ -1,3 +1,301 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import json
+import socket
+import sys
+import time
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from MFOTS.env_config import CONFIG
+
+from dynamic_data.topology import LaneInfo, Topology
+
+from . import consumers, sensor_ingest, subscriptions, utils
+from .live_metrics import LiveMetrics, SATURATION_FLOW
+
+# Отдельная база Redis для тестов, как у бенчмарков
+TEST_REDIS_DB = 15
+
+
+def _redis_available():
+    try:
+        return redis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=TEST_REDIS_DB,
+                           socket_connect_timeout=1).ping()
+    except redis.RedisError:
+        return False
+
+
+def _load_batch_main():
+    # Пакетный main.py из корня репозитория: имя main занято приложением Django,
+    # а его модули (export_stream) лежат вне проекта
+    root = Path(settings.BASE_DIR).parent
+    spec = importlib.util.spec_from_file_location('batch_main', root / 'main.py')
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.object(sys, 'path', sys.path + [str(root)]):
+        spec.loader.exec_module(module)
+    return module
+
+
+def _row(second, lane, uuid):
+    return {'time': f'2025-01-01 00:00:{second:02d}.{uuid * 7 % 1000:06d}', 'lane': lane, 'uuid': str(uuid)}
+
+
+class LiveMetricsTests(SimpleTestCase):
+    def test_matches_batch_metrics_per_second(self):
+        batch_main = _load_batch_main()
+        # Секунды с пропусками, машины на нескольких полосах и повторы машины в секунде
+        rows = [_row(1, 0, 1), _row(1, 0, 1), _row(1, 1, 2), _row(2, 0, 1), _row(2, 0, 3),
+                _row(5, 1, 2), _row(5, 1, 4), _row(5, 2, 5), _row(6, 0, 6), _row(9, 2, 5)]
+        intervals, lanes = batch_main.group_rows(rows)
+        expected = batch_main.calculate_metrics_per_second(intervals, lanes, 30, 4.5, 45, 75)
+
+        engine = LiveMetrics()
+        closed = []
+        for row in rows:
+            before = engine.now
+            engine.observe_items([row])
+            if before is not None and engine.now != before:
+                closed.append(engine.metrics())
+        self.assertEqual(len(closed), len(expected) - 1)
+        for live, batch in zip(closed, expected):
+            self.assertEqual(live['timestamp'], batch['timestamp'])
+            self.assertEqual(live['total_flow_intensity'], batch['total_flow_intensity'])
+            for lane, metrics in batch['lane_metrics'].items():
+                live_lane = live['lane_metrics'].get(str(lane))
+                if live_lane is None:
+                    # Полоса ещё не встречалась
+                    self.assertEqual(metrics['cars_in_lane'], 0)
+                    continue
+                for field in ('cars_in_lane', 'queue_length_m', 'queue_length_sec', 'queue_delay'):
+                    self.assertEqual(live_lane[field], metrics[field], (batch['timestamp'], lane, field))
+
+    def test_file_polls_keep_counts_between_polls(self):
+        # Объекты json.json без времени: все попадают в секунду чтения, чтения раз в 5 секунд
+        engine = LiveMetrics()
+        items = [{'id': 1, 'lane': 7}, {'id': 2, 'lane': 7}, {'id': 3, 'lane': 8}]
+        counts = []
+        for now in (1000, 1005, 1010):
+            engine.observe_items(items, now)
+            metrics = engine.metrics()
+            counts.append([metrics['lane_metrics'][lane]['cars_in_lane'] for lane in ('7', '8')])
+        self.assertEqual(counts, [[0, 0], [2, 1], [2, 1]])
+
+    def test_intensity_uses_window_from_start(self):
+        engine = LiveMetrics(window=60)
+        engine.observe_items([{'id': i, 'lane': 1} for i in range(3)], 1000)
+        metrics = engine.lane_metrics(1)
+        self.assertAlmostEqual(metrics['flow_intensity'], 3 / 60)
+        self.assertIsNotNone(metrics['red_queue_delay'])
+        self.assertAlmostEqual(metrics['red_queue_delay'], 30 / 2 / (1 - 3 / 60 / SATURATION_FLOW))
+
+    def test_intensity_forgets_vehicles_outside_window(self):
+        engine = LiveMetrics(window=10)
+        engine.observe(1, 'a', 100)
+        engine.observe(1, 'b', 105)
+        engine.observe(1, 'c', 110)
+        engine.advance()
+        # 'a' (секунда 100) вышла из окна 101..110
+        self.assertAlmostEqual(engine.lane_metrics(1)['flow_intensity'], 2 / 10)
+
+
+class ConsumerFrameTests(SimpleTestCase):
+    def _consumer(self):
+        consumer = consumers.TestConsumer()
+        consumer._keys = {'all'}
+        consumer._seq = {}
+        consumer._pending = {}
+        consumer._sender = None
+        consumer.sent = []
+
+        async def send(text_data=None, bytes_data=None, close=False):
+            consumer.sent.append(json.loads(text_data))
+        consumer.send = send
+        return consumer
+
+    def _frame(self, kind, seq, data):
+        return json.dumps({'type': kind, 'key': 'all', 'seq': seq, 'data': data})
+
+    def test_snapshot_accepted_after_broadcaster_restart(self):
+        consumer = self._consumer()
+
+        async def scenario():
+            for kind, seq, data in (('snapshot', 5, {'a': 1}), ('delta', 5, {'a': 2}), ('delta', 4, {'a': 3}),
+                                    # Рассылка перезапущена: номера начались заново и совпали с прежним
+                                    ('snapshot', 5, {'a': 4}), ('delta', 6, {'a': 5})):
+                consumer._queue_frame(self._frame(kind, seq, data), 'all', seq, kind)
+                await asyncio.sleep(0)
+            await consumer._sender
+
+        asyncio.run(scenario())
+        self.assertEqual([(frame['type'], frame['data']['a']) for frame in consumer.sent],
+                         [('snapshot', 1), ('snapshot', 4), ('delta', 5)])
+
+    def test_send_failure_is_logged(self):
+        consumer = self._consumer()
+
+        async def send(text_data=None, bytes_data=None, close=False):
+            raise ConnectionError("клиент отключился")
+        consumer.send = send
+
+        async def scenario():
+            consumer._queue_frame(self._frame('snapshot', 1, {}), 'all', 1, 'snapshot')
+            await asyncio.gather(consumer._sender, return_exceptions=True)
+            await asyncio.sleep(0)
+
+        with self.assertLogs('main.consumers', 'ERROR') as logs:
+            asyncio.run(scenario())
+        self.assertIn('клиент отключился', logs.output[0])
+
+
+@skipUnless(_redis_available(), "нужен Redis из настроек")
+class SubscriptionCountTests(SimpleTestCase):
+    def setUp(self):
+        self.sync_client = redis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=TEST_REDIS_DB)
+        self._clean()
+        self.addCleanup(self._clean)
+        patcher = mock.patch.object(subscriptions, '_counts', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _clean(self):
+        keys = self.sync_client.keys(subscriptions.SUBSCRIPTIONS_PREFIX + '*')
+        self.sync_client.delete(subscriptions.SUBSCRIBERS_KEY, *keys)
+
+    def _run(self, scenario):
+        async def run():
+            client = aioredis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=TEST_REDIS_DB)
+            with mock.patch.object(subscriptions, 'async_redis_client', client):
+                try:
+                    return await scenario()
+                finally:
+                    await client.aclose()
+        return asyncio.run(run())
+
+    def _other_process(self, process, counts, seen):
+        self.sync_client.hset(subscriptions.SUBSCRIPTIONS_PREFIX + process, mapping=counts)
+        self.sync_client.zadd(subscriptions.SUBSCRIBERS_KEY, {process: seen})
+
+    def test_counts_summed_over_live_processes(self):
+        async def scenario():
+            await subscriptions.add_subscriber(['all', 'lane:1'])
+            await subscriptions.add_subscriber(['lane:1'])
+            await subscriptions.remove_subscriber(['lane:1'])
+            self._other_process('other', {'lane:2': 1, 'lane:1': 0}, time.time())
+            first = await subscriptions.active_subscriptions()
+            await subscriptions.remove_subscriber(['all', 'lane:1'])
+            return first, await subscriptions.active_subscriptions()
+
+        first, second = self._run(scenario)
+        self.assertEqual(first, {'all', 'lane:1', 'lane:2'})
+        self.assertEqual(second, {'lane:2'})
+        # Процесс без подписчиков убирает свой хэш
+        self.assertFalse(self.sync_client.exists(subscriptions.SUBSCRIPTIONS_PREFIX + subscriptions.PROCESS_ID))
+
+    def test_dead_process_forgotten_after_ttl(self):
+        # Процесс упал, не уменьшив счётчики: его продление было раньше срока
+        self._other_process('dead', {'lane:3': 5}, time.time() - subscriptions.SUBSCRIPTIONS_TTL - 1)
+
+        async def scenario():
+            await subscriptions.add_subscriber(['lane:4'])
+            return await subscriptions.active_subscriptions()
+
+        self.assertEqual(self._run(scenario), {'lane:4'})
+        self.assertIsNone(self.sync_client.zscore(subscriptions.SUBSCRIBERS_KEY, 'dead'))
+        ttl = self.sync_client.pttl(subscriptions.SUBSCRIPTIONS_PREFIX + subscriptions.PROCESS_ID)
+        self.assertTrue(0 < ttl <= subscriptions.SUBSCRIPTIONS_TTL * 1000)
+
+    def test_heartbeat_restores_expired_hash(self):
+        async def scenario():
+            await subscriptions.add_subscriber(['lane:5'])
+            # Хэш истёк (например, процесс долго не отвечал)
+            await subscriptions.async_redis_client.delete(subscriptions.SUBSCRIPTIONS_PREFIX + subscriptions.PROCESS_ID)
+            await subscriptions.write_subscriptions()
+            return await subscriptions.active_subscriptions()
+
+        self.assertEqual(self._run(scenario), {'lane:5'})
+
+
+@skipUnless(_redis_available(), "нужен Redis из настроек")
+class SpeedAggregateTests(SimpleTestCase):
+    def setUp(self):
+        self.sync_client = redis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=TEST_REDIS_DB)
+        self.sync_client.flushdb()
+        self.addCleanup(self.sync_client.flushdb)
+
+    def _stats(self):
+        return {key.decode(): value.decode() for key, value in self.sync_client.hgetall(utils.STATS_KEY).items()}
+
+    def test_counts_stay_integer(self):
+        items = [{'id': str(i), 'lane': i % 2, 'obj_speed': 0.1 * (i + 1)} for i in range(10)]
+        pipe = self.sync_client.pipeline()
+        utils.store_items(items, pipe)
+        # Повторная запись с новой скоростью и полосой заменяет прежний вклад
+        utils.store_items([{'id': '0', 'lane': 1, 'obj_speed': 0.7}], pipe)
+        pipe.execute()
+        self.sync_client.zadd(utils.EXPIRY_KEY, {'1': 0, '2': 0})
+        self.assertEqual(utils.expire_items(self.sync_client, now=1), 2)
+
+        stats = self._stats()
+        self.assertEqual((stats['count'], stats['count:0'], stats['count:1']), ('8', '3', '5'))
+        # Поле, записанное HINCRBYFLOAT, HINCRBY бы не принял
+        self.assertEqual(self.sync_client.hincrby(utils.STATS_KEY, 'count', 0), 8)
+        expected = {0: [0.5, 0.7, 0.9], 1: [0.7, 0.4, 0.6, 0.8, 1.0]}
+        for lane, speeds in expected.items():
+            self.assertAlmostEqual(float(stats[f'sum:{lane}']), sum(speeds))
+        self.assertAlmostEqual(float(stats['sum']), sum(map(sum, expected.values())))
+
+
+@skipUnless(_redis_available(), "нужен Redis из настроек")
+class SensorIngestTests(SimpleTestCase):
+    def setUp(self):
+        self.sync_client = redis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=TEST_REDIS_DB)
+        self.sync_client.flushdb()
+        self.addCleanup(self.sync_client.flushdb)
+        topology = Topology([LaneInfo(11, 1, 1, 0, 0, 3.5, 0, True, ())])
+        patcher = mock.patch('dynamic_data.topology.aget_topology', mock.AsyncMock(return_value=topology))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_every_replica_receives_and_leader_reads_stream(self):
+        observed = []
+
+        async def scenario():
+            # Два процесса принимают кадры на своих портах, ведущего среди них нет
+            replicas = [sensor_ingest.SensorIngestServer('127.0.0.1', udp_port=0) for _ in range(2)]
+            for replica in replicas:
+                await replica.start()
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for uuid, replica in enumerate(replicas):
+                    frame = {'sensor': 1, 'rows_data': [{'uuid': str(uuid), 'lane': 0, 'obj_speed': 5}]}
+                    sock.sendto(json.dumps(frame).encode(), ('127.0.0.1', replica.udp_port))
+            await asyncio.sleep(0.2)
+            for replica in replicas:
+                await replica.close()
+
+            # Ведущий, выбранный позже, читает кадры за окно из потока
+            consumer = asyncio.create_task(sensor_ingest.consume_observations(
+                lambda items, now: observed.extend(items), since=60, block=0.05))
+            deadline = time.monotonic() + 2
+            while len(observed) < 2 and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            consumer.cancel()
+            await asyncio.gather(consumer, return_exceptions=True)
+
+        async def run():
+            client = aioredis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=TEST_REDIS_DB)
+            with mock.patch.object(sensor_ingest, 'async_redis_client', client):
+                try:
+                    await scenario()
+                finally:
+                    await client.aclose()
+
+        asyncio.run(run())
+        self.assertEqual(sorted(item['id'] for item in observed), ['1:0', '1:1'])
+        self.assertEqual({item['lane'] for item in observed}, {11})
+        self.assertEqual(self.sync_client.hlen('items'), 2)
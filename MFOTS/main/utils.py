@@ -1,33 +1,359 @@
+import asyncio
 import json
+import logging
+import os
 import time
 from MFOTS.env_config import CONFIG
+from .instrumentation import INGEST_ERRORS, ITEMS, STAGE_SECONDS
 import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
 
 redis_client = redis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=0)
+
+# Асинхронный клиент для кода, работающего в цикле событий (рассылка, загрузка).
+# Соединения создаются по требованию в том цикле, где выполняется команда.
+REDIS_MAX_CONNECTIONS = 20
+async_redis_pool = aioredis.ConnectionPool(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=0,
+                                           max_connections=REDIS_MAX_CONNECTIONS)
+async_redis_client = aioredis.Redis(connection_pool=async_redis_pool)
+
+# Данные объектов лежат в Redis в виде, удобном для расчёта:
+#   items        — хэш id -> JSON объекта;
+#   items:speed  — хэш id -> "скорость|полоса" (последнее известное значение);
+#   items:stats  — хэш с текущими суммой и числом скоростей: sum, count,
+#                  а также sum:<полоса>, count:<полоса> по полосам
+#                  (числа — целые, суммы — с плавающей точкой).
+# Сумма и число обновляются скриптом на стороне Redis при записи объектов,
+# поэтому средняя скорость читается одной командой, без обхода ключей.
+ITEMS_KEY = 'items'
+SPEEDS_KEY = 'items:speed'
+STATS_KEY = 'items:stats'
+# Объектов на один вызов скрипта: длинный скрипт блокирует Redis для остальных клиентов
+SCRIPT_BATCH_SIZE = 5000
+
+# Объект, пропавший из файла, удаляется из Redis (вместе с его вкладом в
+# агрегаты) через ITEM_TTL секунд, если за это время не появится снова.
+# Сроки хранятся в сортированном множестве items:expiry (id -> время удаления).
+EXPIRY_KEY = 'items:expiry'
+ITEM_TTL = 30
+
+# Общая часть скриптов: накопление изменений агрегатов и вычитание старой скорости
+_LUA_SPEED_HELPERS = """
+local deltas = {}
+local function add(field, value)
+    deltas[field] = (deltas[field] or 0) + value
+end
+local function forget(speeds_key, id)
+    local old = redis.call('HGET', speeds_key, id)
+    if not old then
+        return
+    end
+    local sep = string.find(old, '|', 1, true)
+    local old_speed = tonumber(string.sub(old, 1, sep - 1))
+    local old_lane = string.sub(old, sep + 1)
+    add('sum', -old_speed)
+    add('count', -1)
+    if old_lane ~= '' then
+        add('sum:' .. old_lane, -old_speed)
+        add('count:' .. old_lane, -1)
+    end
+end
+local function apply(stats_key)
+    for field, value in pairs(deltas) do
+        if value ~= 0 then
+            -- Число скоростей — целое (HINCRBY), дробными бывают только суммы
+            if string.sub(field, 1, 5) == 'count' then
+                redis.call('HINCRBY', stats_key, field, value)
+            else
+                redis.call('HINCRBYFLOAT', stats_key, field, value)
+            end
+        end
+    end
+end
+"""
+
+# KEYS: items:speed, items:stats, items:expiry
+# ARGV: тройки (id, скорость, полоса); полоса — пустая строка, если неизвестна
+_UPSERT_SPEEDS_LUA = _LUA_SPEED_HELPERS + """
+for i = 1, #ARGV, 3 do
+    local id, speed, lane = ARGV[i], tonumber(ARGV[i + 1]), ARGV[i + 2]
+    forget(KEYS[1], id)
+    redis.call('HSET', KEYS[1], id, ARGV[i + 1] .. '|' .. lane)
+    redis.call('ZREM', KEYS[3], id)
+    add('sum', speed)
+    add('count', 1)
+    if lane ~= '' then
+        add('sum:' .. lane, speed)
+        add('count:' .. lane, 1)
+    end
+end
+apply(KEYS[2])
+return #ARGV / 3
+"""
+
+# KEYS: items, items:speed, items:stats, items:expiry; ARGV[1] — текущее время
+_EXPIRE_ITEMS_LUA = _LUA_SPEED_HELPERS + """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[1])
+for _, id in ipairs(ids) do
+    forget(KEYS[2], id)
+    redis.call('HDEL', KEYS[1], id)
+    redis.call('HDEL', KEYS[2], id)
+    redis.call('ZREM', KEYS[4], id)
+end
+apply(KEYS[3])
+return #ids
+"""
+
+_UPSERT_SPEEDS = redis_client.register_script(_UPSERT_SPEEDS_LUA)
+_EXPIRE_ITEMS = redis_client.register_script(_EXPIRE_ITEMS_LUA)
+_AUPSERT_SPEEDS = async_redis_client.register_script(_UPSERT_SPEEDS_LUA)
+_AEXPIRE_ITEMS = async_redis_client.register_script(_EXPIRE_ITEMS_LUA)
+
+
+def _speed_args(items):
+    args = []
+    for item in items:
+        lane = item.get('lane')
+        args += [item['id'], item.get('obj_speed') or 0, '' if lane is None else lane]
+    return args
+
+
+def store_items(items, pipe=None):
+    """
+    Сохраняет объекты и обновляет агрегаты скоростей: одна команда HSET
+    и один вызов скрипта на каждые SCRIPT_BATCH_SIZE объектов.
+    """
+    if not items:
+        return
+    client = pipe if pipe is not None else redis_client.pipeline()
+    client.hset(ITEMS_KEY, mapping={item['id']: json.dumps(item) for item in items})
+    for start in range(0, len(items), SCRIPT_BATCH_SIZE):
+        batch = items[start:start + SCRIPT_BATCH_SIZE]
+        _UPSERT_SPEEDS(keys=[SPEEDS_KEY, STATS_KEY, EXPIRY_KEY], args=_speed_args(batch), client=client)
+    if pipe is None:
+        client.execute()
+
+
+async def astore_items(items, pipe=None):
+    """Асинхронный вариант store_items."""
+    if not items:
+        return
+    client = pipe if pipe is not None else async_redis_client.pipeline()
+    client.hset(ITEMS_KEY, mapping={item['id']: json.dumps(item) for item in items})
+    for start in range(0, len(items), SCRIPT_BATCH_SIZE):
+        batch = items[start:start + SCRIPT_BATCH_SIZE]
+        await _AUPSERT_SPEEDS(keys=[SPEEDS_KEY, STATS_KEY, EXPIRY_KEY], args=_speed_args(batch), client=client)
+    if pipe is None:
+        await client.execute()
+
+
+def expire_items(pipe=None, now=None):
+    """Удаляет объекты, срок хранения которых истёк, и их вклад в агрегаты."""
+    client = pipe if pipe is not None else redis_client
+    return _EXPIRE_ITEMS(keys=[ITEMS_KEY, SPEEDS_KEY, STATS_KEY, EXPIRY_KEY],
+                         args=[time.time() if now is None else now], client=client)
+
+
+async def aexpire_items(pipe=None, now=None):
+    """Асинхронный вариант expire_items."""
+    client = pipe if pipe is not None else async_redis_client
+    return await _AEXPIRE_ITEMS(keys=[ITEMS_KEY, SPEEDS_KEY, STATS_KEY, EXPIRY_KEY],
+                                args=[time.time() if now is None else now], client=client)
+
+
+class JsonIngestor:
+    """
+    Загружает объекты из JSON-файла в Redis, записывая только разницу с
+    предыдущим чтением. Файл не перечитывается, пока не изменились его mtime
+    и размер.
+    """
+
+    def __init__(self, file_path, ttl=ITEM_TTL, observer=None, resolve_lanes=False, sensor_id=None):
+        self.file_path = file_path
+        self.ttl = ttl
+        # observer(items, now) получает все объекты каждого нового чтения файла
+        self.observer = observer
+        # С resolve_lanes поле lane объекта (номер полосы датчика из поля sensor
+        # или sensor_id) заменяется на id dynamic_data.Lane, как у кадров датчиков
+        # (sensor_ingest.py); объект неизвестной полосы остаётся без полосы
+        self.resolve_lanes = resolve_lanes
+        self.sensor_id = sensor_id
+        self._file_state = None
+        self._snapshot = None  # id -> JSON объекта при прошлом чтении
+
+    def _load_snapshot(self):
+        # После перезапуска процесса сравниваем с тем, что уже лежит в Redis:
+        # объекты, пропавшие за время простоя, тоже получат срок удаления
+        return {key.decode(): None for key in redis_client.hkeys(ITEMS_KEY)}
+
+    async def _aload_snapshot(self):
+        return {key.decode(): None for key in await async_redis_client.hkeys(ITEMS_KEY)}
+
+    def _diff(self):
+        """
+        Читает файл и сравнивает его с прошлым чтением. Возвращает
+        (состояние файла, объекты файла, их JSON по id, изменённые, пропавшие)
+        или None, если файл не менялся.
+        """
+        stat = os.stat(self.file_path)
+        file_state = (stat.st_mtime_ns, stat.st_size)
+        if file_state == self._file_state:
+            return None
+
+        with STAGE_SECONDS.time(stage='json_load'):
+            with open(self.file_path, 'r') as f:
+                data = json.load(f)
+        if self.resolve_lanes:
+            self._resolve_lanes(data)
+        with STAGE_SECONDS.time(stage='diff'):
+            current = {str(item['id']): json.dumps(item, sort_keys=True) for item in data}
+            changed = [item for item in data if self._snapshot.get(str(item['id'])) != current[str(item['id'])]]
+            vanished = [item_id for item_id in self._snapshot if item_id not in current]
+        return file_state, data, current, changed, vanished
+
+    def _resolve_lanes(self, data):
+        # Выполняется в потоке разбора файла: первая загрузка топологии не блокирует цикл событий
+        from dynamic_data.topology import get_topology
+
+        topology = get_topology()
+        for item in data:
+            sensor_id = item.get('sensor', self.sensor_id)
+            lane = topology.lane_for(sensor_id, item.get('lane')) if sensor_id is not None else None
+            item['lane'] = lane.id if lane is not None else None
+
+    def run_once(self):
+        """Один цикл загрузки. Возвращает число записанных и пропавших объектов."""
+        if self._snapshot is None:
+            self._snapshot = self._load_snapshot()
+
+        diff = self._diff()
+        if diff is None:
+            expire_items()
+            return 0, 0
+        file_state, data, current, changed, vanished = diff
+
+        now = time.time()
+        if self.observer is not None:
+            with STAGE_SECONDS.time(stage='live_metrics'):
+                self.observer(data, now)
+        with STAGE_SECONDS.time(stage='redis_write'):
+            pipe = redis_client.pipeline(transaction=True)
+            store_items(changed, pipe)
+            if vanished:
+                pipe.zadd(EXPIRY_KEY, {item_id: now + self.ttl for item_id in vanished}, nx=True)
+            expire_items(pipe, now)
+            pipe.execute()
+        ITEMS.inc(len(changed), result='changed')
+        ITEMS.inc(len(vanished), result='vanished')
+
+        self._snapshot = current
+        self._file_state = file_state
+        return len(changed), len(vanished)
+
+    async def arun_once(self):
+        """
+        Асинхронный вариант run_once. Чтение и разбор файла выполняются
+        в отдельном потоке, чтобы не задерживать цикл событий.
+        """
+        if self._snapshot is None:
+            self._snapshot = await self._aload_snapshot()
+
+        diff = await asyncio.to_thread(self._diff)
+        if diff is None:
+            await aexpire_items()
+            return 0, 0
+        file_state, data, current, changed, vanished = diff
+
+        now = time.time()
+        if self.observer is not None:
+            with STAGE_SECONDS.time(stage='live_metrics'):
+                self.observer(data, now)
+        with STAGE_SECONDS.time(stage='redis_write'):
+            pipe = async_redis_client.pipeline(transaction=True)
+            await astore_items(changed, pipe)
+            if vanished:
+                pipe.zadd(EXPIRY_KEY, {item_id: now + self.ttl for item_id in vanished}, nx=True)
+            await aexpire_items(pipe, now)
+            await pipe.execute()
+        ITEMS.inc(len(changed), result='changed')
+        ITEMS.inc(len(vanished), result='vanished')
+
+        self._snapshot = current
+        self._file_state = file_state
+        return len(changed), len(vanished)
+
+
 def read_json_and_store_in_redis(file_path):
     """Читает JSON-файл и сохраняет данные в Redis."""
     with open(file_path, 'r') as f:
         data = json.load(f)
-        for item in data:
-            # Предполагаем, что 'id' — уникальный идентификатор; замените на 'uuid', если нужно
-            redis_client.set(f"item:{item['id']}", json.dumps(item))
+    # Предполагаем, что 'id' — уникальный идентификатор; замените на 'uuid', если нужно
+    store_items(data)
+
 
-def update_redis_periodically(file_path):
-    """Периодически обновляет данные в Redis из JSON-файла."""
+def update_redis_periodically(file_path, interval=5, resolve_lanes=False, sensor_id=None):
+    """Периодически переносит изменения JSON-файла в Redis."""
+    ingestor = JsonIngestor(file_path, resolve_lanes=resolve_lanes, sensor_id=sensor_id)
     while True:
-        read_json_and_store_in_redis(file_path)
-        time.sleep(5)  # Обновляем каждые 5 секунд
+        try:
+            ingestor.run_once()
+        except Exception as e:
+            INGEST_ERRORS.inc(source='file')
+            logger.error("Ошибка загрузки %s в Redis: %s", file_path, e)
+        time.sleep(interval)  # Проверяем файл каждые interval секунд
 
-def calculate_formulas():
-    """Вычисляет среднюю скорость объектов из данных в Redis."""
-    keys = redis_client.keys("item:*")
-    total_speed = 0
-    count = 0
-    for key in keys:
-        item = json.loads(redis_client.get(key))
-        total_speed += item.get('obj_speed', 0)  # Используем 'obj_speed' вместо 'value'
-        count += 1
+
+async def aupdate_redis_periodically(file_path, interval=5, observer=None, resolve_lanes=False, sensor_id=None):
+    """Асинхронный вариант update_redis_periodically для цикла событий."""
+    ingestor = JsonIngestor(file_path, observer=observer, resolve_lanes=resolve_lanes, sensor_id=sensor_id)
+    while True:
+        try:
+            await ingestor.arun_once()
+        except Exception as e:
+            INGEST_ERRORS.inc(source='file')
+            logger.error("Ошибка загрузки %s в Redis: %s", file_path, e)
+        await asyncio.sleep(interval)
+
+
+def _average(total, count):
+    count = int(count or 0)
     if count > 0:
-        average_speed = total_speed / count
-        return {'average_speed': average_speed}
-    return {'average_speed': 0}
\ No newline at end of file
+        return float(total or 0) / count
+    return 0
+
+
+def calculate_formulas():
+    """Вычисляет среднюю скорость объектов по агрегатам в Redis (одна команда)."""
+    total_speed, count = redis_client.hmget(STATS_KEY, 'sum', 'count')
+    return {'average_speed': _average(total_speed, count)}
+
+
+async def acalculate_formulas():
+    """Асинхронный вариант calculate_formulas."""
+    total_speed, count = await async_redis_client.hmget(STATS_KEY, 'sum', 'count')
+    return {'average_speed': _average(total_speed, count)}
+
+
+async def acalculate_lane_stats(lanes):
+    """Сумма и число скоростей по заданным полосам (одна команда): полоса -> (сумма, число)."""
+    lanes = [str(lane) for lane in lanes]
+    if not lanes:
+        return {}
+    fields = [field for lane in lanes for field in ('sum:' + lane, 'count:' + lane)]
+    values = await async_redis_client.hmget(STATS_KEY, fields)
+    return {
+        lane: (float(values[2 * i] or 0), int(values[2 * i + 1] or 0))
+        for i, lane in enumerate(lanes)
+    }
+
+
+def calculate_lane_speeds():
+    """Средняя скорость по каждой полосе (одна команда)."""
+    stats = {key.decode(): value for key, value in redis_client.hgetall(STATS_KEY).items()}
+    return {
+        field[len('count:'):]: _average(stats.get('sum:' + field[len('count:'):]), value)
+        for field, value in stats.items()
+        if field.startswith('count:')
+    }
@@ -1,3 +1,8 @@
-from django.shortcuts import render
+from django.http import HttpResponse
 
-# Create your views here.
+from .instrumentation import REGISTRY
+
+
+def metrics(request):
+    """Счётчики и гистограммы процесса в текстовом формате Prometheus."""
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,76 @@
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+
+# Быстрый разбор отметок времени строк выгрузки вида 'YYYY-mm-dd HH:MM:SS.ffffff'.
+#
+# Вместо datetime.strptime на каждую строку целая секунда ('YYYY-mm-dd HH:MM:SS',
+# первые 19 символов) разбирается один раз и кэшируется: строки выгрузки идут
+# по времени, и на одну секунду их приходится десятки и сотни. Секунды
+# возвращаются как целые секунды эпохи (время выгрузки считается UTC).
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+SECOND_FORMAT = '%Y-%m-%d %H:%M:%S'
+SECOND_PREFIX_LEN = 19
+
+_EPOCH = datetime(1970, 1, 1)
+_CACHE_LIMIT = 1 << 16
+
+_second_cache: Dict[str, int] = {}
+
+
+def _parse_second_prefix(prefix: str) -> int:
+    # strptime здесь же проверяет формат: в кэш попадают только корректные префиксы
+    seconds = (datetime.strptime(prefix, SECOND_FORMAT) - _EPOCH) // timedelta(seconds=1)
+    if len(_second_cache) >= _CACHE_LIMIT:
+        _second_cache.clear()
+    _second_cache[prefix] = seconds
+    return seconds
+
+
+def epoch_second(time_str: str) -> int:
+    """Секунда эпохи для строки времени (доли секунды отбрасываются)."""
+    prefix = time_str[:SECOND_PREFIX_LEN]
+    seconds = _second_cache.get(prefix)
+    if seconds is None:
+        seconds = _parse_second_prefix(prefix)
+    return seconds
+
+
+def microseconds(time_str: str) -> int:
+    """Доли секунды строки времени в микросекундах (1–6 цифр после точки)."""
+    fraction = time_str[SECOND_PREFIX_LEN + 1:]
+    if not fraction:
+        return 0
+    return int(fraction.ljust(6, '0')[:6])
+
+
+def parse_time(time_str: str) -> datetime:
+    """Быстрая замена datetime.strptime(time_str, TIME_FORMAT)."""
+    return _EPOCH + timedelta(seconds=epoch_second(time_str), microseconds=microseconds(time_str))
+
+
+def epoch_seconds(time_strs: Iterable[str]) -> List[int]:
+    """Секунды эпохи для столбца строк времени."""
+    cache_get = _second_cache.get
+    result = []
+    append = result.append
+    for time_str in time_strs:
+        prefix = time_str[:SECOND_PREFIX_LEN]
+        seconds = cache_get(prefix)
+        if seconds is None:
+            seconds = _parse_second_prefix(prefix)
+        append(seconds)
+    return result
+
+
+def epoch_seconds_datetime64(time_strs: Iterable[str]):
+    """Секунды эпохи для столбца строк через векторный разбор NumPy datetime64."""
+    import numpy as np
+
+    return np.array([s[:SECOND_PREFIX_LEN] for s in time_strs], dtype='datetime64[s]').astype(np.int64)
+
+
+def format_second(seconds: int) -> str:
+    """Обратное преобразование: секунда эпохи -> 'YYYY-mm-dd HH:MM:SS'."""
+    return time.strftime(SECOND_FORMAT, time.gmtime(seconds))
@@ -0,0 +1,329 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from export_stream import find_row_start, iter_rows, iter_rows_from_offset, rows_array_span
+from timestamps import epoch_second
+import main as pipeline
+import result_cache
+
+# Параллельная пакетная обработка выгрузок.
+#
+# Каждый файл обрабатывается в отдельном процессе. Очень большие файлы
+# дополнительно делятся на куски по времени: кусок начинается с найденной
+# строки на заданном байтовом смещении и владеет секундами [t_start, t_end).
+# Строки выгрузки идут по времени с небольшим разбросом, поэтому кусок читает
+# чуть дальше своей границы (SHARD_TOLERANCE_S) и отбрасывает чужие секунды.
+# Каждая секунда считается ровно в одном куске, и счётчики кусков просто
+# объединяются без пересчёта.
+
+SHARD_TOLERANCE_S = 2  # допустимый разброс порядка строк по времени, сек
+DEFAULT_SPLIT_SIZE_MB = 512
+
+Shard = Tuple[Optional[int], Optional[int], Optional[int]]  # (смещение, t_start, t_end)
+
+logger = logging.getLogger('batch')
+
+
+def plan_shards(input_file: str, split_size: int) -> List[Shard]:
+    """
+    Делит массив rows_data объекта OBJECTS на куски примерно по split_size
+    байт с границами по времени. Файлы меньше split_size и выгрузки, где
+    границы массива не определить (rows_array_span), не делятся.
+    """
+    size = os.path.getsize(input_file)
+    count = size // split_size + 1 if split_size > 0 else 1
+    span = rows_array_span(input_file) if count >= 2 else None
+    if span is None:
+        return [(None, None, None)]
+
+    start, end = span
+    count = (end - start) // split_size + 1
+    starts: List[Tuple[int, int]] = []
+    for k in range(1, count):
+        found = find_row_start(input_file, start + k * (end - start) // count)
+        # Начало строки за концом массива принадлежит другому объекту
+        if found is None or found[0] >= end:
+            continue
+        offset, row = found
+        # Все строки до offset относятся к секундам раньше границы (с учетом разброса)
+        boundary = epoch_second(row['time']) + SHARD_TOLERANCE_S
+        if not starts or boundary > starts[-1][1]:
+            starts.append((offset, boundary))
+
+    shards: List[Shard] = []
+    t_start = None
+    offset = None
+    for next_offset, boundary in starts:
+        shards.append((offset, t_start, boundary))
+        offset, t_start = next_offset, boundary
+    shards.append((offset, t_start, None))
+    return shards
+
+
+def _owned_rows(rows: Iterable[Dict[str, Any]], t_start: Optional[int], t_end: Optional[int],
+                stats: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    """Оставляет строки секунд [t_start, t_end) и останавливается, уйдя за t_end."""
+    for row in rows:
+        current = epoch_second(row['time'])
+        if t_end is not None and current >= t_end:
+            if current >= t_end + SHARD_TOLERANCE_S:
+                break
+            continue
+        if t_start is not None and current < t_start:
+            continue
+        stats['rows'] += 1
+        yield row
+
+
+def process_shard(input_file: str, shard: Shard, engine: str = 'python') -> Dict[str, Any]:
+    """Считает число машин на полосах за секунды одного куска файла."""
+    started = time.time()
+    offset, t_start, t_end = shard
+    stats = {'rows': 0}
+    rows = iter_rows(input_file) if offset is None else iter_rows_from_offset(input_file, offset)
+    rows = _owned_rows(rows, t_start, t_end, stats)
+
+    if engine == 'numpy':
+        from metrics_engine import rows_to_columns, lane_counts
+
+        seconds, lanes, counts = lane_counts(*rows_to_columns(rows))
+        lane_list = lanes.tolist()
+        counts_by_second = {
+            second: dict(zip(lane_list, row))
+            for second, row in zip(seconds.tolist(), counts.tolist())
+        }
+        all_lanes = set(lane_list)
+    else:
+        time_lane_intervals, all_lanes = pipeline.group_rows(rows)
+        counts_by_second = pipeline.count_lane_vehicles(time_lane_intervals)
+
+    return {
+        'counts': counts_by_second,
+        'lanes': all_lanes,
+        'rows': stats['rows'],
+        'started': started,
+        'finished': time.time(),
+    }
+
+
+def process_file(input_file: str, output_dir: str, params: Dict[str, float],
+                 engine: str = 'python', cache: bool = False,
+                 file_fingerprint: Optional[Dict[str, Any]] = None,
+                 output_format: str = 'json') -> Dict[str, Any]:
+    """Обрабатывает файл целиком в одном процессе."""
+    started = time.time()
+    stats = pipeline.process_single_file(input_file, output_dir, engine=engine,
+                                         output_format=output_format, **params)
+    if cache:
+        stats['entry'] = result_cache.make_entry(input_file, params, file_fingerprint)
+    stats.update(status='processed', started=started, finished=time.time())
+    return stats
+
+
+def append_file(input_file: str, output_dir: str, params: Dict[str, float],
+                entry: Dict[str, Any], file_fingerprint: Dict[str, Any],
+                engine: str = 'python', output_format: str = 'json') -> Dict[str, Any]:
+    """Досчитывает дописанные строки; если это невозможно — пересчитывает файл целиком."""
+    started = time.time()
+    try:
+        stats = result_cache.append_file(input_file, output_dir, params, entry, file_fingerprint,
+                                         output_format)
+        stats['status'] = 'appended'
+    except result_cache.IncrementalUpdateError as e:
+        logger.warning("Полный пересчёт %s: %s", input_file, e)
+        stats = pipeline.process_single_file(input_file, output_dir, engine=engine,
+                                             output_format=output_format, **params)
+        stats['entry'] = result_cache.make_entry(input_file, params, file_fingerprint)
+        stats['status'] = 'processed'
+    stats.update(started=started, finished=time.time())
+    return stats
+
+
+def _merge_shards(input_file: str, output_dir: str, params: Dict[str, float],
+                  parts: List[Dict[str, Any]], output_format: str = 'json') -> Dict[str, Any]:
+    """Объединяет счётчики кусков, считает метрики и сохраняет результат."""
+    counts: Dict[int, Dict[int, int]] = {}
+    all_lanes = set()
+    for part in parts:
+        counts.update(part['counts'])
+        all_lanes |= part['lanes']
+
+    # Чтение и группировка шли в кусках параллельно: их время — суммарное по кускам
+    timings = {'read_group_s': sum(part['finished'] - part['started'] for part in parts)}
+    with pipeline.timed(timings, 'metrics_s'):
+        results = pipeline.calculate_metrics_from_counts(
+            counts,
+            all_lanes,
+            params['red_time'],
+            params['car_length'],
+            params['green_time'],
+            params['cycle_time']
+        )
+    output_file = pipeline.output_path(input_file, output_dir, output_format)
+    with pipeline.timed(timings, 'save_s'):
+        pipeline.save_results(results, output_file, output_format)
+    logger.info("Результаты для %s сохранены в %s", input_file, output_file)
+    return {
+        'input_file': input_file,
+        'output_file': output_file,
+        'rows': sum(part['rows'] for part in parts),
+        'seconds': len(results),
+        'stages': timings,
+        'status': 'processed',
+        'started': min(part['started'] for part in parts),
+        'finished': max(part['finished'] for part in parts),
+    }
+
+
+def run_batch(input_files: List[str], output_dir: str, params: Dict[str, float],
+              workers: Optional[int] = None, engine: str = 'python',
+              split_size: int = DEFAULT_SPLIT_SIZE_MB << 20,
+              manifest: Optional[Dict[str, Any]] = None,
+              output_format: str = 'json') -> List[Dict[str, Any]]:
+    """
+    Обрабатывает файлы в пуле из workers процессов (по умолчанию — по числу ядер).
+    Если передан manifest (см. result_cache), неизменившиеся файлы пропускаются,
+    дописанные — досчитываются, а manifest обновляется на месте.
+    Возвращает по отчёту на каждый файл в порядке input_files; у неудачных
+    файлов заполнено поле error.
+    """
+    cache = manifest is not None
+    reports: Dict[str, Dict[str, Any]] = {}
+    pending_shards: Dict[str, Dict[str, Any]] = {}
+    futures: Dict[Future, Tuple[str, str]] = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit(kind: str, input_file: str, fn, *args) -> None:
+            futures[pool.submit(fn, *args)] = (kind, input_file)
+
+        def start_full(input_file: str, file_fingerprint: Optional[Dict[str, Any]] = None) -> None:
+            shards = plan_shards(input_file, split_size)
+            reports[input_file]['shards'] = len(shards)
+            if len(shards) == 1:
+                submit('file', input_file, process_file, input_file, output_dir, params,
+                       engine, cache, file_fingerprint, output_format)
+                return
+            pending_shards[input_file] = {'parts': [], 'count': len(shards), 'entry': None}
+            for shard in shards:
+                submit('shard', input_file, process_shard, input_file, shard, engine)
+            if cache:
+                submit('entry', input_file, result_cache.make_entry, input_file, params, file_fingerprint)
+
+        def skip(input_file: str) -> None:
+            reports[input_file].update(status='skipped', shards=0, rows=0,
+                                       output_file=pipeline.output_path(input_file, output_dir, output_format))
+
+        for input_file in input_files:
+            reports[input_file] = {'input_file': input_file, 'size_bytes': os.path.getsize(input_file)}
+            try:
+                if not cache:
+                    start_full(input_file)
+                    continue
+                entry = manifest.get(result_cache.manifest_key(input_file))
+                status = result_cache.quick_status(input_file, entry, params,
+                                                   pipeline.output_path(input_file, output_dir, output_format))
+                if status == 'unchanged':
+                    skip(input_file)
+                elif status == 'check':
+                    submit('check', input_file, result_cache.check_file, input_file, entry)
+                else:
+                    start_full(input_file)
+            except Exception as e:
+                reports[input_file]['error'] = str(e)
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, input_file = futures.pop(future)
+                report = reports[input_file]
+                key = result_cache.manifest_key(input_file)
+                if 'error' in report:
+                    continue
+                try:
+                    result = future.result()
+                    if kind == 'check':
+                        entry = manifest[key]
+                        if result['decision'] == 'unchanged':
+                            # Файл только «потрогали»: запоминаем новый mtime
+                            entry.update(result['fingerprint'])
+                            skip(input_file)
+                        elif result['decision'] == 'append':
+                            report['shards'] = 1
+                            submit('append', input_file, append_file, input_file, output_dir, params,
+                                   entry, result['fingerprint'], engine, output_format)
+                        else:
+                            start_full(input_file, result['fingerprint'])
+                    elif kind in ('file', 'append'):
+                        entry = result.pop('entry', None)
+                        if entry is not None:
+                            manifest[key] = entry
+                        report.update(result)
+                    else:
+                        pending = pending_shards[input_file]
+                        if kind == 'shard':
+                            pending['parts'].append(result)
+                        else:
+                            pending['entry'] = result
+                        if len(pending['parts']) == pending['count'] and (not cache or pending['entry']):
+                            report.update(_merge_shards(input_file, output_dir, params, pending['parts'],
+                                                           output_format))
+                            if cache:
+                                manifest[key] = pending['entry']
+                            del pending_shards[input_file]
+                except Exception as e:
+                    report['error'] = str(e)
+                    if cache:
+                        manifest.pop(key, None)
+                    logger.error("Ошибка при обработке файла %s: %s", input_file, e)
+
+    summary = []
+    for input_file in input_files:
+        report = reports[input_file]
+        if 'error' in report:
+            pass
+        elif report['status'] == 'skipped':
+            report.update(elapsed_s=0.0, rows_per_s=0.0, mb_per_s=0.0)
+        else:
+            elapsed = max(report.pop('finished') - report.pop('started'), 1e-9)
+            report['elapsed_s'] = elapsed
+            report['rows_per_s'] = report['rows'] / elapsed
+            report['mb_per_s'] = report['size_bytes'] / (1 << 20) / elapsed
+        summary.append(report)
+    return summary
+
+
+def print_summary(summary: List[Dict[str, Any]], wall_time: float) -> None:
+    """Печатает сводку по файлам: пропускная способность и ошибки."""
+    failed = [report for report in summary if 'error' in report]
+    rows = sum(report.get('rows', 0) for report in summary)
+    size_mb = sum(report['size_bytes'] for report in summary
+                  if report.get('status') != 'skipped') / (1 << 20)
+
+    print(f"{'Файл':<50} {'Куски':>5} {'Строк':>12} {'Сек':>8} {'Строк/с':>12} {'МБ/с':>8}")
+    for report in summary:
+        name = os.path.basename(report['input_file'])
+        if 'error' in report:
+            print(f"{name:<50} ОШИБКА: {report['error']}")
+            continue
+        if report['status'] == 'skipped':
+            print(f"{name:<50} без изменений, пропущен")
+            continue
+        if report['status'] == 'appended':
+            name += ' (дописан)'
+        print(f"{name:<50} {report['shards']:>5} {report['rows']:>12} {report['elapsed_s']:>8.2f} "
+              f"{report['rows_per_s']:>12.0f} {report['mb_per_s']:>8.1f}")
+    skipped = [report for report in summary if report.get('status') == 'skipped']
+    print(f"Файлов: {len(summary)}, успешно: {len(summary) - len(failed)} "
+          f"(пропущено без изменений: {len(skipped)}), с ошибками: {len(failed)}")
+    print(f"Всего строк: {rows}, {size_mb:.1f} МБ за {wall_time:.2f} с "
+          f"({rows / max(wall_time, 1e-9):.0f} строк/с, {size_mb / max(wall_time, 1e-9):.1f} МБ/с)")
+
+
+def save_summary(summary: List[Dict[str, Any]], wall_time: float, summary_file: str) -> None:
+    """Сохраняет сводку в JSON для сравнения между запусками."""
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        json.dump({'wall_time_s': wall_time, 'files': summary}, f, indent=4, ensure_ascii=False)
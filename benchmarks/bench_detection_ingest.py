@@ -0,0 +1,111 @@
+"""
+Скорость записи обнаружений в VehicleDetection (строк/сек): построчный
+save() против DetectionIngestor с bulk_create и с COPY.
+
+Нужна локальная PostgreSQL из настроек Django (DB_* в окружении) с применёнными
+миграциями dynamic_data. Бенчмарк создаёт свой перекрёсток, датчик и полосы
+и удаляет их вместе со всеми записанными строками по окончании.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_detection_ingest --rows 200000 --batch-size 5000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MFOTS'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MFOTS.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from dynamic_data.ingest import DetectionIngestor  # noqa: E402
+from dynamic_data.models import Intersection, Lane, Sensor, VehicleDetection  # noqa: E402
+from benchmarks.synthetic import generate_rows  # noqa: E402
+
+BENCH_NAME = 'bench_detection_ingest'
+
+
+def create_lanes(count: int):
+    intersection = Intersection.objects.create(name=BENCH_NAME)
+    sensor = Sensor.objects.create(
+        mounting_height=6, rotate_x=0, rotate_y=0, rotate_z=0, x_coordinate=0, y_coordinate=0,
+        sensor_type='radar', sensor_ip='127.0.0.1', port=0, command_port=0, firmware_version=BENCH_NAME,
+        intersection=intersection,
+    )
+    lanes = [
+        Lane.objects.create(sensor=sensor, center=i * 3.5, direction=0, width=3.5, active=True,
+                            intersection=intersection)
+        for i in range(count)
+    ]
+    return intersection, sensor.id, [lane.id for lane in lanes]
+
+
+def make_rows(count: int, lanes: int):
+    # Поле lane — номер полосы датчика, как в выгрузках
+    rows = []
+    for row in generate_rows(count, lanes=lanes, vehicles_per_second=2):
+        rows.append(row)
+        if len(rows) >= count:
+            break
+    return rows
+
+
+def run_orm(rows, sensor_id: int, lane_ids):
+    # Построчный save() — то, что заменяет пакетная запись
+    for row in rows:
+        VehicleDetection.objects.create(
+            sensor_id=sensor_id,
+            lane_id=lane_ids[row['lane']],
+            obj_id=row['obj_id'],
+            speed_mps=round(row['obj_speed'], 2),
+            detection_time=datetime.fromisoformat(row['time']).replace(tzinfo=timezone.utc),
+            point_x=row['point_x'],
+            point_y=row['point_y'],
+        )
+
+
+def run_ingestor(rows, sensor_id: int, method: str, batch_size: int):
+    with DetectionIngestor(sensor_id=sensor_id, batch_size=batch_size, flush_interval=float('inf'),
+                           method=method) as ingestor:
+        ingestor.add_many(rows)
+    return ingestor
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--orm-rows', type=int, default=5_000, help="строк для построчной записи")
+    parser.add_argument('--batch-size', type=int, default=5_000)
+    parser.add_argument('--lanes', type=int, default=6)
+    args = parser.parse_args()
+
+    intersection, sensor_id, lane_ids = create_lanes(args.lanes)
+    report = {'rows': args.rows, 'batch_size': args.batch_size}
+    try:
+        rows = make_rows(args.rows, len(lane_ids))
+        orm_rows = rows[:args.orm_rows]
+        cases = [('orm_save', lambda: run_orm(orm_rows, sensor_id, lane_ids), len(orm_rows))]
+        cases += [(method, lambda method=method: run_ingestor(rows, sensor_id, method, args.batch_size), len(rows))
+                  for method in ('bulk_create', 'copy')]
+        for name, func, count in cases:
+            VehicleDetection.objects.filter(lane_id__in=lane_ids).delete()
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            written = VehicleDetection.objects.filter(lane_id__in=lane_ids).count()
+            if written != count:
+                raise SystemExit(f"{name}: записано {written} строк из {count}")
+            report[name] = {'rows': count, 'elapsed_s': elapsed, 'rows_per_s': count / elapsed}
+    finally:
+        # Каскадно удаляет датчик, полосы и записанные обнаружения
+        intersection.delete()
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Выборка «обнаружения на полосе за период» на синтетической таблице
+обнаружений: обычная таблица (как VehicleDetection до секционирования —
+индексы только на внешних ключах) против таблицы, секционированной по
+detection_time, с составным индексом (lane_id, detection_time) и BRIN.
+
+Нужна локальная PostgreSQL из настроек Django. Таблицы создаются в отдельной
+схеме (--schema) и заполняются на стороне сервера через generate_series;
+по окончании схема удаляется (если не указан --keep).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_detection_partitions --rows 100000000 --days 90
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MFOTS'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MFOTS.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from dynamic_data.partitions import ensure_partitions  # noqa: E402
+
+START = date(2025, 1, 1)
+PLAIN = 'detections_plain'
+PARTITIONED = 'detections_partitioned'
+
+_COLUMNS = """
+    id bigint NOT NULL,
+    sensor_id bigint NOT NULL,
+    lane_id bigint NOT NULL,
+    obj_id integer NOT NULL,
+    speed_mps numeric(10, 2) NOT NULL,
+    detection_time timestamptz NOT NULL,
+    point_x numeric(10, 2) NOT NULL,
+    point_y numeric(10, 2) NOT NULL
+"""
+
+# Строки идут по времени, как при записи с датчиков (%% — литеральный % для psycopg2)
+_FILL = """
+INSERT INTO {table}
+SELECT g, 1, 1 + g %% %(lanes)s, g, (g %% 1600) / 100.0,
+       %(start)s::timestamptz + (g * %(span)s / %(rows)s) * interval '1 second',
+       (g %% 1000) / 100.0, (g %% 5000) / 100.0
+FROM generate_series(1, %(rows)s) AS g
+"""
+
+_QUERY = """
+SELECT count(*), avg(speed_mps) FROM {table}
+WHERE lane_id = %s AND detection_time >= %s AND detection_time < %s
+"""
+
+
+def create_tables(cursor, args) -> None:
+    cursor.execute(f"CREATE TABLE {PLAIN} ({_COLUMNS}, PRIMARY KEY (id))")
+    cursor.execute(f"CREATE INDEX ON {PLAIN} (lane_id)")
+    cursor.execute(f"CREATE INDEX ON {PLAIN} (sensor_id)")
+
+    cursor.execute(f"CREATE TABLE {PARTITIONED} ({_COLUMNS}, PRIMARY KEY (id, detection_time)) "
+                   f"PARTITION BY RANGE (detection_time)")
+    ensure_partitions(cursor, PARTITIONED, START, START + timedelta(days=args.days), args.interval)
+
+    params = {'lanes': args.lanes, 'start': START.isoformat(), 'span': args.days * 86400, 'rows': args.rows}
+    for table in (PLAIN, PARTITIONED):
+        started = time.perf_counter()
+        cursor.execute(_FILL.format(table=table), params)
+        print(f"{table}: {args.rows} строк за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+    cursor.execute(f"CREATE INDEX ON {PARTITIONED} (lane_id, detection_time)")
+    cursor.execute(f"CREATE INDEX ON {PARTITIONED} USING brin (detection_time)")
+    cursor.execute(f"CREATE INDEX ON {PARTITIONED} (sensor_id)")
+    cursor.execute(f"ANALYZE {PLAIN}")
+    cursor.execute(f"ANALYZE {PARTITIONED}")
+
+
+def best_of(cursor, table: str, params, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(_QUERY.format(table=table), params)
+        cursor.fetchall()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000_000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--lanes', type=int, default=24)
+    parser.add_argument('--interval', choices=('day', 'month'), default='day')
+    parser.add_argument('--window-hours', type=float, default=1, help="длина выбираемого периода")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--schema', default='bench_partitions')
+    parser.add_argument('--keep', action='store_true', help="не удалять схему с таблицами")
+    args = parser.parse_args()
+
+    schema = connection.ops.quote_name(args.schema)
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA {schema}")
+        try:
+            cursor.execute(f"SET search_path TO {schema}")
+            create_tables(cursor, args)
+
+            t1 = START + timedelta(days=args.days // 2)
+            params = [1, t1.isoformat(), (t1 + timedelta(hours=args.window_hours)).isoformat()]
+            report = {'rows': args.rows, 'days': args.days, 'interval': args.interval,
+                      'window_hours': args.window_hours}
+            for table in (PLAIN, PARTITIONED):
+                cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+                size = cursor.fetchone()[0]
+                if table == PARTITIONED:
+                    cursor.execute("SELECT sum(pg_total_relation_size(inhrelid)) FROM pg_inherits "
+                                   "WHERE inhparent = to_regclass(%s)", [table])
+                    size = cursor.fetchone()[0]
+                cursor.execute("EXPLAIN (FORMAT JSON) " + _QUERY.format(table=table), params)
+                plan = cursor.fetchone()[0]
+                report[table] = {
+                    'query_s': best_of(cursor, table, params, args.repeat),
+                    'size_mb': size / (1 << 20),
+                    'plan': plan[0]['Plan']['Node Type'] if isinstance(plan, list) else plan,
+                }
+            report['speedup'] = report[PLAIN]['query_s'] / report[PARTITIONED]['query_s']
+        finally:
+            cursor.execute("RESET search_path")
+            if not args.keep:
+                cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+    print(json.dumps(report, indent=4, default=str))
+
+
+if __name__ == '__main__':
+    main()
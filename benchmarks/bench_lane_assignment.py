@@ -0,0 +1,117 @@
+"""
+Привязка точек к полосам и зонам: построчный перебор полос и зон датчика
+против пакетного ZoneIndex.assign (NumPy, np.searchsorted).
+
+Топология синтетическая и собирается в памяти, база данных не нужна
+(Django только настраивается, чтобы импортировались модели).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_lane_assignment --points 1000000 --sensors 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MFOTS'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MFOTS.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from dynamic_data.geometry import NO_MATCH, ZoneIndex  # noqa: E402
+from dynamic_data.topology import LaneInfo, Topology, ZoneInfo  # noqa: E402
+
+LANE_WIDTH = 3.5
+ZONE_LENGTH = 10.0
+
+
+def make_topology(sensors: int, lanes: int, zones: int) -> Topology:
+    items = []
+    zone_id = 0
+    for sensor_id in range(1, sensors + 1):
+        for number in range(lanes):
+            lane_zones = []
+            for k in range(zones):
+                zone_id += 1
+                lane_zones.append(ZoneInfo(zone_id, ZONE_LENGTH, 1, k * 2 * ZONE_LENGTH))
+            items.append(LaneInfo(
+                id=sensor_id * 100 + number, sensor_id=sensor_id, intersection_id=1, number=number,
+                center=(number - lanes / 2) * LANE_WIDTH, width=LANE_WIDTH, direction=0, active=True,
+                zones=tuple(lane_zones),
+            ))
+    return Topology(items)
+
+
+def assign_rows(topology: Topology, sensor_ids, xs, ys):
+    """Построчная привязка, как без индекса: перебор полос датчика и их зон."""
+    lanes, zones = [], []
+    for sensor_id, x, y in zip(sensor_ids, xs, ys):
+        lane_id = zone_id = NO_MATCH
+        for candidate in topology.sensor_lanes.get(sensor_id, []):
+            lane = topology.lanes[candidate]
+            if lane.center - lane.width / 2 <= x < lane.center + lane.width / 2:
+                lane_id = lane.id
+                for zone in lane.zones:
+                    if zone.zone_offset <= y < zone.zone_offset + zone.width:
+                        zone_id = zone.id
+                        break
+                break
+        lanes.append(lane_id)
+        zones.append(zone_id)
+    return np.array(lanes), np.array(zones)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=1_000_000)
+    parser.add_argument('--row-points', type=int, default=200_000, help="точек для построчной привязки")
+    parser.add_argument('--sensors', type=int, default=50)
+    parser.add_argument('--lanes', type=int, default=6)
+    parser.add_argument('--zones', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    topology = make_topology(args.sensors, args.lanes, args.zones)
+    rnd = np.random.default_rng(args.seed)
+    # Часть точек — за пределами полос и зон и у неизвестного датчика
+    sensor_ids = rnd.integers(1, args.sensors + 2, args.points)
+    half_road = args.lanes / 2 * LANE_WIDTH
+    xs = rnd.uniform(-half_road - LANE_WIDTH, half_road + LANE_WIDTH, args.points)
+    ys = rnd.uniform(-ZONE_LENGTH, 2 * ZONE_LENGTH * args.zones, args.points)
+
+    started = time.perf_counter()
+    index = ZoneIndex(topology)
+    build_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    lanes, zones = index.assign(sensor_ids, xs, ys)
+    vector_s = time.perf_counter() - started
+
+    n = min(args.row_points, args.points)
+    started = time.perf_counter()
+    row_lanes, row_zones = assign_rows(topology, sensor_ids[:n].tolist(), xs[:n].tolist(), ys[:n].tolist())
+    rows_s = time.perf_counter() - started
+    if not (np.array_equal(row_lanes, lanes[:n]) and np.array_equal(row_zones, zones[:n])):
+        raise SystemExit("Построчная и пакетная привязки расходятся")
+
+    report = {
+        'points': args.points,
+        'lanes': len(topology.lanes),
+        'zones': int(index.zone_ids.size),
+        'matched_lanes': int(np.count_nonzero(lanes != NO_MATCH)),
+        'matched_zones': int(np.count_nonzero(zones != NO_MATCH)),
+        'index_build_s': build_s,
+        'rows': {'points': n, 'elapsed_s': rows_s, 'points_per_s': n / rows_s},
+        'vectorized': {'points': args.points, 'elapsed_s': vector_s, 'points_per_s': args.points / vector_s},
+    }
+    report['speedup'] = report['vectorized']['points_per_s'] / report['rows']['points_per_s']
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
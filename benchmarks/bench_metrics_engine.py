@@ -0,0 +1,90 @@
+"""
+Сравнение расчёта метрик: словарь множеств + main.calculate_metrics_per_second
+против векторизованного metrics_engine на сутках данных нескольких перекрёстков.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_metrics_engine --intersections 8
+"""
+import argparse
+import json
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+import main
+from metrics_engine import calculate_metrics_vectorized
+
+GREEN_TIME = 45
+RED_TIME = 30
+CAR_LENGTH = 4.5
+CYCLE_TIME = GREEN_TIME + RED_TIME
+START = int((datetime(2025, 3, 20) - datetime(1970, 1, 1)).total_seconds())
+
+
+def synthetic_columns(seconds: int, lanes: int, rows_per_second: int, vehicles: int, seed: int):
+    """Столбцы (секунда, полоса, uuid) одного перекрёстка с повторными отметками машин."""
+    rng = np.random.default_rng(seed)
+    n = seconds * rows_per_second
+    sec = START + np.repeat(np.arange(seconds, dtype=np.int64), rows_per_second)
+    uuid_codes = rng.integers(0, vehicles, n, dtype=np.int64)
+    lane = uuid_codes % lanes
+    return sec, lane, uuid_codes
+
+
+def python_engine(sec: np.ndarray, lane: np.ndarray, uuid_codes: np.ndarray):
+    """Текущий путь main.py: группировка в словарь множеств и расчёт по секундам."""
+    time_lane_intervals = defaultdict(lambda: defaultdict(set))
+    all_lanes = set()
+    for s, l, u in zip(sec.tolist(), lane.tolist(), uuid_codes.tolist()):
+        time_lane_intervals[s][l].add(u)
+        all_lanes.add(l)
+    return main.calculate_metrics_per_second(time_lane_intervals, all_lanes,
+                                             RED_TIME, CAR_LENGTH, GREEN_TIME, CYCLE_TIME)
+
+
+def numpy_engine(sec: np.ndarray, lane: np.ndarray, uuid_codes: np.ndarray):
+    return calculate_metrics_vectorized(sec, lane, uuid_codes,
+                                        RED_TIME, CAR_LENGTH, GREEN_TIME, CYCLE_TIME)
+
+
+def main_bench() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--intersections', type=int, default=8)
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--lanes', type=int, default=6)
+    parser.add_argument('--rows-per-second', type=int, default=40)
+    parser.add_argument('--vehicles', type=int, default=50_000, help='различных uuid на перекрёсток')
+    args = parser.parse_args()
+
+    seconds = int(args.hours * 3600)
+    timings = {'python': 0.0, 'numpy': 0.0}
+    rows = 0
+    for i in range(args.intersections):
+        columns = synthetic_columns(seconds, args.lanes, args.rows_per_second, args.vehicles, seed=i)
+        rows += columns[0].size
+
+        started = time.perf_counter()
+        expected = python_engine(*columns)
+        timings['python'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        actual = numpy_engine(*columns)
+        timings['numpy'] += time.perf_counter() - started
+
+        if actual != expected:
+            raise SystemExit(f"Результаты движков различаются для перекрёстка {i}")
+
+    print(json.dumps({
+        'intersections': args.intersections,
+        'rows': rows,
+        'python_s': timings['python'],
+        'numpy_s': timings['numpy'],
+        'speedup': timings['python'] / timings['numpy'],
+        'identical': True,
+    }, indent=4))
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,76 @@
+"""
+Сравнение форматов результатов: metrics.json (indent=4) против столбцового
+.npz из metrics_store — размер файла, время записи и время чтения.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_output_format --hours 24
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import main
+from benchmarks.bench_metrics_engine import synthetic_columns, GREEN_TIME, RED_TIME, CAR_LENGTH, CYCLE_TIME
+from metrics_engine import calculate_metrics_vectorized
+from metrics_store import load_metrics_npz, results_to_arrays, save_arrays_npz, arrays_to_results
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def read_json(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_npz(path: str, mmap: bool):
+    arrays = load_metrics_npz(path, mmap=mmap)
+    # Обращаемся ко всем данным, чтобы отображённые страницы действительно прочитались
+    return sum(float(np.sum(array)) for array in arrays.values())
+
+
+def main_bench() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--lanes', type=int, default=6)
+    args = parser.parse_args()
+
+    columns = synthetic_columns(int(args.hours * 3600), args.lanes, 20, 20_000, seed=0)
+    results = calculate_metrics_vectorized(*columns, RED_TIME, CAR_LENGTH, GREEN_TIME, CYCLE_TIME)
+    arrays = results_to_arrays(results)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'metrics.json')
+        npz_path = os.path.join(tmp, 'metrics.npz')
+
+        _, json_write = timed(main.save_results_to_json, results, json_path)
+        _, npz_write = timed(save_arrays_npz, arrays, npz_path)
+        _, json_read = timed(read_json, json_path)
+        _, npz_read_mmap = timed(read_npz, npz_path, True)
+        _, npz_read = timed(read_npz, npz_path, False)
+
+        # Формат без потерь: из .npz восстанавливается тот же JSON
+        restored = json.loads(json.dumps(arrays_to_results(load_metrics_npz(npz_path))))
+        if restored != read_json(json_path):
+            raise SystemExit("Результаты .npz не совпадают с JSON")
+
+        report = {
+            'seconds': len(results),
+            'lanes': args.lanes,
+            'json': {'size_mb': os.path.getsize(json_path) / (1 << 20), 'write_s': json_write, 'read_s': json_read},
+            'npz': {'size_mb': os.path.getsize(npz_path) / (1 << 20), 'write_s': npz_write,
+                    'read_s': npz_read, 'read_mmap_s': npz_read_mmap},
+        }
+    report['size_ratio'] = report['json']['size_mb'] / report['npz']['size_mb']
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main_bench()
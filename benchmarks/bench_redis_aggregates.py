@@ -0,0 +1,102 @@
+"""
+Средняя скорость по Redis: прежний calculate_formulas (KEYS item:* + GET и
+json.loads на каждый ключ) против агрегатов items:stats из main/utils.py.
+
+Нужен локальный Redis (REDIS_HOST/REDIS_PORT, как у Django). Бенчмарк пишет
+в отдельную базу (--db, по умолчанию 15) и отказывается работать с непустой базой.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_redis_aggregates --objects 10000 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MFOTS'))
+
+from MFOTS.env_config import CONFIG  # noqa: E402
+from main import utils  # noqa: E402
+
+
+def legacy_calculate(client):
+    """Прежняя реализация calculate_formulas."""
+    keys = client.keys("item:*")
+    total_speed = 0
+    count = 0
+    for key in keys:
+        item = json.loads(client.get(key))
+        total_speed += item.get('obj_speed', 0)
+        count += 1
+    if count > 0:
+        return {'average_speed': total_speed / count}
+    return {'average_speed': 0}
+
+
+def make_items(count: int, lanes: int = 6):
+    rnd = random.Random(count)
+    return [{'id': i, 'lane': i % lanes, 'obj_speed': round(rnd.uniform(0, 16), 2)} for i in range(count)]
+
+
+def best_of(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--objects', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--db', type=int, default=15)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    client = redis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=args.db)
+    if client.dbsize():
+        raise SystemExit(f"База Redis {args.db} не пуста, выберите другую через --db")
+    utils.redis_client = client
+
+    report = []
+    try:
+        for count in args.objects:
+            client.flushdb()
+            items = make_items(count)
+
+            started = time.perf_counter()
+            pipe = client.pipeline(transaction=False)
+            for item in items:
+                pipe.set(f"item:{item['id']}", json.dumps(item))
+            pipe.execute()
+            legacy_ingest = time.perf_counter() - started
+
+            started = time.perf_counter()
+            utils.store_items(items)
+            aggregated_ingest = time.perf_counter() - started
+
+            expected = legacy_calculate(client)['average_speed']
+            actual = utils.calculate_formulas()['average_speed']
+            if abs(expected - actual) > 1e-6 * max(1.0, abs(expected)):
+                raise SystemExit(f"Средние скорости различаются: {expected} и {actual}")
+
+            report.append({
+                'objects': count,
+                'legacy_ingest_s': legacy_ingest,
+                'aggregated_ingest_s': aggregated_ingest,
+                'legacy_calculate_s': best_of(lambda: legacy_calculate(client), args.repeat),
+                'aggregated_calculate_s': best_of(utils.calculate_formulas, args.repeat),
+                'lane_speeds_s': best_of(utils.calculate_lane_speeds, args.repeat),
+            })
+    finally:
+        client.flushdb()
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Стоимость кадра воспроизведения: разбор выгрузки один раз в Replay и срез
+кадра по времени (с переводом координат в пиксели, как в visualisator.py)
+против прежнего живого режима, который перечитывал весь файл json.load.
+
+pygame не нужен: меряется только подготовка кадра. Бюджет кадра при 60 fps —
+16.7 мс.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_replay --duration 3600 --vehicles-per-second 2
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import write_export
+from replay import DEFAULT_WINDOW, load_replay
+
+FPS = 60
+
+
+def frame_times(replay, frames: int, speed: float) -> np.ndarray:
+    scale, margin = 5.0, 20
+    elapsed = np.empty(frames)
+    t = 0.0
+    for i in range(frames):
+        started = time.perf_counter()
+        rows = replay.frame(t, DEFAULT_WINDOW)
+        px = ((replay.x[rows] - replay.x.min()) * scale + margin).astype(np.int32).tolist()
+        py = ((replay.y[rows] - replay.y.min()) * scale + margin).astype(np.int32).tolist()
+        list(zip(replay.lanes[rows].tolist(), px, py))
+        elapsed[i] = time.perf_counter() - started
+        t = (t + speed / FPS) % replay.duration
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=int, default=3600, help='длительность выгрузки, сек')
+    parser.add_argument('--vehicles-per-second', type=float, default=2.0)
+    parser.add_argument('--dwell', type=int, default=60, help='сколько секунд машина в зоне')
+    parser.add_argument('--frames', type=int, default=3000)
+    parser.add_argument('--speed', type=float, default=8.0, help='скорость воспроизведения')
+    parser.add_argument('--file', help='готовая выгрузка вместо генерации')
+    args = parser.parse_args()
+
+    path = args.file
+    tmp = None
+    if path is None:
+        tmp = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        tmp.close()
+        path = tmp.name
+        write_export(path, args.duration, vehicles_per_second=args.vehicles_per_second, dwell_s=args.dwell)
+
+    try:
+        started = time.perf_counter()
+        replay = load_replay(path)
+        load_s = time.perf_counter() - started
+
+        elapsed = frame_times(replay, args.frames, args.speed)
+
+        # Прежний режим: весь файл заново на каждое обновление
+        started = time.perf_counter()
+        with open(path, 'r', encoding='utf-8') as f:
+            json.load(f)
+        reload_s = time.perf_counter() - started
+
+        report = {
+            'rows': int(replay.times.size),
+            'duration_s': replay.duration,
+            'file_mb': os.path.getsize(path) / (1 << 20),
+            'replay_load_s': load_s,
+            'frame_ms_mean': float(elapsed.mean() * 1000),
+            'frame_ms_p99': float(np.percentile(elapsed, 99) * 1000),
+            'frame_budget_ms': 1000 / FPS,
+            'json_reload_ms': reload_s * 1000,
+        }
+        print(json.dumps(report, indent=4))
+    finally:
+        if tmp is not None:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Скорость перебора планов светофорного регулирования (signal_plans.py):
+неделя прибытий (синтетические пуассоновские окна) против сетки планов T_g × T_r,
+в одном процессе и в нескольких, а также скорость подсчёта прибытий по строкам.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_signal_plans --days 7 --window 60 --lanes 8 --workers 4
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_rows
+from signal_plans import ArrivalCounter, _range, evaluate_parallel, evaluate_plans, plan_grid
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--window', type=int, default=60, help='окно прибытий, сек')
+    parser.add_argument('--lanes', type=int, default=8)
+    parser.add_argument('--vehicles-per-lane-hour', type=float, default=300)
+    parser.add_argument('--green', default='15:90:1')
+    parser.add_argument('--red', default='15:90:1')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--rows-duration', type=int, default=300, help='длительность потока строк, сек')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    windows = int(args.days * 86400 / args.window)
+    # Суточный профиль: ночью поток в 5 раз слабее, чем в час пик
+    hours = (np.arange(windows) * args.window / 3600) % 24
+    profile = 0.2 + 0.8 * np.exp(-((hours - 8) ** 2) / 8) + 0.8 * np.exp(-((hours - 18) ** 2) / 8)
+    mean = args.vehicles_per_lane_hour * args.window / 3600 * profile
+    counts = rng.poisson(mean[:, None], size=(windows, args.lanes)).astype(float)
+    cross = np.arange(args.lanes) >= args.lanes // 2
+    green, red = plan_grid(_range(args.green), _range(args.red), 40, 150)
+
+    started = time.perf_counter()
+    evaluate_plans(counts, args.window, green, red, cross)
+    single = time.perf_counter() - started
+    started = time.perf_counter()
+    evaluate_parallel(counts, args.window, green, red, cross, workers=args.workers)
+    parallel = time.perf_counter() - started
+
+    rows = list(generate_rows(args.rows_duration, lanes=args.lanes, vehicles_per_second=5, seed=args.seed))
+    counter = ArrivalCounter(args.window)
+    started = time.perf_counter()
+    for row in rows:
+        counter.add(row)
+    counter.result()
+    counting = time.perf_counter() - started
+
+    print(json.dumps({
+        'windows': windows,
+        'lanes': args.lanes,
+        'plans': int(green.size),
+        'single_s': single,
+        'plans_per_s': green.size / single,
+        'workers': args.workers,
+        'parallel_s': parallel,
+        'parallel_plans_per_s': green.size / parallel,
+        'arrival_rows': len(rows),
+        'arrival_rows_per_s': len(rows) / counting,
+    }, indent=4))
+
+
+if __name__ == '__main__':
+    main()
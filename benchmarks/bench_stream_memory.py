@@ -0,0 +1,80 @@
+"""
+Сравнение пикового потребления памяти: json.load всего файла против
+потокового чтения export_stream.iter_rows на синтетической выгрузке.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_stream_memory --size-gb 2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import duration_for_size, write_export
+
+# Каждый режим запускается в отдельном процессе, чтобы ru_maxrss
+# отражал пик именно этого режима.
+_CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+import main
+from export_stream import iter_rows
+started = time.perf_counter()
+if {mode!r} == 'json_load':
+    intervals, lanes = main.process_data(main.load_data({path!r}))
+else:
+    intervals, lanes = main.group_rows(iter_rows({path!r}))
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    'seconds': len(intervals),
+    'elapsed_s': elapsed,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_mode(mode: str, path: str) -> dict:
+    code = _CHILD.format(root=ROOT, mode=mode, path=path)
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr else f'exit {proc.returncode}'}
+    return json.loads(proc.stdout)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-gb', type=float, default=2.0, help='желаемый размер выгрузки, ГБ')
+    parser.add_argument('--file', help='готовая выгрузка вместо генерации')
+    parser.add_argument('--skip-json-load', action='store_true',
+                        help='не запускать json.load (на больших файлах может не хватить памяти)')
+    args = parser.parse_args()
+
+    path = args.file
+    tmp = None
+    if path is None:
+        tmp = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        tmp.close()
+        path = tmp.name
+        duration = duration_for_size(int(args.size_gb * (1 << 30)))
+        started = time.perf_counter()
+        rows = write_export(path, duration)
+        print(f"Сгенерировано {rows} строк за {duration} с выгрузки "
+              f"({os.path.getsize(path) / (1 << 20):.0f} МБ) за {time.perf_counter() - started:.1f} с")
+
+    try:
+        modes = ['stream'] if args.skip_json_load else ['stream', 'json_load']
+        results = {mode: run_mode(mode, path) for mode in modes}
+        results['file_mb'] = os.path.getsize(path) / (1 << 20)
+        print(json.dumps(results, indent=4, ensure_ascii=False))
+    finally:
+        if tmp is not None:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Микро-бенчмарк разбора отметок времени строк выгрузки: datetime.strptime
+против кэширующего пути timestamps.epoch_second и векторного datetime64.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_timestamps --seconds 3600
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+import timestamps
+from benchmarks.synthetic import generate_rows
+
+
+def strptime_path(time_strs):
+    """Прежний путь main.process_data: strptime и обнуление микросекунд."""
+    return [datetime.strptime(s, timestamps.TIME_FORMAT).replace(microsecond=0) for s in time_strs]
+
+
+def best_of(func, arg, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        timestamps._second_cache.clear()
+        started = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=int, default=3600, help='длительность синтетической выгрузки')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    time_strs = [row['time'] for row in generate_rows(args.seconds)]
+    expected = [int((dt - datetime(1970, 1, 1)).total_seconds()) for dt in strptime_path(time_strs)]
+    if timestamps.epoch_seconds(time_strs) != expected:
+        raise SystemExit("Быстрый разбор расходится со strptime")
+
+    paths = {
+        'strptime': strptime_path,
+        'epoch_second': lambda strs: [timestamps.epoch_second(s) for s in strs],
+        'epoch_seconds': timestamps.epoch_seconds,
+        'datetime64': timestamps.epoch_seconds_datetime64,
+    }
+    results = {name: best_of(func, time_strs, args.repeat) for name, func in paths.items()}
+    report = {'rows': len(time_strs)}
+    for name, elapsed in results.items():
+        report[name] = {
+            'elapsed_s': elapsed,
+            'rows_per_s': len(time_strs) / elapsed,
+            'speedup': results['strptime'] / elapsed,
+        }
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Скорость сборки траекторий (строк/сек) и пиковая память TrajectoryTracker
+на синтетическом потоке строк разной длительности: при закрытии треков по
+таймауту память зависит от числа одновременно открытых треков, а не от
+длины выгрузки.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_trajectories --duration 600 --vehicles-per-second 20
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_rows
+from trajectories import TrajectoryTracker
+
+
+def run(duration: int, args) -> dict:
+    rows = list(generate_rows(duration, lanes=args.lanes, vehicles_per_second=args.vehicles_per_second,
+                              dwell_s=args.dwell, seed=args.seed))
+    tracker = TrajectoryTracker(timeout=args.timeout)
+    add = tracker.add
+
+    started = time.perf_counter()
+    for row in rows:
+        add(row)
+    tracker.flush()
+    elapsed = time.perf_counter() - started
+
+    # Память меряется отдельным проходом: tracemalloc заметно замедляет Python
+    tracker = TrajectoryTracker(timeout=args.timeout)
+    tracemalloc.start()
+    for row in rows:
+        tracker.add(row)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'duration_s': duration,
+        'rows': len(rows),
+        'tracks': tracker.stats['tracks'] + len(tracker.open),
+        'max_open_tracks': tracker.stats['max_open'],
+        'elapsed_s': elapsed,
+        'rows_per_s': len(rows) / elapsed,
+        'peak_tracker_kb': peak / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=int, default=600, help='длительность короткого потока, сек')
+    parser.add_argument('--scale', type=int, default=4, help='во сколько раз длиннее второй поток')
+    parser.add_argument('--vehicles-per-second', type=float, default=20.0)
+    parser.add_argument('--lanes', type=int, default=6)
+    parser.add_argument('--dwell', type=int, default=20, help='сколько секунд машина в зоне')
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = {
+        'short': run(args.duration, args),
+        'long': run(args.duration * args.scale, args),
+    }
+    report['memory_ratio'] = report['long']['peak_tracker_kb'] / report['short']['peak_tracker_kb']
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
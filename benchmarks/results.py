@@ -0,0 +1,116 @@
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+# Общие части отчётов бенчмарков: перцентили задержек, пиковая память,
+# сведения о запуске и сравнение с эталонным отчётом.
+#
+# Отчёт — JSON; история запусков — JSON Lines (по отчёту на строку), чтобы
+# регрессии было видно по коммитам. При сравнении величины с суффиксом
+# '_per_s' считаются «больше — лучше», с суффиксами '_ms', '_s', '_mb' —
+# «меньше — лучше»; остальные числа не сравниваются.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HIGHER_IS_BETTER = ('_per_s',)
+LOWER_IS_BETTER = ('_ms', '_s', '_mb')
+
+
+def latency_summary(samples_s: Iterable[float]) -> Dict[str, float]:
+    """Сводка задержек в миллисекундах: число, среднее, p50, p99, максимум."""
+    values = sorted(samples_s)
+    if not values:
+        return {'count': 0}
+
+    def percentile(q: float) -> float:
+        # Метод ближайшего ранга
+        index = min(len(values), max(1, math.ceil(q * len(values)))) - 1
+        return values[index] * 1000
+
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) * 1000,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'max_ms': values[-1] * 1000,
+    }
+
+
+def peak_rss_mb(children: bool = False) -> float:
+    """Пиковая память процесса (или его завершившихся дочерних процессов), МБ."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss — в килобайтах в Linux и в байтах в macOS
+    return usage.ru_maxrss / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+
+
+def run_metadata() -> Dict[str, Any]:
+    """Сведения о запуске: время, коммит, версия Python, машина."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def save_report(report: Dict[str, Any], output: Optional[str] = None, history: Optional[str] = None) -> None:
+    """Сохраняет отчёт в output и дописывает его строкой в history (JSON Lines)."""
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+    if history:
+        with open(history, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report, ensure_ascii=False) + '\n')
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    """Отчёт из JSON-файла или последний отчёт из истории JSON Lines."""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(text.strip().splitlines()[-1])
+
+
+def _flatten(value: Any, prefix: str = '') -> Dict[str, float]:
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f'{prefix}.{key}' if prefix else str(key)))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.1) -> List[Dict[str, Any]]:
+    """Величины отчёта current, ухудшившиеся относительно baseline больше чем на tolerance."""
+    old = _flatten(baseline.get('stages', baseline))
+    new = _flatten(current.get('stages', current))
+    regressions = []
+    for name, value in new.items():
+        before = old.get(name)
+        if not before:
+            continue
+        change = (value - before) / abs(before)
+        if name.endswith(HIGHER_IS_BETTER):
+            worse = change < -tolerance
+        elif name.endswith(LOWER_IS_BETTER):
+            worse = change > tolerance
+        else:
+            continue
+        if worse:
+            regressions.append({'metric': name, 'baseline': before, 'current': value, 'change': change})
+    return regressions
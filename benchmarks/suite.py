@@ -0,0 +1,242 @@
+"""
+Сквозной набор бенчмарков с машиночитаемым отчётом.
+
+Этапы (каждый — в отдельном процессе, чтобы пиковая память была своей):
+  batch — синтетические выгрузки нескольких перекрёстков через пакетный
+          расчёт main.py (процессы, как в обычном запуске);
+  redis — JsonIngestor из main/utils.py: файл объектов, в котором на каждом
+          тике меняется часть скоростей, и чтение агрегатов; нужен Redis
+          (отдельная база --redis-db, непустая база не используется);
+  ws    — много клиентов WebSocket ws/test/ (benchmarks/ws_load.py); нужен
+          запущенный сервер, этап пропускается без --ws-url.
+
+Отчёт — JSON (--output) и строка в истории JSON Lines (--history). С
+--baseline отчёт сравнивается с эталоном (файлом отчёта или последней строкой
+истории), и при ухудшении больше --tolerance процесс завершается с кодом 1.
+
+Запуск из корня репозитория:
+    python -m benchmarks.suite --stages batch redis --output bench.json --history bench_history.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.results import ROOT, compare, latency_summary, load_report, peak_rss_mb, run_metadata, save_report
+from benchmarks.synthetic import write_intersections
+
+STAGES = ('batch', 'redis', 'ws')
+
+
+def stage_batch(args) -> dict:
+    import main as pipeline
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = os.path.join(tmp, 'input')
+        output_dir = os.path.join(tmp, 'output')
+        summary_file = os.path.join(tmp, 'summary.json')
+        paths = write_intersections(input_dir, args.intersections, args.duration, seed=args.seed,
+                                    lanes=args.lanes, vehicles_per_second=args.vehicles_per_second)
+        size_mb = sum(os.path.getsize(path) for path in paths) / (1 << 20)
+
+        started = time.perf_counter()
+        pipeline.main(['--input-dir', input_dir, '--output-dir', output_dir, '--latest-output', '',
+                       '--workers', str(args.workers), '--engine', args.engine, '--no-cache',
+                       '--summary-json', summary_file])
+        wall = time.perf_counter() - started
+        with open(summary_file, 'r', encoding='utf-8') as f:
+            files = json.load(f)['files']
+
+    failed = [report for report in files if 'error' in report]
+    rows = sum(report.get('rows', 0) for report in files)
+    # Время этапов (чтение и группировка, метрики, сохранение), суммарно по файлам
+    stages = {}
+    for report in files:
+        for stage, elapsed in report.get('stages', {}).items():
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+    return {
+        'files': len(files),
+        'failed': len(failed),
+        'rows': rows,
+        'input_mb': size_mb,
+        'wall_s': wall,
+        'rows_per_s': rows / wall,
+        'input_mb_per_s': size_mb / wall,
+        'file': latency_summary(report['elapsed_s'] for report in files if 'error' not in report),
+        'stages': stages,
+        'peak_rss_mb': peak_rss_mb(),
+        'workers_peak_rss_mb': peak_rss_mb(children=True),
+    }
+
+
+def _write_objects(path: str, objects: list) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(objects, f)
+    # Тики идут чаще, чем меняется mtime на грубых ФС: сдвигаем его явно
+    stat = os.stat(path)
+    bumped = max(stat.st_mtime_ns, _write_objects.last_ns + 1)
+    os.utime(path, ns=(bumped, bumped))
+    _write_objects.last_ns = bumped
+
+
+_write_objects.last_ns = 0
+
+
+def stage_redis(args) -> dict:
+    import redis
+
+    sys.path.insert(0, os.path.join(ROOT, 'MFOTS'))
+    from MFOTS.env_config import CONFIG
+    from main import utils
+
+    client = redis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=args.redis_db)
+    if client.dbsize():
+        raise SystemExit(f"База Redis {args.redis_db} не пуста, выберите другую через --redis-db")
+    utils.redis_client = client
+
+    rnd = random.Random(args.seed)
+    objects = [{'id': i, 'lane': i % args.lanes, 'obj_speed': round(rnd.uniform(0, 16), 2)}
+               for i in range(args.objects)]
+    changed_per_tick = max(1, int(args.objects * args.change_fraction))
+    ingest, read = [], []
+    written = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'objects.json')
+        ingestor = utils.JsonIngestor(path)
+        try:
+            for tick in range(args.ticks + 1):
+                if tick:
+                    for item in rnd.sample(objects, changed_per_tick):
+                        item['obj_speed'] = round(rnd.uniform(0, 16), 2)
+                _write_objects(path, objects)
+
+                started = time.perf_counter()
+                changed, _ = ingestor.run_once()
+                elapsed = time.perf_counter() - started
+                # Первый тик — начальная загрузка всех объектов, в задержки тиков не входит
+                if tick:
+                    ingest.append(elapsed)
+                    written += changed
+
+                started = time.perf_counter()
+                utils.calculate_formulas()
+                utils.calculate_lane_speeds()
+                read.append(time.perf_counter() - started)
+        finally:
+            client.flushdb()
+
+    return {
+        'objects': args.objects,
+        'changed_per_tick': changed_per_tick,
+        'ingest': latency_summary(ingest),
+        'changed_objects_per_s': written / sum(ingest) if ingest else 0.0,
+        'read': latency_summary(read),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def stage_ws(args) -> dict:
+    from benchmarks.ws_load import read_server_peak_mb, run_ws_load
+
+    if not args.ws_url:
+        return {'skipped': "не указан --ws-url"}
+    report = asyncio.run(run_ws_load(args.ws_url, args.clients, args.ws_duration,
+                                     connect_concurrency=args.connect_concurrency))
+    report['peak_rss_mb'] = peak_rss_mb()
+    if args.server_pid:
+        report['server_peak_mb'] = read_server_peak_mb(args.server_pid)
+    return report
+
+
+STAGE_FUNCS = {'batch': stage_batch, 'redis': stage_redis, 'ws': stage_ws}
+
+
+def run_stage(stage: str, argv: list) -> dict:
+    """Запускает этап в отдельном процессе и возвращает его отчёт."""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+        result_file = tmp.name
+    try:
+        proc = subprocess.run([sys.executable, '-m', 'benchmarks.suite', *argv,
+                               '--child', stage, '--child-output', result_file],
+                              cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            lines = (proc.stderr or proc.stdout).strip().splitlines()
+            return {'error': lines[-1] if lines else f'exit {proc.returncode}'}
+        with open(result_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_file)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--output', help='сохранить отчёт в JSON')
+    parser.add_argument('--history', help='дописать отчёт в историю JSON Lines')
+    parser.add_argument('--baseline', help='эталонный отчёт (JSON или история JSON Lines)')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='допустимое ухудшение, доля')
+    parser.add_argument('--seed', type=int, default=0)
+
+    batch = parser.add_argument_group('batch')
+    batch.add_argument('--intersections', type=int, default=4)
+    batch.add_argument('--duration', type=int, default=900, help='длительность выгрузки, сек')
+    batch.add_argument('--lanes', type=int, default=6)
+    batch.add_argument('--vehicles-per-second', type=float, default=2.0)
+    batch.add_argument('--workers', type=int, default=os.cpu_count())
+    batch.add_argument('--engine', choices=('python', 'numpy'), default='numpy')
+
+    redis_group = parser.add_argument_group('redis')
+    redis_group.add_argument('--objects', type=int, default=50_000)
+    redis_group.add_argument('--change-fraction', type=float, default=0.1, help='доля объектов, меняемых за тик')
+    redis_group.add_argument('--ticks', type=int, default=50)
+    redis_group.add_argument('--redis-db', type=int, default=15)
+
+    ws = parser.add_argument_group('ws')
+    ws.add_argument('--ws-url', help='например ws://localhost:9000/ws/test/')
+    ws.add_argument('--clients', type=int, default=500)
+    ws.add_argument('--ws-duration', type=float, default=30)
+    ws.add_argument('--connect-concurrency', type=int, default=100)
+    ws.add_argument('--server-pid', type=int, help='pid сервера для пиковой памяти (Linux)')
+
+    parser.add_argument('--child', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+
+    if args.child:
+        result = STAGE_FUNCS[args.child](args)
+        with open(args.child_output, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    params = {key: value for key, value in vars(args).items()
+              if key not in ('output', 'history', 'baseline', 'child', 'child_output', 'server_pid')}
+    report = {'meta': run_metadata(), 'params': params, 'stages': {}}
+    for stage in args.stages:
+        print(f"Этап {stage}...", file=sys.stderr)
+        report['stages'][stage] = run_stage(stage, argv)
+
+    exit_code = 0
+    if args.baseline:
+        baseline = load_report(args.baseline)
+        if baseline.get('params') != params:
+            print("Параметры эталона отличаются, сравнение может быть некорректным", file=sys.stderr)
+        report['regressions'] = compare(baseline, report, args.tolerance)
+        exit_code = 1 if report['regressions'] else 0
+
+    save_report(report, args.output, args.history)
+    print(json.dumps(report, indent=4, ensure_ascii=False))
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import random
+import uuid as uuid_lib
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Any
+
+# Генератор синтетических выгрузок в формате датчиков (objects/rows_data).
+# Файл пишется потоково, поэтому можно получать выгрузки любого размера.
+#
+# Запуск из корня репозитория:
+#     python -m benchmarks.synthetic export.json --duration 3600 --lanes 6 --vehicles-per-second 2
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_START = datetime(2025, 3, 20, 17, 35, 0)
+
+# Примерный размер одной строки rows_data в байтах (для подбора длительности)
+APPROX_ROW_BYTES = 190
+
+
+def generate_rows(duration_s: int, lanes: int = 6, vehicles_per_second: float = 1.0,
+                  reports_per_second: int = 10, dwell_s: int = 20,
+                  start: datetime = DEFAULT_START, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Отдаёт строки rows_data в порядке времени.
+
+    Каждую секунду на случайных полосах появляется в среднем
+    vehicles_per_second машин; каждая машина находится в зоне dwell_s секунд
+    и сообщает о себе reports_per_second раз в секунду.
+    """
+    rnd = random.Random(seed)
+    active: List[Dict[str, Any]] = []
+    obj_id = 0
+    step_ms = 1000 // reports_per_second
+
+    for second in range(duration_s):
+        # Новые машины за эту секунду
+        arrivals = int(vehicles_per_second)
+        if rnd.random() < vehicles_per_second - arrivals:
+            arrivals += 1
+        for _ in range(arrivals):
+            obj_id += 1
+            active.append({
+                'uuid': str(uuid_lib.UUID(int=rnd.getrandbits(128), version=4)),
+                'obj_id': obj_id,
+                'lane': rnd.randrange(lanes),
+                'x': rnd.uniform(-5.0, 5.0),
+                'y': 0.0,
+                'speed': rnd.uniform(0.0, 16.0),
+                'left': dwell_s,
+            })
+
+        base = (start + timedelta(seconds=second)).strftime(TIME_FORMAT)
+        for tick in range(reports_per_second):
+            time_str = f"{base}.{tick * step_ms:03d}"
+            for vehicle in active:
+                vehicle['y'] += vehicle['speed'] / reports_per_second
+                yield {
+                    'uuid': vehicle['uuid'],
+                    'obj_id': vehicle['obj_id'],
+                    'time': time_str,
+                    'lane': vehicle['lane'],
+                    'point_x': round(vehicle['x'], 2),
+                    'point_y': round(vehicle['y'], 2),
+                    'obj_speed': round(vehicle['speed'], 2),
+                    'class': 1,
+                }
+
+        for vehicle in active:
+            vehicle['left'] -= 1
+        active = [vehicle for vehicle in active if vehicle['left'] > 0]
+
+
+def write_export(file_path: str, duration_s: int, **kwargs) -> int:
+    """Пишет синтетическую выгрузку в файл. Возвращает число строк rows_data."""
+    count = 0
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('{"objects": [{"name": "OBJECTS", "rows_data": [\n')
+        for row in generate_rows(duration_s, **kwargs):
+            if count:
+                f.write(',\n')
+            f.write(json.dumps(row))
+            count += 1
+        f.write('\n]}]}\n')
+    return count
+
+
+def duration_for_size(size_bytes: int, vehicles_per_second: float = 1.0,
+                      reports_per_second: int = 10, dwell_s: int = 20) -> int:
+    """Подбирает длительность выгрузки (сек) под желаемый размер файла."""
+    rows_per_second = vehicles_per_second * dwell_s * reports_per_second
+    return max(1, int(size_bytes / (rows_per_second * APPROX_ROW_BYTES)))
+
+
+def write_intersections(output_dir: str, count: int, duration_s: int, seed: int = 0, **kwargs) -> List[str]:
+    """Пишет выгрузки count перекрёстков (разные seed) в output_dir. Возвращает пути."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(output_dir, f'intersection_{i + 1:03d}.json')
+        write_export(path, duration_s, seed=seed + i, **kwargs)
+        paths.append(path)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Генератор синтетических выгрузок перекрёстков (objects/rows_data).")
+    parser.add_argument('output', help='файл выгрузки или, при --intersections > 1, папка')
+    parser.add_argument('--duration', type=int, default=3600, help='длительность, сек')
+    parser.add_argument('--size-mb', type=float, help='подобрать длительность под размер файла')
+    parser.add_argument('--intersections', type=int, default=1)
+    parser.add_argument('--lanes', type=int, default=6)
+    parser.add_argument('--vehicles-per-second', type=float, default=1.0)
+    parser.add_argument('--reports-per-second', type=int, default=10)
+    parser.add_argument('--dwell', type=int, default=20, help='сколько секунд машина в зоне')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    duration = args.duration
+    if args.size_mb is not None:
+        duration = duration_for_size(int(args.size_mb * (1 << 20)), args.vehicles_per_second,
+                                     args.reports_per_second, args.dwell)
+    kwargs = dict(lanes=args.lanes, vehicles_per_second=args.vehicles_per_second,
+                  reports_per_second=args.reports_per_second, dwell_s=args.dwell)
+    if args.intersections > 1:
+        paths = write_intersections(args.output, args.intersections, duration, seed=args.seed, **kwargs)
+        print(f"Записано {len(paths)} выгрузок по {duration} с в {args.output}")
+    else:
+        rows = write_export(args.output, duration, seed=args.seed, **kwargs)
+        print(f"Записано {rows} строк ({duration} с) в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Нагрузка на WebSocket ws/test/: много одновременных клиентов в одном
+процессе (asyncio, библиотека websockets).
+
+Каждый клиент подключается, при необходимости подписывается на перекрёстки и
+полосы (сообщение {"action": "subscribe", ...}, см. main/consumers.py) и
+принимает кадры рассылки duration секунд. В отчёте:
+  connect      — установка соединения;
+  first_frame  — от начала подключения до первого кадра;
+  subscribe    — от подписки до первого кадра подписанного ключа;
+  fanout       — отставание кадра (ключ, seq) у клиента от самого раннего
+                 получения того же кадра другими клиентами;
+  interval     — промежутки между кадрами ключа 'all' у клиента (ровность тиков).
+
+Нужен запущенный сервер (Daphne). Запуск из корня репозитория:
+    python -m benchmarks.ws_load --url ws://localhost:9000/ws/test/ --clients 500 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from benchmarks.results import latency_summary
+
+CONNECT_TIMEOUT = 30.0
+
+
+def read_server_peak_mb(pid: int) -> Optional[float]:
+    """Пиковая память процесса сервера по /proc (Linux), МБ."""
+    try:
+        with open(f'/proc/{pid}/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+async def _client(url: str, deadline: float, subscribe: Optional[Dict[str, Any]], stats: Dict[str, Any],
+                  arrivals: Dict[tuple, List[float]], gate: asyncio.Semaphore) -> None:
+    import websockets
+
+    async with gate:
+        started = time.perf_counter()
+        try:
+            ws = await websockets.connect(url, open_timeout=CONNECT_TIMEOUT, max_size=None)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+            stats['errors'] += 1
+            return
+        stats['connect'].append(time.perf_counter() - started)
+
+    subscribed_keys = set()
+    subscribe_sent = None
+    if subscribe:
+        subscribed_keys = {f'intersection:{i}' for i in subscribe.get('intersections', [])}
+        subscribed_keys |= {f'lane:{i}' for i in subscribe.get('lanes', [])}
+        subscribe_sent = time.perf_counter()
+        await ws.send(json.dumps(dict(subscribe, action='subscribe')))
+
+    first = True
+    last_global = None
+    try:
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(ws.recv(), remaining)
+            except asyncio.TimeoutError:
+                break
+            now = time.perf_counter()
+            stats['frames'] += 1
+            stats['bytes'] += len(message)
+            if first:
+                stats['first_frame'].append(now - started)
+                first = False
+            frame = json.loads(message)
+            key = frame.get('key')
+            if frame.get('type') == 'error' or key is None:
+                stats['error_frames'] += 1
+                continue
+            arrivals[(key, frame.get('seq'))].append(now)
+            if key in subscribed_keys:
+                stats['subscribe'].append(now - subscribe_sent)
+                subscribed_keys.clear()
+            if key == 'all':
+                if last_global is not None:
+                    stats['interval'].append(now - last_global)
+                last_global = now
+    except websockets.WebSocketException:
+        stats['errors'] += 1
+    finally:
+        await ws.close()
+
+
+async def run_ws_load(url: str, clients: int, duration: float, subscribe: Optional[Dict[str, Any]] = None,
+                      connect_concurrency: int = 100) -> Dict[str, Any]:
+    """Запускает clients клиентов на duration секунд (после подключения всех). Возвращает отчёт."""
+    stats: Dict[str, Any] = {'frames': 0, 'bytes': 0, 'errors': 0, 'error_frames': 0,
+                             'connect': [], 'first_frame': [], 'subscribe': [], 'interval': []}
+    arrivals: Dict[tuple, List[float]] = defaultdict(list)
+    gate = asyncio.Semaphore(connect_concurrency)
+    started = time.perf_counter()
+    # Срок отсчитывается от старта: подключение медленных клиентов съедает их время приёма
+    deadline = started + duration
+    await asyncio.gather(*(_client(url, deadline, subscribe, stats, arrivals, gate) for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    fanout = [t - min(times) for times in arrivals.values() if len(times) > 1 for t in times]
+    return {
+        'clients': clients,
+        'connected': len(stats['connect']),
+        'errors': stats['errors'],
+        'error_frames': stats['error_frames'],
+        'frames': stats['frames'],
+        'frames_per_s': stats['frames'] / elapsed,
+        'received_mb_per_s': stats['bytes'] / elapsed / (1 << 20),
+        'connect': latency_summary(stats['connect']),
+        'first_frame': latency_summary(stats['first_frame']),
+        'subscribe': latency_summary(stats['subscribe']),
+        'fanout': latency_summary(fanout),
+        'interval': latency_summary(stats['interval']),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='ws://localhost:9000/ws/test/')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--intersections', type=int, nargs='*', default=[], help='подписаться на перекрёстки')
+    parser.add_argument('--lanes', type=int, nargs='*', default=[], help='подписаться на полосы')
+    parser.add_argument('--connect-concurrency', type=int, default=100)
+    parser.add_argument('--server-pid', type=int, help='pid сервера для пиковой памяти (Linux)')
+    args = parser.parse_args()
+
+    subscribe = None
+    if args.intersections or args.lanes:
+        subscribe = {'intersections': args.intersections, 'lanes': args.lanes}
+    report = asyncio.run(run_ws_load(args.url, args.clients, args.duration, subscribe, args.connect_concurrency))
+    if args.server_pid:
+        report['server_peak_mb'] = read_server_peak_mb(args.server_pid)
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
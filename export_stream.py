@@ -0,0 +1,312 @@
+import io
+import json
+import mmap
+import re
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+# Потоковое чтение выгрузки датчиков вида
+# {"objects": [{"name": "OBJECTS", "rows_data": [{...}, ...]}, ...]}.
+# Файл читается кусками, а каждая строка rows_data декодируется отдельно
+# через json.JSONDecoder.raw_decode, поэтому в памяти одновременно находится
+# только текущий кусок файла и текущая строка, а не вся выгрузка.
+
+CHUNK_SIZE = 1 << 20  # символов за одно чтение
+DEFAULT_BATCH_SIZE = 10_000
+
+ROW_SEARCH_WINDOW = 1 << 16  # байт, в которых ищется начало строки (find_row_start)
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Содержимое массива плоских строк до закрывающей ']': строки JSON
+# пропускаются целиком, '[' вне строк (вложенный массив) не допускается
+_FLAT_ARRAY = re.compile(rb'[^"\[\]]*+(?:"[^"\\]*+(?:\\.[^"\\]*+)*+"[^"\[\]]*+)*+\]', re.S)
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Буфер поверх текстового файла с дочитыванием по мере разбора."""
+
+    def __init__(self, f: TextIO, chunk_size: int = CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0  # позиция начала buf в файле
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """Дочитывает следующий кусок файла. Возвращает False на конце файла."""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Отбрасываем уже разобранную часть буфера
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def tell(self) -> int:
+        """Позиция следующего символа от начала файла."""
+        return self.offset + self.pos
+
+    def seek(self, offset: int) -> None:
+        """Продолжает разбор с позиции offset файла."""
+        self.f.seek(offset)
+        self.buf = ''
+        self.pos = 0
+        self.offset = offset
+        self.eof = False
+
+    def peek(self) -> str:
+        """Возвращает следующий значащий символ, пропуская пробелы."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Неожиданный конец JSON-файла")
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Ожидался символ {char!r}, найден {found!r} (позиция {self.pos})")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Декодирует одно JSON-значение, при необходимости дочитывая файл."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Число на границе куска могло быть прочитано не полностью
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def members(self, close: str) -> Iterator[None]:
+        """Итерирует элементы объекта или массива до закрывающей скобки."""
+        if self.peek() == close:
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == close:
+                return
+            if char != ',':
+                raise ValueError(f"Ожидался ',' или {close!r}, найден {char!r} (позиция {self.pos - 1})")
+
+
+def _iter_object_rows(reader: _Reader, object_name: str) -> Iterator[Dict[str, Any]]:
+    """Разбирает один элемент списка objects и отдаёт его строки rows_data."""
+    name: Optional[str] = None
+    # Строки, встреченные раньше поля name: их судьбу можно решить только после него
+    pending: List[Dict[str, Any]] = []
+
+    reader.expect('{')
+    for _ in reader.members('}'):
+        key = reader.value()
+        reader.expect(':')
+        if key == 'rows_data':
+            reader.expect('[')
+            for _ in reader.members(']'):
+                row = reader.value()
+                if name is None:
+                    pending.append(row)
+                elif name == object_name:
+                    yield row
+        elif key == 'name':
+            name = reader.value()
+        else:
+            reader.value()
+
+        if name is not None and pending:
+            if name == object_name:
+                yield from pending
+            pending = []
+
+
+def iter_rows_from_stream(f: TextIO, object_name: str = 'OBJECTS',
+                          chunk_size: int = CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Отдаёт строки rows_data объектов с заданным именем из открытого файла."""
+    reader = _Reader(f, chunk_size)
+    reader.expect('{')
+    for _ in reader.members('}'):
+        key = reader.value()
+        reader.expect(':')
+        if key != 'objects':
+            reader.value()
+            continue
+        reader.expect('[')
+        for _ in reader.members(']'):
+            yield from _iter_object_rows(reader, object_name)
+
+
+def iter_rows(file_path: str, object_name: str = 'OBJECTS') -> Iterator[Dict[str, Any]]:
+    """Построчно читает rows_data из JSON-файла выгрузки, не загружая его целиком."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        yield from iter_rows_from_stream(f, object_name)
+
+
+def iter_rows_from_offset(file_path: str, offset: int) -> Iterator[Dict[str, Any]]:
+    """
+    Отдаёт строки массива rows_data, начиная с байтового смещения offset,
+    указывающего на начало строки (см. find_row_start), и до конца массива.
+    """
+    with open(file_path, 'rb') as raw:
+        raw.seek(offset)
+        with io.TextIOWrapper(raw, encoding='utf-8') as f:
+            reader = _Reader(f)
+            while True:
+                yield reader.value()
+                char = reader.peek()
+                reader.pos += 1
+                if char == ']':
+                    return
+                if char != ',':
+                    raise ValueError(f"Ожидался ',' или ']', найден {char!r}")
+
+
+def _is_row(text: bytes) -> Optional[Dict[str, Any]]:
+    try:
+        row = json.loads(text)
+    except ValueError:
+        return None
+    if isinstance(row, dict) and 'time' in row and 'uuid' in row:
+        return row
+    return None
+
+
+def find_row_start(file_path: str, offset: int,
+                   window: int = ROW_SEARCH_WINDOW) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """
+    Ищет начало первой строки rows_data на байтовом смещении offset или после него.
+    Строки выгрузки — плоские объекты, поэтому кандидатом считается '{', за которым
+    следует '}' без вложенных '{' и '['. Возвращает смещение и саму строку или None.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(window)
+    pos = data.find(b'{')
+    while pos != -1:
+        end = data.find(b'}', pos)
+        if end == -1:
+            return None
+        candidate = data[pos:end + 1]
+        if b'{' not in candidate[1:] and b'[' not in candidate:
+            row = _is_row(candidate)
+            if row is not None:
+                return offset + pos, row
+        pos = data.find(b'{', pos + 1)
+    return None
+
+
+class _Latin1File:
+    """Двоичный файл как текст latin-1: позиции символов совпадают с байтовыми."""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def read(self, size: int) -> str:
+        return self.raw.read(size).decode('latin-1')
+
+    def seek(self, offset: int) -> None:
+        self.raw.seek(offset)
+
+
+def _flat_array_end(data, start: int) -> Optional[int]:
+    """Смещение ']' массива плоских строк, начинающегося в start; None — массив другого вида."""
+    match = _FLAT_ARRAY.match(data, start)
+    return match.end() - 1 if match else None
+
+
+def _rows_array_span(file_path: str, object_name: str) -> Optional[Tuple[int, int]]:
+    span = None
+    with open(file_path, 'rb') as raw, mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        # Структура выгрузки — ASCII, поэтому latin-1 не нарушает разбор
+        reader = _Reader(_Latin1File(raw))
+        reader.expect('{')
+        for _ in reader.members('}'):
+            key = reader.value()
+            reader.expect(':')
+            if key != 'objects':
+                reader.value()
+                continue
+            reader.expect('[')
+            for _ in reader.members(']'):
+                name = None
+                reader.expect('{')
+                for _ in reader.members('}'):
+                    key = reader.value()
+                    reader.expect(':')
+                    if key == 'name':
+                        name = reader.value()
+                        if name == object_name and span is not None:
+                            return None
+                    elif key == 'rows_data':
+                        if name is None:
+                            return None
+                        reader.expect('[')
+                        start = reader.tell()
+                        end = _flat_array_end(data, start)
+                        if end is None:
+                            if name == object_name:
+                                return None
+                            # Массив другого объекта разбирается обычным способом
+                            reader.seek(start - 1)
+                            reader.value()
+                            continue
+                        if name == object_name:
+                            last = end
+                            while last > start and data[last - 1] in b' \t\r\n':
+                                last -= 1
+                            span = (start, last)
+                        reader.seek(end + 1)
+                    else:
+                        reader.value()
+    return span
+
+
+def rows_array_span(file_path: str, object_name: str = 'OBJECTS') -> Optional[Tuple[int, int]]:
+    """
+    Байтовые границы строк rows_data объекта object_name: от позиции сразу
+    за '[' до позиции сразу за последней строкой. None, если такой объект не
+    один, его поле name идёт после rows_data или массив содержит не плоские
+    строки: такие файлы нельзя читать кусками с произвольного смещения.
+    Массивы rows_data других объектов пропускаются без разбора строк.
+    """
+    try:
+        return _rows_array_span(file_path, object_name)
+    except ValueError:
+        # Испорченный JSON или пустой файл (mmap пустого файла невозможен)
+        return None
+
+
+def rows_array_end(file_path: str) -> Optional[int]:
+    """
+    Байтовое смещение сразу за последней строкой rows_data объекта OBJECTS
+    (см. rows_array_span), иначе None.
+    """
+    span = rows_array_span(file_path)
+    return span[1] if span is not None else None
+
+
+def iter_row_batches(file_path: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                     object_name: str = 'OBJECTS') -> Iterator[List[Dict[str, Any]]]:
+    """Читает rows_data пачками фиксированного размера (последняя может быть меньше)."""
+    batch = []
+    for row in iter_rows(file_path, object_name):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -1,11 +1,19 @@
+import argparse
 import json
-from datetime import datetime, timedelta
+import logging
 from collections import defaultdict
-from typing import Dict, Tuple, Set, List, Any
+from contextlib import contextmanager
+from typing import Dict, Tuple, Set, List, Any, Iterable, Iterator, Optional
 import os
+import shutil
+import time
 
 import glob
 
+from export_stream import iter_rows
+from timestamps import epoch_second, format_second
+
+logger = logging.getLogger('batch')
 
 
 def load_data(file_path: str) -> dict:
@@ -15,49 +23,73 @@ def load_data(file_path: str) -> dict:
     return data
 
 
-def process_data(data: dict) -> Tuple[Dict[datetime, Dict[int, Set[str]]], Set[int]]:
+def iter_data_rows(data: dict) -> Iterable[Dict[str, Any]]:
+    """Отдаёт строки rows_data объектов 'OBJECTS' из уже загруженных данных."""
+    for obj in data['objects']:
+        if obj['name'] == 'OBJECTS':
+            yield from obj['rows_data']
+
+
+def group_rows(rows: Iterable[Dict[str, Any]]) -> Tuple[Dict[int, Dict[int, Set[str]]], Set[int]]:
     """
-    Группирует данные по временным интервалам (с точностью до секунды)
-    и полосам. Возвращает словарь группировок и множество всех полос.
+    Группирует строки по временным интервалам (с точностью до секунды)
+    и полосам. Строки могут поступать потоком, по одной.
+    Интервалы задаются целыми секундами эпохи.
+    Возвращает словарь группировок и множество всех полос.
     """
     time_lane_intervals = defaultdict(lambda: defaultdict(set))
     all_lanes = set()
 
-    for obj in data['objects']:
-        if obj['name'] == 'OBJECTS':
-            for row in obj['rows_data']:
-                time_str = row['time']
-                lane = row['lane']
-                uuid = row['uuid']
-                time_obj = datetime.strptime(time_str, '%Y-%m-%d %H:%M:%S.%f')
-                time_interval = time_obj.replace(microsecond=0)
-                time_lane_intervals[time_interval][lane].add(uuid)
-                all_lanes.add(lane)
+    for row in rows:
+        lane = row['lane']
+        uuid = row['uuid']
+        time_interval = epoch_second(row['time'])
+        time_lane_intervals[time_interval][lane].add(uuid)
+        all_lanes.add(lane)
 
     return time_lane_intervals, all_lanes
 
 
-def calculate_metrics_per_second(time_lane_intervals: Dict[datetime, Dict[int, Set[str]]],
-                                 all_lanes: Set[int],
-                                 red_time: float,
-                                 car_length: float,
-                                 green_time: float,
-                                 cycle_time: float) -> List[Dict[str, Any]]:
+def process_data(data: dict) -> Tuple[Dict[int, Dict[int, Set[str]]], Set[int]]:
     """
-    Вычисляет метрики для каждой секунды и возвращает список результатов.
+    Группирует данные по временным интервалам (с точностью до секунды)
+    и полосам. Возвращает словарь группировок и множество всех полос.
+    """
+    return group_rows(iter_data_rows(data))
+
+
+def count_lane_vehicles(time_lane_intervals: Dict[int, Dict[int, Set[str]]]) -> Dict[int, Dict[int, int]]:
+    """Переводит группировку в число различных машин на полосе за каждую секунду."""
+    return {
+        current_time: {lane: len(uuids) for lane, uuids in lanes.items()}
+        for current_time, lanes in time_lane_intervals.items()
+    }
+
+
+def calculate_metrics_from_counts(lane_counts: Dict[int, Dict[int, int]],
+                                  all_lanes: Set[int],
+                                  red_time: float,
+                                  car_length: float,
+                                  green_time: float,
+                                  cycle_time: float) -> List[Dict[str, Any]]:
+    """
+    Вычисляет метрики для каждой секунды по готовому числу машин на полосах.
+    Счётчики разных секунд можно получать независимо (например, в разных процессах).
     """
     results = []
     saturation_flow = 0.25  # машин/сек
-    sorted_times = sorted(time_lane_intervals.keys())
+    sorted_times = sorted(lane_counts.keys())
 
     for i, current_time in enumerate(sorted_times):
         # Собираем данные для текущей секунды
-        current_data = time_lane_intervals[current_time]
+        current_data = lane_counts[current_time]
 
         # Рассчитываем метрики для каждой полосы
         lane_metrics = {}
+        total_flow_intensity = 0
         for lane in all_lanes:
-            cars_in_lane = len(current_data.get(lane, set()))
+            cars_in_lane = current_data.get(lane, 0)
+            total_flow_intensity += cars_in_lane
 
             # Рассчитываем метрики
             queue_cars = cars_in_lane
@@ -76,12 +108,11 @@ def calculate_metrics_per_second(time_lane_intervals: Dict[datetime, Dict[int, S
             }
 
         # Рассчитываем общие метрики
-        total_flow_intensity = sum(len(current_data.get(lane, set())) for lane in all_lanes)
         total_capacity = len(all_lanes) * saturation_flow * (green_time / cycle_time)
 
         # Формируем результат для текущей секунды
         result = {
-            "timestamp": current_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "timestamp": format_second(current_time),
             "lane_metrics": lane_metrics,
             "total_flow_intensity": total_flow_intensity,
             "total_capacity": total_capacity
@@ -92,6 +123,19 @@ def calculate_metrics_per_second(time_lane_intervals: Dict[datetime, Dict[int, S
     return results
 
 
+def calculate_metrics_per_second(time_lane_intervals: Dict[int, Dict[int, Set[str]]],
+                                 all_lanes: Set[int],
+                                 red_time: float,
+                                 car_length: float,
+                                 green_time: float,
+                                 cycle_time: float) -> List[Dict[str, Any]]:
+    """
+    Вычисляет метрики для каждой секунды и возвращает список результатов.
+    """
+    return calculate_metrics_from_counts(count_lane_vehicles(time_lane_intervals), all_lanes,
+                                         red_time, car_length, green_time, cycle_time)
+
+
 def save_results_to_json(results: List[Dict[str, Any]], output_file: str) -> None:
     """Сохраняет результаты в JSON-файл."""
     output_dir = os.path.dirname(output_file)
@@ -102,87 +146,219 @@ def save_results_to_json(results: List[Dict[str, Any]], output_file: str) -> Non
         json.dump(results, f, indent=4, ensure_ascii=False)
 
 
-def process_single_file(input_file: str, output_dir: str,
-                        green_time: float, red_time: float,
-                        car_length: float, cycle_time: float) -> None:
-    """Обрабатывает один файл и сохраняет результаты."""
-    # Создаем имя выходного файла
+def save_results(results: List[Dict[str, Any]], output_file: str, output_format: str = 'json') -> None:
+    """Сохраняет результаты в выбранном формате: 'json' или столбцовый 'npz' (см. metrics_store)."""
+    if output_format != 'npz':
+        save_results_to_json(results, output_file)
+        return
+
+    from metrics_store import save_results_to_npz
+
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    save_results_to_npz(results, output_file)
+
+
+def output_path(input_file: str, output_dir: str, output_format: str = 'json') -> str:
+    """Имя файла с результатами для входного файла."""
     base_name = os.path.basename(input_file)
-    output_name = f"metrics_{base_name}"
-    output_file = os.path.join(output_dir, output_name)
+    if output_format == 'npz':
+        base_name = os.path.splitext(base_name)[0] + '.npz'
+    return os.path.join(output_dir, f"metrics_{base_name}")
 
 
-    # Загрузка и обработка данных
-    data = load_data(input_file)
-    time_lane_intervals, all_lanes = process_data(data)
+def count_rows(rows: Iterable[Dict[str, Any]], stats: Dict[str, int]) -> Iterable[Dict[str, Any]]:
+    """Пропускает строки без изменений, подсчитывая их в stats['rows']."""
+    for row in rows:
+        stats['rows'] += 1
+        yield row
 
-    # Расчет метрик
-    results = calculate_metrics_per_second(
-        time_lane_intervals,
-        all_lanes,
-        red_time,
-        car_length,
-        green_time,
-        cycle_time
-    )
 
-    # Сохранение результатов
-    save_results_to_json(results, output_file)
-    print(f"Результаты для {input_file} сохранены в {output_file}")
+@contextmanager
+def timed(timings: Dict[str, float], stage: str) -> Iterator[None]:
+    """Прибавляет время блока к timings[stage] (сек)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+def process_single_file(input_file: str, output_dir: str,
+                        green_time: float, red_time: float,
+                        car_length: float, cycle_time: float,
+                        engine: str = 'python',
+                        output_format: str = 'json') -> Dict[str, Any]:
+    """
+    Обрабатывает один файл и сохраняет результаты.
+    engine: 'python' — группировка словарями, 'numpy' — векторизованный расчёт.
+    output_format: 'json' или столбцовый 'npz'.
+    Возвращает краткую статистику: пути, число строк и секунд, время этапов
+    (stages: read_group_s — потоковое чтение и группировка, metrics_s, save_s).
+    """
+    # Создаем имя выходного файла
+    output_file = output_path(input_file, output_dir, output_format)
+    stats = {'rows': 0}
+    timings: Dict[str, float] = {}
+    rows = count_rows(iter_rows(input_file), stats)
+
+    if engine == 'numpy' and output_format == 'npz':
+        from metrics_engine import rows_to_columns, lane_counts, metric_arrays
+        from metrics_store import save_arrays_npz
+
+        # Столбцы метрик сохраняются как есть, без промежуточных словарей
+        with timed(timings, 'read_group_s'):
+            columns = rows_to_columns(rows)
+        with timed(timings, 'metrics_s'):
+            arrays = metric_arrays(
+                *lane_counts(*columns),
+                red_time,
+                car_length,
+                green_time,
+                cycle_time
+            )
+        with timed(timings, 'save_s'):
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            save_arrays_npz(arrays, output_file)
+        logger.info("Результаты для %s сохранены в %s", input_file, output_file)
+        return {
+            'input_file': input_file,
+            'output_file': output_file,
+            'rows': stats['rows'],
+            'seconds': int(arrays['time'].size),
+            'stages': timings,
+        }
 
+    if engine == 'numpy':
+        from metrics_engine import rows_to_columns, calculate_metrics_vectorized
+
+        # Потоковое чтение в столбцы и расчет метрик для всех секунд сразу
+        with timed(timings, 'read_group_s'):
+            seconds, lanes, uuid_codes = rows_to_columns(rows)
+        with timed(timings, 'metrics_s'):
+            results = calculate_metrics_vectorized(
+                seconds,
+                lanes,
+                uuid_codes,
+                red_time,
+                car_length,
+                green_time,
+                cycle_time
+            )
+    else:
+        # Потоковое чтение и группировка: файл не загружается в память целиком
+        with timed(timings, 'read_group_s'):
+            time_lane_intervals, all_lanes = group_rows(rows)
+
+        # Расчет метрик
+        with timed(timings, 'metrics_s'):
+            results = calculate_metrics_per_second(
+                time_lane_intervals,
+                all_lanes,
+                red_time,
+                car_length,
+                green_time,
+                cycle_time
+            )
 
+    # Сохранение результатов
+    with timed(timings, 'save_s'):
+        save_results(results, output_file, output_format)
+    logger.info("Результаты для %s сохранены в %s", input_file, output_file)
+    return {
+        'input_file': input_file,
+        'output_file': output_file,
+        'rows': stats['rows'],
+        'seconds': len(results),
+        'stages': timings,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Пакетный расчёт метрик перекрёстков по JSON-выгрузкам датчиков.")
+    parser.add_argument('--input-dir', default='MFOTS/json/', help='папка с входными JSON-файлами')
+    parser.add_argument('--output-dir', default='MFOTS/metrics_results/', help='папка для сохранения результатов')
+    parser.add_argument('--latest-output', default='metrics.json',
+                        help='куда скопировать результат последнего файла (пустая строка — не копировать)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='число процессов')
+    parser.add_argument('--engine', choices=('python', 'numpy'), default='python', help='движок расчёта метрик')
+    parser.add_argument('--output-format', choices=('json', 'npz'), default='json',
+                        help='формат результатов: json или столбцовый npz (см. metrics_store)')
+    parser.add_argument('--split-size-mb', type=int, default=512,
+                        help='файлы больше этого размера делятся на куски по времени (0 — не делить)')
+    parser.add_argument('--summary-json', help='сохранить сводку по файлам в JSON')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='пересчитать все файлы, не пропуская неизменившиеся')
+    parser.add_argument('--green-time', type=float, default=45, help='T_g, сек')
+    parser.add_argument('--red-time', type=float, default=30, help='T_r, сек')
+    parser.add_argument('--car-length', type=float, default=4.5, help='L, м')
+    parser.add_argument('--log-level', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'), default='INFO',
+                        help='уровень журнала (WARNING — без сообщений о каждом файле)')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from batch import run_batch, print_summary, save_summary
+    from result_cache import load_manifest, save_manifest
+
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level, format='%(message)s')
+    input_dir = args.input_dir
+    output_dir = args.output_dir
 
-def main() -> None:
     # Параметры
-    input_dir = 'MFOTS/json/'  # Папка с входными JSON-файлами
-    output_dir = 'MFOTS/metrics_results/'  # Папка для сохранения результатов
-    input_file = 'JSON/Олимпийский20_03_2025_17_35.json'
-    output_file = 'metrics.json'
-    
-    green_time = 45  # T_g (сек)
-    red_time = 30  # T_r (сек)
-    car_length = 4.5  # L (м)
+    green_time = args.green_time  # T_g (сек)
+    red_time = args.red_time  # T_r (сек)
+    car_length = args.car_length  # L (м)
     cycle_time = green_time + red_time  # T_c (сек)
+    params = {
+        'green_time': green_time,
+        'red_time': red_time,
+        'car_length': car_length,
+        'cycle_time': cycle_time,
+    }
 
     # Создаем папку для результатов, если ее нет
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     # Находим все JSON-файлы в папке
-    input_files = glob.glob(os.path.join(input_dir, '*.json'))
+    input_files = sorted(glob.glob(os.path.join(input_dir, '*.json')))
 
     if not input_files:
-        print(f"Не найдено JSON-файлов в папке {input_dir}")
+        logger.warning("Не найдено JSON-файлов в папке %s", input_dir)
         return
 
-    # Обрабатываем каждый файл
-    for input_file in input_files:
-        try:
-            process_single_file(input_file, output_dir,
-                                green_time, red_time,
-                                car_length, cycle_time)
-        except Exception as e:
-            print(f"Ошибка при обработке файла {input_file}: {str(e)}")
-
-    # Загрузка и обработка данных
-    data = load_data(input_file)
-    time_lane_intervals, all_lanes = process_data(data)
-
-    # Расчет метрик для каждой секунды
-    results = calculate_metrics_per_second(
-        time_lane_intervals,
-        all_lanes,
-        red_time,
-        car_length,
-        green_time,
-        cycle_time
-    )
-
-    # Сохранение результатов
-    save_results_to_json(results, output_file)
-    print(f"Результаты сохранены в {output_file}")
-
+    # Манифест кэша: неизменившиеся файлы пропускаются, дописанные досчитываются.
+    # Без кэша манифест не читается и не перезаписывается: следующий запуск с
+    # кэшем опирается на прежние записи
+    manifest = None if args.no_cache else load_manifest(output_dir)
+
+    # Обрабатываем файлы параллельно
+    started = time.perf_counter()
+    summary = run_batch(input_files, output_dir, params,
+                        workers=args.workers, engine=args.engine,
+                        split_size=args.split_size_mb << 20,
+                        manifest=manifest, output_format=args.output_format)
+    wall_time = time.perf_counter() - started
+    if manifest is not None:
+        save_manifest(output_dir, manifest)
+
+    print_summary(summary, wall_time)
+    if args.summary_json:
+        save_summary(summary, wall_time, args.summary_json)
+
+    # Результат последнего файла копируется, а не пересчитывается
+    succeeded = [report for report in summary if 'error' not in report]
+    if args.latest_output and succeeded:
+        latest_output = args.latest_output
+        if args.output_format == 'npz':
+            latest_output = os.path.splitext(latest_output)[0] + '.npz'
+        shutil.copyfile(succeeded[-1]['output_file'], latest_output)
+        logger.info("Результаты сохранены в %s", latest_output)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
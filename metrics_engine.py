@@ -0,0 +1,152 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from timestamps import epoch_seconds
+
+# Векторизованный расчёт метрик: строки выгрузки складываются в столбцы NumPy
+# (секунда, полоса, код uuid), а число различных машин для всех секунд и полос
+# считается одним сгруппированным подсчётом вместо словаря множеств.
+
+SATURATION_FLOW = 0.25  # машин/сек, как в main.calculate_metrics_per_second
+DEFAULT_BATCH_SIZE = 100_000
+
+
+def rows_to_columns(rows: Iterable[Dict[str, Any]],
+                    batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Складывает строки rows_data в столбцы: секунды эпохи, полосы и коды uuid.
+    Строки обрабатываются пачками, поэтому источник может быть потоковым.
+    """
+    uuid_codes: Dict[str, int] = {}
+    seconds_parts, lanes_parts, uuid_parts = [], [], []
+    times, lanes, uuids = [], [], []
+
+    def flush() -> None:
+        seconds_parts.append(np.array(epoch_seconds(times), dtype=np.int64))
+        lanes_parts.append(np.array(lanes, dtype=np.int64))
+        uuid_parts.append(np.array(uuids, dtype=np.int64))
+        times.clear()
+        lanes.clear()
+        uuids.clear()
+
+    for row in rows:
+        times.append(row['time'])
+        lanes.append(row['lane'])
+        uuids.append(uuid_codes.setdefault(row['uuid'], len(uuid_codes)))
+        if len(times) >= batch_size:
+            flush()
+    if times or not seconds_parts:
+        flush()
+
+    return np.concatenate(seconds_parts), np.concatenate(lanes_parts), np.concatenate(uuid_parts)
+
+
+def _distinct(keys: np.ndarray) -> np.ndarray:
+    """Отсортированные различные значения массива (сортировка вместо np.unique, быстрее на int64)."""
+    keys = np.sort(keys)
+    if keys.size == 0:
+        return keys
+    mask = np.empty(keys.size, dtype=bool)
+    mask[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=mask[1:])
+    return keys[mask]
+
+
+def lane_counts(seconds: np.ndarray, lanes: np.ndarray,
+                uuid_codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Считает число различных uuid для каждой пары (секунда, полоса).
+    Возвращает отсортированные секунды, отсортированные полосы и матрицу
+    counts[секунда, полоса].
+    """
+    unique_seconds, sec_idx = np.unique(seconds, return_inverse=True)
+    unique_lanes, lane_idx = np.unique(lanes, return_inverse=True)
+    if seconds.size == 0:
+        return unique_seconds, unique_lanes, np.zeros((0, 0), dtype=np.int64)
+
+    n_lanes = unique_lanes.size
+    n_uuids = int(uuid_codes.max()) + 1
+    cell = sec_idx.astype(np.int64) * n_lanes + lane_idx
+    # Одна пара (ячейка, uuid) считается один раз, как элемент множества
+    distinct = _distinct(cell * n_uuids + uuid_codes)
+    counts = np.bincount(distinct // n_uuids, minlength=unique_seconds.size * n_lanes)
+    return unique_seconds, unique_lanes, counts.reshape(unique_seconds.size, n_lanes)
+
+
+def metric_arrays(unique_seconds: np.ndarray, unique_lanes: np.ndarray, counts: np.ndarray,
+                  red_time: float,
+                  car_length: float,
+                  green_time: float,
+                  cycle_time: float) -> Dict[str, np.ndarray]:
+    """
+    Метрики для всех секунд и полос в виде столбцов (раскладка metrics_store).
+    Принимает результат lane_counts.
+    """
+    return {
+        'time': unique_seconds,
+        'lanes': unique_lanes,
+        'cars_in_lane': counts,
+        'queue_length_m': counts * car_length,
+        'queue_length_sec': counts / SATURATION_FLOW,
+        'queue_delay': counts / (2 * SATURATION_FLOW),
+        'total_flow_intensity': counts.sum(axis=1),
+        'total_capacity': np.float64(unique_lanes.size * SATURATION_FLOW * (green_time / cycle_time)),
+    }
+
+
+def calculate_metrics_vectorized(seconds: np.ndarray,
+                                 lanes: np.ndarray,
+                                 uuid_codes: np.ndarray,
+                                 red_time: float,
+                                 car_length: float,
+                                 green_time: float,
+                                 cycle_time: float,
+                                 lane_order: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+    """
+    Вычисляет те же метрики, что и main.calculate_metrics_per_second,
+    сразу для всех секунд и полос. lane_order задаёт порядок полос в
+    lane_metrics (по умолчанию — порядок обхода множества полос, как в main.py).
+    """
+    unique_seconds, unique_lanes, counts = lane_counts(seconds, lanes, uuid_codes)
+    if unique_seconds.size == 0:
+        # np.char.replace не принимает пустой массив строк
+        return []
+
+    lane_list = unique_lanes.tolist()
+    if lane_order is None:
+        lane_order = set(lane_list)
+    columns = [lane_list.index(lane) for lane in lane_order]
+    ordered_lanes = [lane_list[c] for c in columns]
+    arrays = metric_arrays(unique_seconds, np.array(ordered_lanes, dtype=np.int64), counts[:, columns],
+                           red_time, car_length, green_time, cycle_time)
+
+    cars = arrays['cars_in_lane'].tolist()
+    queue_length_m = arrays['queue_length_m'].tolist()
+    queue_length_sec = arrays['queue_length_sec'].tolist()
+    queue_delay = arrays['queue_delay'].tolist()
+    total_flow_intensity = arrays['total_flow_intensity'].tolist()
+    total_capacity = float(arrays['total_capacity'])
+    timestamps = np.char.replace(np.datetime_as_string(unique_seconds.astype('datetime64[s]')), 'T', ' ').tolist()
+
+    results = []
+    for i, timestamp in enumerate(timestamps):
+        row_cars, row_m, row_sec, row_delay = cars[i], queue_length_m[i], queue_length_sec[i], queue_delay[i]
+        lane_metrics = {}
+        for j, lane in enumerate(ordered_lanes):
+            lane_metrics[lane] = {
+                "cars_in_lane": row_cars[j],
+                "queue_cars": row_cars[j],
+                "queue_length_m": row_m[j],
+                "queue_length_sec": row_sec[j],
+                "queue_increase": row_m[j],
+                "queue_delay": row_delay[j]
+            }
+        results.append({
+            "timestamp": timestamp,
+            "lane_metrics": lane_metrics,
+            "total_flow_intensity": total_flow_intensity[i],
+            "total_capacity": total_capacity
+        })
+
+    return results
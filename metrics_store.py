@@ -0,0 +1,139 @@
+import struct
+import zipfile
+from typing import Any, Dict, List
+
+import numpy as np
+
+from timestamps import epoch_second, format_second
+
+# Столбцовый формат результатов: несжатый NumPy .npz.
+#
+# Вместо списка словарей с повторяющимися ключами (JSON) каждая метрика
+# хранится одним массивом. Оси:
+#
+#   time                 int64[T]     секунды эпохи (UTC), по возрастанию
+#   lanes                int64[L]     номера полос, по возрастанию
+#
+# Метрики по полосам, float64/int64[T, L] (строка — секунда, столбец — полоса):
+#
+#   cars_in_lane         int64        число различных машин на полосе
+#                                     (в JSON также queue_cars)
+#   queue_length_m       float64      длина очереди, м (в JSON также queue_increase)
+#   queue_length_sec     float64      время освобождения очереди, с
+#   queue_delay          float64      задержка в очереди, с
+#
+# Общие метрики:
+#
+#   total_flow_intensity int64[T]     сумма cars_in_lane по полосам
+#   total_capacity       float64[]    пропускная способность (скаляр)
+#
+# Архив пишется без сжатия (ZIP_STORED), поэтому load_metrics_npz может
+# отобразить каждый массив в память прямо из архива, не читая файл целиком.
+
+NPZ_FORMAT = 'npz'
+JSON_FORMAT = 'json'
+OUTPUT_FORMATS = (JSON_FORMAT, NPZ_FORMAT)
+
+LANE_METRICS = ('cars_in_lane', 'queue_length_m', 'queue_length_sec', 'queue_delay')
+
+
+def results_to_arrays(results: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Переводит список результатов (как в metrics.json) в столбцы формата .npz."""
+    lanes = sorted({int(lane) for result in results for lane in result['lane_metrics']})
+    lane_index = {lane: j for j, lane in enumerate(lanes)}
+    shape = (len(results), len(lanes))
+    arrays = {
+        'time': np.array([epoch_second(result['timestamp']) for result in results], dtype=np.int64),
+        'lanes': np.array(lanes, dtype=np.int64),
+        'cars_in_lane': np.zeros(shape, dtype=np.int64),
+        'queue_length_m': np.zeros(shape, dtype=np.float64),
+        'queue_length_sec': np.zeros(shape, dtype=np.float64),
+        'queue_delay': np.zeros(shape, dtype=np.float64),
+        'total_flow_intensity': np.array([result['total_flow_intensity'] for result in results], dtype=np.int64),
+        'total_capacity': np.float64(results[0]['total_capacity'] if results else 0.0),
+    }
+    for i, result in enumerate(results):
+        for lane, metrics in result['lane_metrics'].items():
+            j = lane_index[int(lane)]
+            for name in LANE_METRICS:
+                arrays[name][i, j] = metrics[name]
+    return arrays
+
+
+def arrays_to_results(arrays: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Обратное преобразование: столбцы .npz -> список результатов как в metrics.json."""
+    lanes = arrays['lanes'].tolist()
+    columns = {name: arrays[name].tolist() for name in LANE_METRICS}
+    totals = arrays['total_flow_intensity'].tolist()
+    total_capacity = float(arrays['total_capacity'])
+
+    results = []
+    for i, second in enumerate(arrays['time'].tolist()):
+        lane_metrics = {}
+        for j, lane in enumerate(lanes):
+            cars = columns['cars_in_lane'][i][j]
+            queue_length_m = columns['queue_length_m'][i][j]
+            lane_metrics[lane] = {
+                "cars_in_lane": cars,
+                "queue_cars": cars,
+                "queue_length_m": queue_length_m,
+                "queue_length_sec": columns['queue_length_sec'][i][j],
+                "queue_increase": queue_length_m,
+                "queue_delay": columns['queue_delay'][i][j]
+            }
+        results.append({
+            "timestamp": format_second(second),
+            "lane_metrics": lane_metrics,
+            "total_flow_intensity": totals[i],
+            "total_capacity": total_capacity
+        })
+    return results
+
+
+def save_arrays_npz(arrays: Dict[str, np.ndarray], output_file: str) -> None:
+    # np.savez пишет без сжатия — это и нужно для отображения в память
+    with open(output_file, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def save_results_to_npz(results: List[Dict[str, Any]], output_file: str) -> None:
+    """Сохраняет результаты в столбцовом формате .npz."""
+    save_arrays_npz(results_to_arrays(results), output_file)
+
+
+def _memmap_member(path: str, info: zipfile.ZipInfo) -> np.ndarray:
+    """Отображает в память массив .npy, лежащий в архиве без сжатия."""
+    with open(path, 'rb') as f:
+        # Локальный заголовок zip: 30 байт, затем имя и дополнительное поле
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if not shape:
+        # Скаляр: отображать в память нечего
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(1,))[0]
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def load_metrics_npz(path: str, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Читает результаты в формате .npz. При mmap=True массивы отображаются
+    в память прямо из файла и читаются с диска только при обращении.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if mmap and info.compress_type == zipfile.ZIP_STORED:
+                arrays[name] = _memmap_member(path, info)
+            else:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+    return arrays
@@ -0,0 +1,76 @@
+from typing import Any, Dict, Iterable, Tuple
+
+import numpy as np
+
+from export_stream import iter_rows
+from timestamps import epoch_seconds, microseconds
+
+# Индекс выгрузки для воспроизведения.
+#
+# Файл разбирается один раз: строки складываются в столбцы NumPy (время от
+# начала выгрузки, координаты, полоса, код uuid), отсортированные по времени.
+# Кадр на момент t — срез строк за последние window секунд (два
+# np.searchsorted), из которого для каждой машины берётся последняя строка.
+
+DEFAULT_WINDOW = 0.5  # сек; больше интервала между сообщениями датчика
+
+
+class Replay:
+    """Столбцы выгрузки, упорядоченные по времени."""
+
+    def __init__(self, times: np.ndarray, x: np.ndarray, y: np.ndarray, lanes: np.ndarray,
+                 objects: np.ndarray, start_second: int = 0):
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        self.x = x[order]
+        self.y = y[order]
+        self.lanes = lanes[order]
+        self.objects = objects[order]
+        self.start_second = start_second
+
+    @property
+    def duration(self) -> float:
+        return float(self.times[-1]) if self.times.size else 0.0
+
+    def frame(self, t: float, window: float = DEFAULT_WINDOW) -> np.ndarray:
+        """Номера строк кадра на момент t: последняя строка каждой машины за (t - window, t]."""
+        lo = np.searchsorted(self.times, t - window, side='right')
+        hi = np.searchsorted(self.times, t, side='right')
+        if lo == hi:
+            return np.empty(0, dtype=np.int64)
+        # np.unique по перевёрнутому срезу даёт первое вхождение с конца — последнюю строку машины
+        _, last = np.unique(self.objects[lo:hi][::-1], return_index=True)
+        return hi - 1 - last
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """Границы координат всей выгрузки: (x_min, x_max, y_min, y_max)."""
+        if not self.x.size:
+            return 0.0, 1.0, 0.0, 1.0
+        return float(self.x.min()), float(self.x.max()), float(self.y.min()), float(self.y.max())
+
+
+def rows_to_replay(rows: Iterable[Dict[str, Any]]) -> Replay:
+    """Собирает Replay из потока строк rows_data."""
+    time_strs, x, y, lanes, objects = [], [], [], [], []
+    codes: Dict[str, int] = {}
+    micros = []
+    for row in rows:
+        time_str = row['time']
+        time_strs.append(time_str)
+        micros.append(microseconds(time_str))
+        x.append(float(row.get('point_x') or 0))
+        y.append(float(row.get('point_y') or 0))
+        lanes.append(row.get('lane', 0))
+        objects.append(codes.setdefault(row['uuid'], len(codes)))
+
+    seconds = np.array(epoch_seconds(time_strs), dtype=np.int64)
+    start_second = int(seconds.min()) if seconds.size else 0
+    # Время от начала выгрузки: в float64 доли секунды не теряются
+    times = (seconds - start_second) + np.array(micros, dtype=np.float64) / 1e6
+    return Replay(times, np.array(x, dtype=np.float64), np.array(y, dtype=np.float64),
+                  np.array(lanes, dtype=np.int64), np.array(objects, dtype=np.int64), start_second)
+
+
+def load_replay(file_path: str) -> Replay:
+    """Разбирает выгрузку потоково и строит индекс для воспроизведения."""
+    return rows_to_replay(iter_rows(file_path))
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from export_stream import find_row_start, iter_rows, iter_rows_from_offset, rows_array_end
+from timestamps import epoch_second
+import main as pipeline
+
+# Кэш результатов пакетной обработки.
+#
+# В папке результатов хранится манифест: для каждого входного файла — размер,
+# mtime, хэш содержимого, параметры светофора, с которыми считались метрики,
+# и хэш префикса до конца массива rows_data. По нему файл без изменений
+# пропускается, а файл, в который только дописали строки, досчитывается с места
+# остановки: новые строки читаются с байтового смещения старого конца массива,
+# а множества uuid последних секунд (tail) берутся из манифеста, чтобы машины
+# на границе не посчитались дважды.
+
+MANIFEST_NAME = 'manifest.json'
+HASH_CHUNK_SIZE = 8 << 20
+TAIL_TOLERANCE_S = 2  # разброс порядка строк по времени, сек
+TAIL_STEP = 1 << 16
+
+
+class IncrementalUpdateError(Exception):
+    """Дописанные строки нельзя объединить с прежними результатами — нужен полный пересчёт."""
+
+
+def load_manifest(output_dir: str) -> Dict[str, Any]:
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir: str, manifest: Dict[str, Any]) -> None:
+    """Сохраняет манифест атомарно: прерванный запуск не оставит его испорченным."""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def manifest_key(input_file: str) -> str:
+    # Имя результата строится по имени файла, поэтому и ключ — имя файла
+    return os.path.basename(input_file)
+
+
+def quick_status(input_file: str, entry: Optional[Dict[str, Any]], params: Dict[str, float],
+                 output_file: str) -> str:
+    """
+    Быстрая проверка без чтения файла:
+    'full' — нужен полный расчёт, 'unchanged' — размер и mtime совпали,
+    'check' — файл изменился по mtime или размеру, решает хэш (check_file).
+    """
+    if entry is None or entry.get('params') != params:
+        return 'full'
+    if not os.path.exists(output_file):
+        return 'full'
+    stat = os.stat(input_file)
+    if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+        return 'unchanged'
+    return 'check'
+
+
+def fingerprint(input_file: str, marks: Iterable[Optional[int]] = ()) -> Tuple[Dict[str, Any], Dict[int, str]]:
+    """
+    Хэширует файл за один проход. Кроме хэша всего файла возвращает хэши
+    префиксов до смещений marks и до конца массива rows_data.
+    """
+    stat = os.stat(input_file)
+    rows_end = rows_array_end(input_file)
+    cuts = {mark for mark in marks if mark is not None and mark <= stat.st_size}
+    if rows_end is not None:
+        cuts.add(rows_end)
+
+    hasher = hashlib.blake2b()
+    digests = {}
+    pos = 0
+    with open(input_file, 'rb') as f:
+        for mark in sorted(cuts) + [None]:
+            while mark is None or pos < mark:
+                size = HASH_CHUNK_SIZE if mark is None else min(HASH_CHUNK_SIZE, mark - pos)
+                chunk = f.read(size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                pos += len(chunk)
+            if mark is not None:
+                digests[mark] = hasher.hexdigest()
+
+    entry = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': hasher.hexdigest(),
+        'rows_end': rows_end,
+        'prefix_hash': digests.get(rows_end),
+    }
+    return entry, digests
+
+
+def tail_uuids(input_file: str, rows_end: Optional[int]) -> Optional[Dict[str, Dict[str, list]]]:
+    """
+    Множества uuid по полосам для последних секунд файла (начиная с
+    последней секунды минус TAIL_TOLERANCE_S). Читается только хвост файла.
+    """
+    if rows_end is None:
+        return None
+    back = TAIL_STEP
+    while True:
+        offset = rows_end - back
+        found = find_row_start(input_file, offset) if offset > 0 else None
+        rows = iter_rows(input_file) if found is None else iter_rows_from_offset(input_file, found[0])
+
+        seconds = defaultdict(lambda: defaultdict(set))
+        for row in rows:
+            seconds[epoch_second(row['time'])][row['lane']].add(row['uuid'])
+        if not seconds:
+            return {}
+        last = max(seconds)
+        # Строки до offset относятся к секундам не позже первой прочитанной + разброс
+        if found is None or epoch_second(found[1]['time']) + TAIL_TOLERANCE_S < last - TAIL_TOLERANCE_S:
+            return {
+                str(second): {str(lane): sorted(uuids) for lane, uuids in lanes.items()}
+                for second, lanes in seconds.items()
+                if second >= last - TAIL_TOLERANCE_S
+            }
+        back *= 4
+
+
+def make_entry(input_file: str, params: Dict[str, float],
+               file_fingerprint: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Запись манифеста для только что посчитанного файла."""
+    if file_fingerprint is None:
+        file_fingerprint, _ = fingerprint(input_file)
+    entry = dict(file_fingerprint)
+    entry['params'] = params
+    entry['tail'] = tail_uuids(input_file, entry['rows_end'])
+    return entry
+
+
+def check_file(input_file: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Сравнивает файл с записью манифеста по хэшу:
+    'unchanged' — содержимое то же, 'append' — прежние строки не изменились
+    и дописаны новые, 'full' — нужен полный пересчёт.
+    """
+    current, digests = fingerprint(input_file, [entry.get('rows_end')])
+    if current['hash'] == entry['hash']:
+        decision = 'unchanged'
+    elif (entry.get('rows_end') is not None and entry.get('tail') is not None
+          and current['rows_end'] is not None and current['rows_end'] > entry['rows_end']
+          and digests.get(entry['rows_end']) == entry['prefix_hash']):
+        decision = 'append'
+    else:
+        decision = 'full'
+    return {'decision': decision, 'fingerprint': current}
+
+
+def _load_counts(output_file: str, output_format: str) -> Tuple[Dict[int, Dict[int, int]], set]:
+    """Восстанавливает число машин по секундам и полосам из сохранённых метрик."""
+    if output_format == 'npz':
+        from metrics_store import load_metrics_npz
+
+        arrays = load_metrics_npz(output_file, mmap=False)
+        lanes = arrays['lanes'].tolist()
+        counts = {
+            second: dict(zip(lanes, row))
+            for second, row in zip(arrays['time'].tolist(), arrays['cars_in_lane'].tolist())
+        }
+        return counts, set(lanes)
+
+    with open(output_file, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    counts = {}
+    all_lanes = set()
+    for result in results:
+        second = epoch_second(result['timestamp'])
+        lanes = {int(lane): metrics['cars_in_lane'] for lane, metrics in result['lane_metrics'].items()}
+        counts[second] = lanes
+        all_lanes.update(lanes)
+    return counts, all_lanes
+
+
+def append_file(input_file: str, output_dir: str, params: Dict[str, float],
+                entry: Dict[str, Any], file_fingerprint: Dict[str, Any],
+                output_format: str = 'json') -> Dict[str, Any]:
+    """
+    Досчитывает метрики по строкам, дописанным после entry['rows_end'], и
+    объединяет их с прежними результатами. Бросает IncrementalUpdateError,
+    если объединение невозможно без полного пересчёта.
+    """
+    start = find_row_start(input_file, entry['rows_end'])
+    if start is None:
+        raise IncrementalUpdateError("не найдено начало дописанных строк")
+
+    stats = {'rows': 0}
+    rows = pipeline.count_rows(iter_rows_from_offset(input_file, start[0]), stats)
+    time_lane_intervals, new_lanes = pipeline.group_rows(rows)
+
+    output_file = pipeline.output_path(input_file, output_dir, output_format)
+    counts, all_lanes = _load_counts(output_file, output_format)
+
+    # Новая полоса меняет lane_metrics и total_capacity всех прежних секунд
+    if not new_lanes <= all_lanes:
+        raise IncrementalUpdateError("в дописанных строках появились новые полосы")
+
+    tail = {int(second): {int(lane): set(uuids) for lane, uuids in lanes.items()}
+            for second, lanes in entry['tail'].items()}
+    for second, lanes in time_lane_intervals.items():
+        if second in counts:
+            if second not in tail:
+                raise IncrementalUpdateError("дописаны строки давно посчитанной секунды")
+            for lane, uuids in lanes.items():
+                tail[second].setdefault(lane, set()).update(uuids)
+            lanes = tail[second]
+        counts[second] = {lane: len(uuids) for lane, uuids in lanes.items()}
+
+    results = pipeline.calculate_metrics_from_counts(
+        counts,
+        all_lanes,
+        params['red_time'],
+        params['car_length'],
+        params['green_time'],
+        params['cycle_time']
+    )
+    pipeline.save_results(results, output_file, output_format)
+    pipeline.logger.info("Результаты для %s дополнены в %s", input_file, output_file)
+    return {
+        'input_file': input_file,
+        'output_file': output_file,
+        'rows': stats['rows'],
+        'seconds': len(results),
+        'entry': make_entry(input_file, params, file_fingerprint),
+    }
@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from export_stream import iter_rows
+from timestamps import TIME_FORMAT, epoch_second, microseconds
+
+# Имитация датчика: воспроизводит выгрузку и отправляет её строки кадрами на
+# сервер приёма (MFOTS/main/sensor_ingest.py) по UDP или TCP со скоростью
+# speed × реального времени. Кадр — {"sensor": id, "rows_data": [...]}; по TCP
+# кадры разделяются '\n', и отправка ждёт drain(), то есть подчиняется
+# противодавлению сервера.
+#
+# По умолчанию время строк заменяется текущим (строка, записанная через t
+# секунд выгрузки, получает время старта + t / speed), чтобы потоковые
+# метрики сервера видели «живой» поток; --keep-time оставляет исходное.
+
+DEFAULT_ROWS_PER_FRAME = 50  # ~10 КБ: с запасом помещается в датаграмму UDP
+
+
+def row_seconds(row: Dict[str, Any]) -> float:
+    time_str = row['time']
+    return epoch_second(time_str) + microseconds(time_str) / 1e6
+
+
+def iter_frames(rows: Iterable[Dict[str, Any]],
+                rows_per_frame: int = DEFAULT_ROWS_PER_FRAME) -> Iterator[Tuple[float, List[Dict[str, Any]]]]:
+    """Кадры (время выгрузки первой строки, строки): строки одного момента времени, не больше rows_per_frame."""
+    frame: List[Dict[str, Any]] = []
+    frame_time = None
+    for row in rows:
+        t = row_seconds(row)
+        if frame and (t != frame_time or len(frame) >= rows_per_frame):
+            yield frame_time, frame
+            frame = []
+        if not frame:
+            frame_time = t
+        frame.append(row)
+    if frame:
+        yield frame_time, frame
+
+
+class _Sender:
+    """Отправка кадров по UDP или TCP."""
+
+    def __init__(self, protocol: str, host: str, port: int):
+        self.protocol = protocol
+        self.host = host
+        self.port = port
+        self.transport = None
+        self.writer = None
+
+    async def open(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.protocol == 'udp':
+            self.transport, _ = await loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol, remote_addr=(self.host, self.port))
+        else:
+            _, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def send(self, payload: bytes) -> None:
+        if self.transport is not None:
+            self.transport.sendto(payload)
+        else:
+            self.writer.write(payload + b'\n')
+            await self.writer.drain()
+
+    async def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+
+async def replay(file_path: str, host: str, port: int, protocol: str = 'udp', speed: float = 1.0,
+                 sensor: Optional[int] = None, rows_per_frame: int = DEFAULT_ROWS_PER_FRAME,
+                 keep_time: bool = False) -> Dict[str, Any]:
+    """Отправляет выгрузку file_path кадрами. Возвращает статистику отправки."""
+    sender = _Sender(protocol, host, port)
+    await sender.open()
+    stats = {'frames': 0, 'rows': 0, 'bytes': 0, 'late_frames': 0}
+    started = time.monotonic()
+    wall_start = datetime.now(timezone.utc).replace(tzinfo=None)
+    first = None
+    try:
+        for frame_time, rows in iter_frames(iter_rows(file_path), rows_per_frame):
+            if first is None:
+                first = frame_time
+            offset = (frame_time - first) / speed
+            delay = started + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -1:
+                stats['late_frames'] += 1
+            if not keep_time:
+                stamp = (wall_start + timedelta(seconds=offset)).strftime(TIME_FORMAT)
+                rows = [dict(row, time=stamp) for row in rows]
+            frame = {'rows_data': rows} if sensor is None else {'sensor': sensor, 'rows_data': rows}
+            payload = json.dumps(frame).encode()
+            await sender.send(payload)
+            stats['frames'] += 1
+            stats['rows'] += len(rows)
+            stats['bytes'] += len(payload)
+    finally:
+        await sender.close()
+    elapsed = time.monotonic() - started
+    stats['elapsed_s'] = elapsed
+    stats['export_s'] = (frame_time - first) if first is not None else 0.0
+    stats['achieved_speed'] = stats['export_s'] / elapsed if elapsed else 0.0
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Имитация датчика: отправка выгрузки на сервер приёма кадров.")
+    parser.add_argument('input_file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--protocol', choices=('udp', 'tcp'), default='udp')
+    parser.add_argument('--speed', type=float, default=1.0, help='во сколько раз быстрее реального времени')
+    parser.add_argument('--sensor', type=int, help='id датчика в кадре (иначе сервер определяет его по адресу)')
+    parser.add_argument('--rows-per-frame', type=int, default=DEFAULT_ROWS_PER_FRAME)
+    parser.add_argument('--keep-time', action='store_true', help='не заменять время строк текущим')
+    args = parser.parse_args(argv)
+
+    stats = asyncio.run(replay(args.input_file, args.host, args.port, args.protocol, args.speed,
+                               args.sensor, args.rows_per_frame, args.keep_time))
+    print(json.dumps(stats, indent=4))
+
+
+if __name__ == '__main__':
+    main()
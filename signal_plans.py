@@ -0,0 +1,317 @@
+import argparse
+import glob
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from export_stream import iter_rows
+from metrics_engine import SATURATION_FLOW
+from timestamps import epoch_second, format_second
+from trajectories import INACTIVITY_TIMEOUT
+
+# Оценка планов светофорного регулирования («что если») по записанным прибытиям.
+#
+# Прибытие — первое появление машины (uuid) на полосе; машина, не появлявшаяся
+# timeout секунд, при следующем появлении считается новой. Прибытия
+# складываются в окна по window_s секунд: counts[окно, полоса].
+#
+# План — длительности зелёного T_g и красного T_r основного направления,
+# цикл C = T_g + T_r. Полосы поперечного направления (cross_lanes) едут, пока у
+# основного красный: для них зелёный и красный меняются местами. Для каждого
+# окна и полосы — формулы GPT.md:
+#   λ = N / T,                очередь за красный N_q = λ·T_r, L_q = N_q·L (м),
+#   задержка d = T_r / 2 · 1 / (1 − X).
+# Степень насыщения X здесь — отношение λ к пропускной способности полосы при
+# этом плане s·T_g / C (раздел 2 GPT.md), а не к s: иначе зелёный не влиял бы
+# на задержку. X ограничивается MAX_SATURATION, а машины сверх пропускной
+# способности окна переходят в следующее окно (остаточная очередь) и ждут там:
+# их задержка — площадь остаточной очереди, (начало + конец) / 2 · window_s.
+# В начале каждого зелёного теряется lost_time секунд (разгон очереди, жёлтый),
+# поэтому пропускная способность считается по T_g − lost_time: без этого
+# самый короткий цикл всегда оказывался бы лучшим.
+#
+# Все планы считаются сразу: состояние — массивы (планы, полосы), цикл идёт
+# только по окнам. Планы можно разделить между процессами (workers).
+
+CAR_LENGTH = 4.5  # м, как в main.py
+WINDOW_S = 900  # сек
+MAX_SATURATION = 0.95
+LOST_TIME = 3.0  # сек на фазу
+CURRENT_PLAN = (45.0, 30.0)  # T_g, T_r из main.py
+
+Counts = Tuple[np.ndarray, np.ndarray, np.ndarray]  # (начала окон, полосы, прибытия [окно, полоса])
+
+
+class ArrivalCounter:
+    """Потоковый подсчёт прибытий по окнам и полосам."""
+
+    def __init__(self, window_s: int = WINDOW_S, timeout: float = INACTIVITY_TIMEOUT):
+        self.window_s = window_s
+        self.timeout = timeout
+        # uuid -> время последнего появления; истёкшие всегда в начале
+        self.seen: 'OrderedDict[str, int]' = OrderedDict()
+        self.counts: Dict[Tuple[int, Any], int] = {}
+        self.now = -1
+        self.rows = 0
+
+    def add(self, row: Dict[str, Any]) -> None:
+        t = epoch_second(row['time'])
+        self.rows += 1
+        uuid = row['uuid']
+        if uuid in self.seen:
+            self.seen.move_to_end(uuid)
+        else:
+            key = (t // self.window_s, row['lane'])
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.seen[uuid] = t
+        if t > self.now:
+            self.now = t
+            deadline = t - self.timeout
+            while self.seen and next(iter(self.seen.values())) < deadline:
+                self.seen.popitem(last=False)
+
+    def result(self) -> Counts:
+        """Плотный массив прибытий: окна без машин тоже входят (в них рассасывается очередь)."""
+        if not self.counts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros((0, 0))
+        windows = [window for window, _ in self.counts]
+        first, last = min(windows), max(windows)
+        lanes = sorted({lane for _, lane in self.counts})
+        lane_index = {lane: i for i, lane in enumerate(lanes)}
+        counts = np.zeros((last - first + 1, len(lanes)))
+        for (window, lane), n in self.counts.items():
+            counts[window - first, lane_index[lane]] = n
+        starts = np.arange(first, last + 1, dtype=np.int64) * self.window_s
+        return starts, np.array(lanes, dtype=np.int64), counts
+
+
+def save_counts(file_path: str, counts: Counts, window_s: int) -> None:
+    """Сохраняет прибытия в npz: перебор планов можно повторять без разбора выгрузок."""
+    starts, lanes, values = counts
+    np.savez_compressed(file_path, starts=starts, lanes=lanes, counts=values, window_s=window_s)
+
+
+def load_counts(file_path: str) -> Tuple[Counts, int]:
+    with np.load(file_path) as data:
+        return (data['starts'], data['lanes'], data['counts']), int(data['window_s'])
+
+
+def arrival_counts(rows: Iterable[Dict[str, Any]], window_s: int = WINDOW_S,
+                   timeout: float = INACTIVITY_TIMEOUT) -> Counts:
+    """Прибытия из потока строк; см. ArrivalCounter."""
+    counter = ArrivalCounter(window_s, timeout)
+    add = counter.add
+    for row in rows:
+        add(row)
+    return counter.result()
+
+
+def plan_grid(greens: Sequence[float], reds: Sequence[float], min_cycle: float = 0,
+              max_cycle: float = float('inf'), lost_time: float = LOST_TIME) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Все сочетания T_g и T_r с циклом в [min_cycle, max_cycle]. Планы, в которых
+    фаза не длиннее lost_time (полоса этой фазы не пропускает ни одной машины), отбрасываются.
+    """
+    green, red = np.meshgrid(np.asarray(greens, dtype=float), np.asarray(reds, dtype=float), indexing='ij')
+    green, red = green.ravel(), red.ravel()
+    keep = (green + red >= min_cycle) & (green + red <= max_cycle) & (green > lost_time) & (red > lost_time)
+    return green[keep], red[keep]
+
+
+def evaluate_plans(counts: np.ndarray, window_s: float, green: np.ndarray, red: np.ndarray,
+                   cross: Optional[np.ndarray] = None, saturation_flow: float = SATURATION_FLOW,
+                   car_length: float = CAR_LENGTH, lost_time: float = LOST_TIME) -> Dict[str, np.ndarray]:
+    """
+    Прогоняет прибытия counts[окно, полоса] через планы (green[i], red[i]).
+    cross — маска полос поперечного направления. Возвращает массивы по планам.
+    Зелёный любой полосы должен быть длиннее lost_time (см. plan_grid), иначе ValueError.
+    """
+    lanes = counts.shape[1]
+    cross = np.zeros(lanes, dtype=bool) if cross is None else np.asarray(cross, dtype=bool)
+    green = np.asarray(green, dtype=float)[:, None]
+    red = np.asarray(red, dtype=float)[:, None]
+    lane_green = np.where(cross, red, green)
+    lane_red = np.where(cross, green, red)
+    if lanes and (lane_green <= lost_time).any():
+        raise ValueError(f"Зелёный полосы не длиннее потерянного времени {lost_time} с: пропускная способность 0")
+    capacity = saturation_flow * (lane_green - lost_time) / (green + red)  # машин/сек на полосу
+    inverse_capacity = 1.0 / capacity
+    half_red = lane_red / 2
+    served = capacity * window_s  # машин за окно
+
+    plans = green.shape[0]
+    residual = np.zeros((plans, lanes))
+    delay = np.zeros(plans)
+    queue_sum = np.zeros(plans)
+    max_queue = np.zeros(plans)
+    oversaturated = np.zeros(plans, dtype=np.int64)
+    saturation = np.empty((plans, lanes))
+    queue = np.empty((plans, lanes))
+    for arrived in counts:
+        rate = arrived / window_s
+        np.multiply(rate, inverse_capacity, out=saturation)
+        oversaturated += (saturation >= 1).any(axis=1)
+        np.minimum(saturation, MAX_SATURATION, out=saturation)
+        # d = T_r / 2 · 1 / (1 − X) на каждую прибывшую машину
+        delay += (half_red / (1 - saturation)) @ arrived
+        # Остаточная очередь: прибывшие сверх пропускной способности
+        end = np.maximum(residual + arrived - served, 0)
+        delay += (residual + end).sum(axis=1) * (window_s / 2)
+        # N_q = λ·T_r плюс остаточная очередь
+        np.multiply(rate, lane_red, out=queue)
+        queue += end
+        queue_sum += queue.sum(axis=1)
+        np.maximum(max_queue, queue.max(axis=1), out=max_queue)
+        residual = end
+
+    vehicles = counts.sum()
+    cells = max(counts.size, 1)
+    return {
+        'total_delay_s': delay,
+        'avg_delay_s': delay / vehicles if vehicles else np.zeros(plans),
+        'avg_queue_m': queue_sum * car_length / cells,
+        'max_queue_m': max_queue * car_length,
+        'oversaturated_windows': oversaturated,
+        'final_residual': residual.sum(axis=1),
+    }
+
+
+def _evaluate_chunk(args: Tuple[Any, ...]) -> Dict[str, np.ndarray]:
+    return evaluate_plans(*args)
+
+
+def evaluate_parallel(counts: np.ndarray, window_s: float, green: np.ndarray, red: np.ndarray,
+                      cross: Optional[np.ndarray] = None, workers: int = 1, **params) -> Dict[str, np.ndarray]:
+    """evaluate_plans, разделённый на workers процессов по планам."""
+    if workers <= 1 or green.size < 2 * workers:
+        return evaluate_plans(counts, window_s, green, red, cross, **params)
+    saturation_flow = params.get('saturation_flow', SATURATION_FLOW)
+    car_length = params.get('car_length', CAR_LENGTH)
+    lost_time = params.get('lost_time', LOST_TIME)
+    chunks = [(counts, window_s, g, r, cross, saturation_flow, car_length, lost_time)
+              for g, r in zip(np.array_split(green, workers), np.array_split(red, workers))]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_evaluate_chunk, chunks))
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def rank_plans(green: np.ndarray, red: np.ndarray, results: Dict[str, np.ndarray],
+               top: int = 10) -> List[Dict[str, Any]]:
+    """Лучшие планы: по суммарной задержке, при равенстве — по максимальной очереди."""
+    order = np.lexsort((results['max_queue_m'], results['total_delay_s']))[:top]
+    return [plan_report(green[i], red[i], {key: values[i] for key, values in results.items()}) for i in order]
+
+
+def plan_report(green: float, red: float, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'green_time': float(green),
+        'red_time': float(red),
+        'cycle_time': float(green + red),
+        'total_delay_h': float(result['total_delay_s']) / 3600,
+        'avg_delay_s': float(result['avg_delay_s']),
+        'avg_queue_m': float(result['avg_queue_m']),
+        'max_queue_m': float(result['max_queue_m']),
+        'oversaturated_windows': int(result['oversaturated_windows']),
+    }
+
+
+def _range(spec: str) -> np.ndarray:
+    """'20:90:5' -> 20, 25, ..., 90 (включительно); '45' -> 45."""
+    parts = [float(part) for part in spec.split(':')]
+    if len(parts) == 1:
+        return np.array(parts)
+    start, stop = parts[0], parts[1]
+    step = parts[2] if len(parts) > 2 else 1.0
+    return np.arange(start, stop + step / 2, step)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Сравнение планов светофорного регулирования по записанным прибытиям.")
+    parser.add_argument('inputs', nargs='+',
+                        help='JSON-выгрузки или папки с ними (по порядку времени) либо прибытия .npz')
+    parser.add_argument('--green', default='15:90:1', help='T_g, сек: значение или начало:конец:шаг')
+    parser.add_argument('--red', default='15:90:1', help='T_r, сек: значение или начало:конец:шаг')
+    parser.add_argument('--min-cycle', type=float, default=40)
+    parser.add_argument('--max-cycle', type=float, default=150)
+    parser.add_argument('--cross-lanes', type=int, nargs='*', default=[],
+                        help='полосы поперечного направления (зелёный — во время красного основного)')
+    parser.add_argument('--window', type=int, default=WINDOW_S, help='окно подсчёта прибытий, сек')
+    parser.add_argument('--timeout', type=float, default=INACTIVITY_TIMEOUT,
+                        help='машина, не появлявшаяся дольше, считается новой, сек')
+    parser.add_argument('--saturation-flow', type=float, default=SATURATION_FLOW, help='s, машин/сек')
+    parser.add_argument('--car-length', type=float, default=CAR_LENGTH, help='L, м')
+    parser.add_argument('--lost-time', type=float, default=LOST_TIME, help='потерянное время на фазу, сек')
+    parser.add_argument('--current', type=float, nargs=2, default=CURRENT_PLAN, metavar=('T_G', 'T_R'),
+                        help='действующий план для сравнения')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--output', help='сохранить оценки всех планов в JSON')
+    parser.add_argument('--save-counts', help='сохранить прибытия в npz для повторных переборов')
+    args = parser.parse_args(argv)
+
+    rows = None
+    window = args.window
+    if len(args.inputs) == 1 and args.inputs[0].endswith('.npz'):
+        (starts, lanes, counts), window = load_counts(args.inputs[0])
+    else:
+        files = []
+        for path in args.inputs:
+            files += sorted(glob.glob(os.path.join(path, '*.json'))) if os.path.isdir(path) else [path]
+        counter = ArrivalCounter(window, args.timeout)
+        for file_path in files:
+            for row in iter_rows(file_path):
+                counter.add(row)
+        rows = counter.rows
+        starts, lanes, counts = counter.result()
+        if args.save_counts:
+            save_counts(args.save_counts, (starts, lanes, counts), window)
+    if not counts.size:
+        print("Нет прибытий в выгрузках")
+        return
+    cross = np.isin(lanes, args.cross_lanes)
+
+    if min(args.current) <= args.lost_time:
+        parser.error(f"фазы действующего плана должны быть длиннее --lost-time {args.lost_time} с")
+    green, red = plan_grid(_range(args.green), _range(args.red), args.min_cycle, args.max_cycle, args.lost_time)
+    green = np.append(green, args.current[0])
+    red = np.append(red, args.current[1])
+    params = dict(saturation_flow=args.saturation_flow, car_length=args.car_length, lost_time=args.lost_time)
+    results = evaluate_parallel(counts, window, green, red, cross, workers=args.workers, **params)
+
+    current = plan_report(green[-1], red[-1], {key: values[-1] for key, values in results.items()})
+    candidates = {key: values[:-1] for key, values in results.items()}
+    best = rank_plans(green[:-1], red[:-1], candidates, args.top)
+    report = {
+        'period': [format_second(int(starts[0])), format_second(int(starts[-1]) + window)],
+        'rows': rows,
+        'vehicles': int(counts.sum()),
+        'lanes': lanes.tolist(),
+        'cross_lanes': lanes[cross].tolist(),
+        'plans': int(green.size - 1),
+        'current': current,
+        'best': best,
+    }
+    if best and current['total_delay_h']:
+        report['delay_change'] = best[0]['total_delay_h'] / current['total_delay_h'] - 1
+
+    print(f"{'T_g':>6} {'T_r':>6} {'Цикл':>6} {'Задержка, ч':>12} {'Сред., с':>9} {'Очередь макс., м':>17} {'Перегруз':>9}")
+    for plan in [current] + best:
+        print(f"{plan['green_time']:>6.0f} {plan['red_time']:>6.0f} {plan['cycle_time']:>6.0f} "
+              f"{plan['total_delay_h']:>12.1f} {plan['avg_delay_s']:>9.1f} {plan['max_queue_m']:>17.1f} "
+              f"{plan['oversaturated_windows']:>9}")
+    if args.output:
+        report['all'] = [plan_report(g, r, {key: values[i] for key, values in candidates.items()})
+                         for i, (g, r) in enumerate(zip(green[:-1], red[:-1]))]
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        print(f"Оценки планов сохранены в {args.output}")
+    print(json.dumps({key: value for key, value in report.items() if key not in ('best', 'all')},
+                     indent=4, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+# Тесты пакетных скриптов из корня репозитория (export_stream, batch, ...).
+#
+# Запуск из корня репозитория:
+#     python -m unittest discover -s tests -t .
+#
+# Тесты приложений Django лежат в MFOTS/<приложение>/tests.py.
@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+import unittest
+
+import main as pipeline
+from batch import plan_shards, process_shard, run_batch
+from benchmarks.synthetic import generate_rows
+
+PARAMS = {'red_time': 30, 'car_length': 4.5, 'green_time': 45, 'cycle_time': 75}
+
+
+def _merge(parts):
+    counts, lanes = {}, set()
+    for part in parts:
+        # Каждая секунда принадлежит ровно одному куску
+        assert not counts.keys() & part['counts'].keys()
+        counts.update(part['counts'])
+        lanes |= part['lanes']
+    return counts, lanes
+
+
+class ShardTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.rows = list(generate_rows(300, lanes=4, vehicles_per_second=1.5))
+        # Соседние строки переставлены: порядок по времени с разбросом меньше SHARD_TOLERANCE_S
+        for i in range(0, len(self.rows) - 1, 2):
+            self.rows[i], self.rows[i + 1] = self.rows[i + 1], self.rows[i]
+
+    def _write(self, name, objects):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'objects': objects}, f, indent=1)
+        return path
+
+    def _assert_sharded_equals_whole(self, path, split_size, engine='python'):
+        shards = plan_shards(path, split_size)
+        self.assertGreater(len(shards), 2)
+        starts = [t_start for _, t_start, _ in shards[1:]]
+        self.assertEqual(starts, sorted(starts))
+
+        whole = process_shard(path, (None, None, None), engine)
+        parts = [process_shard(path, shard, engine) for shard in shards]
+        self.assertEqual(_merge(parts), (whole['counts'], whole['lanes']))
+        self.assertEqual(sum(part['rows'] for part in parts), whole['rows'])
+        return whole
+
+    def test_shards_match_whole_file(self):
+        path = self._write('export.json', [{'name': 'OBJECTS', 'rows_data': self.rows}])
+        size = os.path.getsize(path)
+        for engine in ('python', 'numpy'):
+            whole = self._assert_sharded_equals_whole(path, size // 7, engine)
+            self.assertEqual(whole['rows'], len(self.rows))
+
+    def test_shards_stay_inside_objects_rows(self):
+        # Строки соседних объектов похожи на строки OBJECTS, но их считать нельзя
+        other = [dict(row, lane=row['lane'] + 100) for row in self.rows]
+        path = self._write('objects.json', [{'name': 'SIGNALS', 'rows_data': other},
+                                            {'name': 'OBJECTS', 'rows_data': self.rows},
+                                            {'name': 'TRACKS', 'rows_data': other}])
+        whole = self._assert_sharded_equals_whole(path, os.path.getsize(path) // 9)
+        self.assertEqual(whole['lanes'], {row['lane'] for row in self.rows})
+
+    def test_small_or_unsplittable_files(self):
+        path = self._write('export.json', [{'name': 'OBJECTS', 'rows_data': self.rows}])
+        self.assertEqual(plan_shards(path, 0), [(None, None, None)])
+        self.assertEqual(plan_shards(path, os.path.getsize(path) + 1), [(None, None, None)])
+        # Два объекта OBJECTS: границы массива не определить
+        half = len(self.rows) // 2
+        path = self._write('twice.json', [{'name': 'OBJECTS', 'rows_data': self.rows[:half]},
+                                          {'name': 'OBJECTS', 'rows_data': self.rows[half:]}])
+        self.assertEqual(plan_shards(path, 1 << 10), [(None, None, None)])
+
+    def test_run_batch_sharded_output(self):
+        path = self._write('export.json', [{'name': 'OBJECTS', 'rows_data': self.rows}])
+        outputs = {}
+        for name, split_size in (('whole', 0), ('sharded', os.path.getsize(path) // 5)):
+            output_dir = os.path.join(self.dir, name)
+            os.makedirs(output_dir)
+            [report] = run_batch([path], output_dir, PARAMS, workers=2, split_size=split_size)
+            self.assertNotIn('error', report)
+            self.assertEqual(report['shards'] > 1, name == 'sharded')
+            self.assertEqual(report['rows'], len(self.rows))
+            with open(pipeline.output_path(path, output_dir), 'r', encoding='utf-8') as f:
+                outputs[name] = json.load(f)
+        self.assertEqual(outputs['sharded'], outputs['whole'])
+        self.assertEqual(len(outputs['whole']), 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
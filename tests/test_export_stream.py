@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+
+import main as pipeline
+from benchmarks.synthetic import generate_rows, write_export
+from export_stream import (find_row_start, iter_row_batches, iter_rows, iter_rows_from_offset,
+                           iter_rows_from_stream, rows_array_span)
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, ensure_ascii=False)
+
+
+class ExportStreamTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _loaded_rows(self, path):
+        return list(pipeline.iter_data_rows(pipeline.load_data(path)))
+
+    def test_same_rows_as_json_load(self):
+        path = self._path('export.json')
+        write_export(path, 30, vehicles_per_second=2)
+        expected = self._loaded_rows(path)
+        self.assertTrue(expected)
+        self.assertEqual(list(iter_rows(path)), expected)
+        # Куски меньше строки: строки и числа разрезаются границей куска
+        with open(path, 'r', encoding='utf-8') as f:
+            self.assertEqual(list(iter_rows_from_stream(f, chunk_size=7)), expected)
+
+    def test_multiple_objects(self):
+        rows = list(generate_rows(5, vehicles_per_second=2))
+        other = [{'uuid': 'x', 'time': '2025-01-01 00:00:00.000', 'lane': 9, 'note': 'é, ]}'}]
+        data = {
+            'version': 1,
+            'objects': [
+                {'name': 'SIGNALS', 'rows_data': other},
+                # name после rows_data и второй объект OBJECTS
+                {'rows_data': rows[:50], 'name': 'OBJECTS', 'extra': {'rows_data': []}},
+                {'name': 'OBJECTS', 'rows_data': rows[50:]},
+                {'name': 'SIGNALS', 'rows_data': other},
+            ],
+        }
+        path = self._path('objects.json')
+        _write_json(path, data)
+        self.assertEqual(list(iter_rows(path)), self._loaded_rows(path))
+        self.assertEqual(list(iter_rows(path, 'SIGNALS')), other * 2)
+        # Такой файл нельзя читать кусками
+        self.assertIsNone(rows_array_span(path))
+
+    def test_rows_array_span(self):
+        rows = list(generate_rows(5))
+        path = self._path('span.json')
+        _write_json(path, {'objects': [{'name': 'SIGNALS', 'rows_data': [{'a': '[', 'b': [1, 2]}]},
+                                       {'name': 'OBJECTS', 'rows_data': rows},
+                                       {'name': 'SIGNALS', 'rows_data': [{'time': 't', 'uuid': 'u'}]}]})
+        start, end = rows_array_span(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(json.loads(b'[' + data[start:end] + b']'), rows)
+
+        # Чтение с найденного начала строки доходит ровно до конца массива
+        offset, row = find_row_start(path, start + (end - start) // 2)
+        tail = list(iter_rows_from_offset(path, offset))
+        self.assertEqual(tail[0], row)
+        self.assertEqual(tail, rows[len(rows) - len(tail):])
+
+    def test_empty_and_invalid(self):
+        path = self._path('empty.json')
+        _write_json(path, {'objects': [{'name': 'OBJECTS', 'rows_data': []}]})
+        self.assertEqual(list(iter_rows(path)), [])
+        self.assertEqual(list(iter_row_batches(path)), [])
+
+        broken = self._path('broken.json')
+        with open(broken, 'w', encoding='utf-8') as f:
+            f.write('{"objects": [{"name": "OBJECTS", "rows_data": [{"time": 1},')
+        with self.assertRaises(ValueError):
+            list(iter_rows(broken))
+        self.assertIsNone(rows_array_span(broken))
+
+    def test_batches(self):
+        path = self._path('export.json')
+        write_export(path, 10)
+        rows = self._loaded_rows(path)
+        batches = list(iter_row_batches(path, batch_size=64))
+        self.assertTrue(all(len(batch) == 64 for batch in batches[:-1]))
+        self.assertEqual([row for batch in batches for row in batch], rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import main as pipeline
+from benchmarks.synthetic import generate_rows, write_export
+from metrics_engine import calculate_metrics_vectorized, lane_counts, metric_arrays, rows_to_columns
+
+PARAMS = {'red_time': 30, 'car_length': 4.5, 'green_time': 45, 'cycle_time': 75}
+
+
+def _python_metrics(rows):
+    time_lane_intervals, all_lanes = pipeline.group_rows(rows)
+    return pipeline.calculate_metrics_per_second(time_lane_intervals, all_lanes, PARAMS['red_time'],
+                                                 PARAMS['car_length'], PARAMS['green_time'], PARAMS['cycle_time'])
+
+
+def _numpy_metrics(rows, batch_size=100_000, lane_order=None):
+    return calculate_metrics_vectorized(*rows_to_columns(rows, batch_size), PARAMS['red_time'], PARAMS['car_length'],
+                                        PARAMS['green_time'], PARAMS['cycle_time'], lane_order)
+
+
+class MetricsEngineTests(unittest.TestCase):
+    def test_matches_python_metrics(self):
+        rows = list(generate_rows(120, lanes=5, vehicles_per_second=1.5))
+        self.assertEqual(_numpy_metrics(rows), _python_metrics(rows))
+        # Пачки rows_to_columns не влияют на результат
+        self.assertEqual(_numpy_metrics(rows, batch_size=97), _python_metrics(rows))
+
+    def test_repeats_gaps_and_sparse_lanes(self):
+        def row(second, lane, uuid):
+            return {'time': f'2025-01-01 00:00:{second:02d}.{uuid:03d}', 'lane': lane, 'uuid': f'u{uuid}'}
+
+        # Повторы машины в секунде, пропущенные секунды, полоса, которая есть не в каждой секунде
+        rows = [row(1, 0, 1), row(1, 0, 1), row(1, 3, 2), row(2, 0, 1), row(2, 0, 3), row(7, 10, 2),
+                row(7, 10, 4), row(59, 3, 5), row(59, 0, 5)]
+        expected = _python_metrics(rows)
+        self.assertEqual(_numpy_metrics(rows), expected)
+        self.assertEqual([r['timestamp'][-2:] for r in expected], ['01', '02', '07', '59'])
+
+    def test_lane_order(self):
+        rows = list(generate_rows(30, lanes=4, vehicles_per_second=2))
+        lane_order = sorted({row['lane'] for row in rows}, reverse=True)
+        self.assertEqual(len(lane_order), 4)
+        results = _numpy_metrics(rows, lane_order=lane_order)
+        self.assertEqual(list(results[0]['lane_metrics']), lane_order)
+        self.assertEqual(results, _python_metrics(rows))
+
+    def test_empty(self):
+        self.assertEqual(_numpy_metrics([]), [])
+        seconds, lanes, counts = lane_counts(*rows_to_columns([]))
+        self.assertEqual((seconds.size, lanes.size, counts.shape), (0, 0, (0, 0)))
+
+    def test_metric_arrays_match_results(self):
+        rows = list(generate_rows(30, lanes=3, vehicles_per_second=2))
+        arrays = metric_arrays(*lane_counts(*rows_to_columns(rows)), PARAMS['red_time'], PARAMS['car_length'],
+                               PARAMS['green_time'], PARAMS['cycle_time'])
+        results = _python_metrics(rows)
+        lanes = arrays['lanes'].tolist()
+        self.assertEqual(lanes, sorted(results[0]['lane_metrics']))
+        self.assertEqual(arrays['total_flow_intensity'].tolist(), [r['total_flow_intensity'] for r in results])
+        for name in ('cars_in_lane', 'queue_length_m', 'queue_length_sec', 'queue_delay'):
+            expected = [[r['lane_metrics'][lane][name] for lane in lanes] for r in results]
+            np.testing.assert_array_equal(arrays[name], expected)
+        self.assertEqual(float(arrays['total_capacity']), results[0]['total_capacity'])
+
+    def test_process_single_file_engines(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'export.json')
+            write_export(path, 60, vehicles_per_second=2)
+            outputs = {}
+            for engine in ('python', 'numpy'):
+                output_dir = os.path.join(tmp, engine)
+                stats = pipeline.process_single_file(path, output_dir, engine=engine, **PARAMS)
+                with open(stats['output_file'], 'r', encoding='utf-8') as f:
+                    outputs[engine] = json.load(f)
+            self.assertEqual(outputs['numpy'], outputs['python'])
+
+
+if __name__ == '__main__':
+    unittest.main()
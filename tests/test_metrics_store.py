@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import main as pipeline
+from benchmarks.synthetic import generate_rows
+from metrics_store import (LANE_METRICS, arrays_to_results, load_metrics_npz, results_to_arrays,
+                           save_results_to_npz)
+
+PARAMS = {'red_time': 30, 'car_length': 4.5, 'green_time': 45, 'cycle_time': 75}
+
+
+def _results(rows):
+    time_lane_intervals, all_lanes = pipeline.group_rows(rows)
+    return pipeline.calculate_metrics_per_second(time_lane_intervals, all_lanes, PARAMS['red_time'],
+                                                 PARAMS['car_length'], PARAMS['green_time'], PARAMS['cycle_time'])
+
+
+class NpzRoundTripTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'metrics.npz')
+
+    def _round_trip(self, results):
+        save_results_to_npz(results, self.path)
+        loaded = {mmap: load_metrics_npz(self.path, mmap=mmap) for mmap in (True, False)}
+        for name, array in loaded[False].items():
+            np.testing.assert_array_equal(loaded[True][name], array, err_msg=name)
+            self.assertEqual(loaded[True][name].dtype, array.dtype, name)
+        return loaded[True]
+
+    def test_round_trip(self):
+        results = _results(generate_rows(60, lanes=5, vehicles_per_second=2))
+        arrays = self._round_trip(results)
+        self.assertIsInstance(arrays['cars_in_lane'], np.memmap)
+        self.assertEqual(arrays['cars_in_lane'].shape, (60, 5))
+        self.assertEqual(arrays_to_results(arrays), results)
+
+    def test_sparse_lanes(self):
+        # Полосы идут не подряд и не в каждой секунде
+        rows = [{'time': '2025-01-01 00:00:01.000', 'lane': 7, 'uuid': 'a'},
+                {'time': '2025-01-01 00:00:01.500', 'lane': -2, 'uuid': 'b'},
+                {'time': '2025-01-01 00:00:04.000', 'lane': 7, 'uuid': 'c'}]
+        results = _results(rows)
+        arrays = self._round_trip(results)
+        self.assertEqual(arrays['lanes'].tolist(), [-2, 7])
+        self.assertEqual(arrays['cars_in_lane'].tolist(), [[1, 1], [0, 1]])
+        self.assertEqual(arrays_to_results(arrays), results)
+
+    def test_zero_rows(self):
+        arrays = self._round_trip([])
+        self.assertEqual(arrays['time'].shape, (0,))
+        self.assertEqual(arrays['lanes'].shape, (0,))
+        for name in LANE_METRICS:
+            self.assertEqual(arrays[name].shape, (0, 0), name)
+        self.assertEqual(float(arrays['total_capacity']), 0.0)
+        self.assertEqual(arrays_to_results(arrays), [])
+
+    def test_empty_export(self):
+        output_dir = os.path.dirname(self.path)
+        input_file = os.path.join(output_dir, 'empty.json')
+        with open(input_file, 'w', encoding='utf-8') as f:
+            f.write('{"objects": [{"name": "OBJECTS", "rows_data": []}]}')
+        for engine in ('python', 'numpy'):
+            stats = pipeline.process_single_file(input_file, os.path.join(output_dir, engine), engine=engine,
+                                                 output_format='npz', **PARAMS)
+            self.assertEqual(stats['seconds'], 0)
+            self.assertEqual(arrays_to_results(load_metrics_npz(stats['output_file'])), [])
+
+    def test_columns_layout(self):
+        results = _results(generate_rows(10, lanes=3))
+        arrays = results_to_arrays(results)
+        self.assertEqual(arrays['time'].dtype, np.int64)
+        self.assertEqual(arrays['cars_in_lane'].dtype, np.int64)
+        self.assertEqual(arrays['queue_delay'].dtype, np.float64)
+        self.assertEqual(arrays['total_flow_intensity'].tolist(), arrays['cars_in_lane'].sum(axis=1).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import main as pipeline
+from batch import run_batch
+from benchmarks.synthetic import generate_rows
+from metrics_store import load_metrics_npz
+from result_cache import load_manifest, save_manifest
+
+PARAMS = {'red_time': 30, 'car_length': 4.5, 'green_time': 45, 'cycle_time': 75}
+
+
+def _write_export(path, rows):
+    # Как benchmarks.synthetic.write_export: дописанный файл начинается с прежнего
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"objects": [{"name": "OBJECTS", "rows_data": [\n')
+        f.write(',\n'.join(json.dumps(row) for row in rows))
+        f.write('\n]}]}\n')
+
+
+class AppendTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.input_file = os.path.join(self.dir, 'export.json')
+        self.rows = list(generate_rows(120, lanes=4, vehicles_per_second=2))
+
+    def _run(self, output_dir, output_format):
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = load_manifest(output_dir)
+        [report] = run_batch([self.input_file], output_dir, PARAMS, workers=1, split_size=0,
+                             manifest=manifest, output_format=output_format)
+        self.assertNotIn('error', report)
+        save_manifest(output_dir, manifest)
+        return report
+
+    def _load(self, output_dir, output_format):
+        output_file = pipeline.output_path(self.input_file, output_dir, output_format)
+        if output_format == 'npz':
+            return load_metrics_npz(output_file, mmap=False)
+        with open(output_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _assert_same(self, appended, full, output_format):
+        if output_format == 'npz':
+            self.assertEqual(appended.keys(), full.keys())
+            for name in full:
+                np.testing.assert_array_equal(appended[name], full[name], err_msg=name)
+        else:
+            self.assertEqual(appended, full)
+
+    def _append_and_compare(self, cuts, output_format, rows=None, status='appended'):
+        """Пишет строки rows до каждой границы cuts и досчитывает, затем сверяет с полным расчётом."""
+        rows = self.rows if rows is None else rows
+        incremental = os.path.join(self.dir, output_format, 'incremental')
+        _write_export(self.input_file, rows[:cuts[0]])
+        self.assertEqual(self._run(incremental, output_format)['status'], 'processed')
+        self.assertEqual(self._run(incremental, output_format)['status'], 'skipped')
+
+        # Следующее дописывание опирается на манифест, обновлённый предыдущим
+        for previous, cut in zip(cuts, cuts[1:] + [len(rows)]):
+            _write_export(self.input_file, rows[:cut])
+            report = self._run(incremental, output_format)
+            self.assertEqual(report['status'], status)
+            self.assertEqual(report['rows'], cut - previous if status == 'appended' else cut)
+
+        full = os.path.join(self.dir, output_format, 'full')
+        self._run(full, output_format)
+        self._assert_same(self._load(incremental, output_format), self._load(full, output_format), output_format)
+
+    def test_append_matches_full_recompute(self):
+        # Разрезы посреди секунды: машины последних секунд есть по обе стороны
+        cuts = [len(self.rows) // 2 + 7, len(self.rows) * 3 // 4 + 3]
+        for cut in cuts:
+            self.assertEqual(self.rows[cut - 1]['time'][:19], self.rows[cut]['time'][:19])
+        for output_format in ('json', 'npz'):
+            with self.subTest(output_format=output_format):
+                self._append_and_compare(cuts, output_format)
+
+    def test_new_lane_recomputes_file(self):
+        rows = self.rows + [dict(row, lane=9) for row in self.rows[-20:]]
+        self._append_and_compare([len(self.rows)], 'json', rows, status='processed')
+
+    def test_changed_prefix_recomputes_file(self):
+        incremental = os.path.join(self.dir, 'incremental')
+        _write_export(self.input_file, self.rows[:1000])
+        self._run(incremental, 'json')
+        rows = [dict(self.rows[0], lane=3)] + self.rows[1:]
+        _write_export(self.input_file, rows)
+        self.assertEqual(self._run(incremental, 'json')['status'], 'processed')
+        full = os.path.join(self.dir, 'full')
+        self._run(full, 'json')
+        self.assertEqual(self._load(incremental, 'json'), self._load(full, 'json'))
+
+
+if __name__ == '__main__':
+    unittest.main()
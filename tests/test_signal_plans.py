@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+from benchmarks.synthetic import generate_rows
+from signal_plans import arrival_counts, evaluate_parallel, evaluate_plans, plan_grid, rank_plans
+
+
+class SignalPlanTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Час с перегрузкой в середине: остаточная очередь переходит между окнами
+        self.counts = rng.poisson(40, size=(12, 4)).astype(float)
+        self.counts[5:7] *= 4
+        self.cross = np.array([False, False, True, True])
+        self.green, self.red = plan_grid(np.arange(10, 91, 5), np.arange(10, 91, 5), min_cycle=40, max_cycle=150)
+
+    def _assert_results_equal(self, actual, expected):
+        self.assertEqual(actual.keys(), expected.keys())
+        for key in expected:
+            np.testing.assert_allclose(actual[key], expected[key], rtol=1e-12, err_msg=key)
+
+    def test_parallel_matches_single_process(self):
+        expected = evaluate_plans(self.counts, 300, self.green, self.red, self.cross)
+        self.assertGreater(expected['oversaturated_windows'].max(), 0)
+        for workers in (1, 3):
+            with self.subTest(workers=workers):
+                result = evaluate_parallel(self.counts, 300, self.green, self.red, self.cross, workers=workers)
+                self._assert_results_equal(result, expected)
+        # Параметры доходят до процессов
+        params = {'saturation_flow': 0.4, 'car_length': 6.0, 'lost_time': 5.0}
+        self._assert_results_equal(
+            evaluate_parallel(self.counts, 300, self.green, self.red, self.cross, workers=3, **params),
+            evaluate_plans(self.counts, 300, self.green, self.red, self.cross, **params))
+
+    def test_plans_are_independent(self):
+        results = evaluate_plans(self.counts, 300, self.green, self.red, self.cross)
+        for i in (0, len(self.green) // 2, len(self.green) - 1):
+            single = evaluate_plans(self.counts, 300, self.green[i:i + 1], self.red[i:i + 1], self.cross)
+            for key, values in single.items():
+                np.testing.assert_allclose(values[0], results[key][i], rtol=1e-12, err_msg=key)
+
+    def test_cross_lanes_swap_phases(self):
+        green, red = np.array([60.0]), np.array([20.0])
+        main = evaluate_plans(self.counts[:, :2], 300, green, red)
+        cross = evaluate_plans(self.counts[:, :2], 300, red, green, cross=[True, True])
+        self._assert_results_equal(cross, main)
+
+    def test_plan_grid_and_ranking(self):
+        self.assertTrue(((self.green + self.red >= 40) & (self.green + self.red <= 150)).all())
+        with self.assertRaises(ValueError):
+            evaluate_plans(self.counts, 300, np.array([2.0]), np.array([30.0]))
+        results = evaluate_plans(self.counts, 300, self.green, self.red, self.cross)
+        ranked = rank_plans(self.green, self.red, results, top=5)
+        delays = [plan['total_delay_h'] for plan in ranked]
+        self.assertEqual(delays, sorted(delays))
+        self.assertAlmostEqual(delays[0], results['total_delay_s'].min() / 3600)
+
+    def test_arrival_counts(self):
+        rows = list(generate_rows(600, lanes=3, vehicles_per_second=1))
+        starts, lanes, counts = arrival_counts(rows, window_s=60)
+        self.assertEqual(lanes.tolist(), sorted({row['lane'] for row in rows}))
+        self.assertEqual(np.diff(starts).tolist(), [60] * (len(starts) - 1))
+        # Машина сообщает о себе без перерывов: каждый uuid — одно прибытие
+        self.assertEqual(counts.sum(), len({row['uuid'] for row in rows}))
+        starts, lanes, counts = arrival_counts([])
+        self.assertEqual(counts.shape, (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from benchmarks.synthetic import generate_rows
+from trajectories import FREE_FLOW_SPEED, TrajectoryTracker, iter_trajectories, summarize
+
+
+def _row(uuid, t, y, speed, lane=1):
+    second, fraction = divmod(round(t * 1000), 1000)
+    return {'uuid': uuid, 'obj_id': 1, 'lane': lane, 'time': f'2025-01-01 00:00:{second:02d}.{fraction:03d}',
+            'point_x': 0.0, 'point_y': y, 'obj_speed': speed}
+
+
+class TrajectoryTests(unittest.TestCase):
+    def test_stop_and_delay(self):
+        # 10 м за 1 с, стоит 3 с, затем ещё 10 м за 1 с
+        rows = [_row('a', 0, 0, 10), _row('a', 1, 10, 10), _row('a', 1.5, 10, 0), _row('a', 3, 10, 0.2),
+                _row('a', 4.5, 10, 5), _row('a', 5.5, 20, 10)]
+        [item] = list(iter_trajectories(rows))
+        self.assertEqual(item['uuid'], 'a')
+        self.assertEqual(item['start'], '2025-01-01 00:00:00')
+        self.assertAlmostEqual(item['travel_time_s'], 5.5)
+        self.assertAlmostEqual(item['distance_m'], 20)
+        self.assertEqual(item['stops'], 1)
+        self.assertAlmostEqual(item['stopped_s'], 3)
+        self.assertAlmostEqual(item['delay_s'], 5.5 - 20 / FREE_FLOW_SPEED)
+        self.assertEqual(item['reports'], 6)
+
+    def test_short_slowdown_is_not_a_stop(self):
+        rows = [_row('a', 0, 0, 10), _row('a', 1, 10, 0.1), _row('a', 1.5, 10, 10), _row('a', 2, 15, 10)]
+        [item] = list(iter_trajectories(rows))
+        self.assertEqual((item['stops'], item['stopped_s']), (0, 0.0))
+
+    def test_timeout_closes_and_reopens_track(self):
+        tracker = TrajectoryTracker(timeout=5)
+        self.assertEqual(tracker.add(_row('a', 0, 0, 10)), [])
+        self.assertEqual(tracker.add(_row('b', 3, 0, 10)), [])
+        # 'a' не появлялась 5 с: закрывается, 'b' ещё открыт
+        closed = tracker.add(_row('b', 5, 20, 10))
+        self.assertEqual([item['uuid'] for item in closed], ['a'])
+        self.assertEqual(list(tracker.open), ['b'])
+        # Та же машина после перерыва — новый трек
+        self.assertEqual([item['uuid'] for item in tracker.add(_row('a', 20, 0, 10))], ['b'])
+        self.assertEqual([item['uuid'] for item in tracker.flush()], ['a'])
+        self.assertEqual(tracker.stats['tracks'], 3)
+
+    def test_late_row_does_not_move_vehicle_back(self):
+        rows = [_row('a', 0, 0, 10), _row('a', 2, 20, 10), _row('a', 1, 10, 10), _row('a', 3, 30, 10)]
+        [item] = list(iter_trajectories(rows))
+        self.assertAlmostEqual(item['distance_m'], 30)
+        self.assertAlmostEqual(item['travel_time_s'], 3)
+        self.assertEqual(item['reports'], 4)
+
+    def test_every_vehicle_once(self):
+        rows = list(generate_rows(60, lanes=3, vehicles_per_second=1.5))
+        items = list(iter_trajectories(rows))
+        # Машина сообщает о себе без перерывов, поэтому каждый uuid — один трек
+        self.assertEqual(sorted(item['uuid'] for item in items), sorted({row['uuid'] for row in rows}))
+        self.assertEqual(sum(item['reports'] for item in items), len(rows))
+        summary = summarize(items)
+        self.assertEqual(sum(lane['vehicles'] for lane in summary.values()), len(items))
+        self.assertEqual(set(summary), {row['lane'] for row in rows})
+
+
+if __name__ == '__main__':
+    unittest.main()
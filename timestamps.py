@@ -0,0 +1,13 @@
+import importlib.util
+import os
+import sys
+
+# Разбор времени строк выгрузки живёт в MFOTS/timestamps.py: им пользуется и
+# Django-проект, а образ собирается только из папки MFOTS. Корневые скрипты
+# импортируют его как раньше (import timestamps) через этот модуль.
+
+_spec = importlib.util.spec_from_file_location(
+    __name__, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'MFOTS', 'timestamps.py'))
+_module = importlib.util.module_from_spec(_spec)
+sys.modules[__name__] = _module
+_spec.loader.exec_module(_module)
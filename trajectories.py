@@ -0,0 +1,213 @@
+import argparse
+import json
+import math
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from export_stream import iter_rows
+from timestamps import epoch_second, format_second, microseconds
+
+# Траектории машин и задержки по каждой машине.
+#
+# Строки выгрузки группируются по uuid в треки, упорядоченные по времени.
+# Трек не хранит точки: на каждую строку обновляются накопленные величины
+# (путь, остановки, время в остановке), поэтому память занимают только
+# открытые треки. Трек закрывается, если машина не появлялась timeout секунд
+# (по времени самих строк), и сразу отдаётся наружу.
+#
+# Задержка машины — время проезда минус время проезда того же пути со
+# скоростью свободного движения free_flow_speed. Остановка — интервал не
+# короче stop_min_s, на котором скорость машины ниже stop_speed.
+
+INACTIVITY_TIMEOUT = 5.0  # сек
+STOP_SPEED = 0.5  # м/с
+STOP_MIN_S = 1.0  # сек
+FREE_FLOW_SPEED = 13.9  # м/с, 50 км/ч
+
+
+class Track:
+    """Накопленное состояние одной машины."""
+
+    __slots__ = ('uuid', 'obj_id', 'lane', 'first', 'last', 'x', 'y', 'distance', 'speed_sum', 'reports',
+                 'stops', 'stopped_s', 'slow_since')
+
+    def __init__(self, row: Dict[str, Any], t: float):
+        self.uuid = row['uuid']
+        self.obj_id = row.get('obj_id')
+        self.lane = row.get('lane')
+        self.first = self.last = t
+        self.x = float(row.get('point_x') or 0)
+        self.y = float(row.get('point_y') or 0)
+        self.distance = 0.0
+        self.speed_sum = 0.0
+        self.reports = 0
+        self.stops = 0
+        self.stopped_s = 0.0
+        self.slow_since: Optional[float] = None
+
+
+class TrajectoryTracker:
+    """
+    Потоковая сборка треков. Строки подаются по времени (с небольшим
+    разбросом, меньше timeout); add возвращает треки, закрытые к этому моменту.
+    """
+
+    def __init__(self, timeout: float = INACTIVITY_TIMEOUT, stop_speed: float = STOP_SPEED,
+                 stop_min_s: float = STOP_MIN_S, free_flow_speed: float = FREE_FLOW_SPEED):
+        self.timeout = timeout
+        self.stop_speed = stop_speed
+        self.stop_min_s = stop_min_s
+        self.free_flow_speed = free_flow_speed
+        # Треки в порядке последнего появления: истёкшие всегда в начале
+        self.open: 'OrderedDict[str, Track]' = OrderedDict()
+        self.now = float('-inf')
+        self.stats = {'rows': 0, 'tracks': 0, 'max_open': 0}
+
+    def add(self, row: Dict[str, Any]) -> List[Dict[str, Any]]:
+        time_str = row['time']
+        t = epoch_second(time_str) + microseconds(time_str) / 1e6
+        self.stats['rows'] += 1
+
+        track = self.open.get(row['uuid'])
+        if track is None:
+            track = self.open[row['uuid']] = Track(row, t)
+            if len(self.open) > self.stats['max_open']:
+                self.stats['max_open'] = len(self.open)
+        else:
+            self.open.move_to_end(row['uuid'])
+
+        speed = float(row.get('obj_speed') or 0)
+        track.reports += 1
+        track.speed_sum += speed
+        # Строка раньше уже учтённой (разброс порядка) не двигает машину назад
+        if t >= track.last:
+            x = float(row.get('point_x') or 0)
+            y = float(row.get('point_y') or 0)
+            track.distance += math.hypot(x - track.x, y - track.y)
+            track.x, track.y = x, y
+            track.last = t
+            if speed < self.stop_speed:
+                if track.slow_since is None:
+                    track.slow_since = t
+            elif track.slow_since is not None:
+                self._end_stop(track, t)
+
+        if t > self.now:
+            self.now = t
+            return self._expire(t - self.timeout)
+        return []
+
+    def _end_stop(self, track: Track, t: float) -> None:
+        duration = t - track.slow_since
+        if duration >= self.stop_min_s:
+            track.stops += 1
+            track.stopped_s += duration
+        track.slow_since = None
+
+    def _expire(self, deadline: float) -> List[Dict[str, Any]]:
+        closed = []
+        while self.open:
+            track = next(iter(self.open.values()))
+            if track.last > deadline:
+                break
+            self.open.popitem(last=False)
+            closed.append(self.close(track))
+        return closed
+
+    def close(self, track: Track) -> Dict[str, Any]:
+        """Итог трека: время проезда, путь, остановки и задержка."""
+        if track.slow_since is not None:
+            self._end_stop(track, track.last)
+        self.stats['tracks'] += 1
+        travel_time = track.last - track.first
+        return {
+            'uuid': track.uuid,
+            'obj_id': track.obj_id,
+            'lane': track.lane,
+            'start': format_second(int(track.first)),
+            'travel_time_s': travel_time,
+            'distance_m': track.distance,
+            'avg_speed': track.speed_sum / track.reports,
+            'stops': track.stops,
+            'stopped_s': track.stopped_s,
+            'delay_s': max(0.0, travel_time - track.distance / self.free_flow_speed),
+            'reports': track.reports,
+        }
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Закрывает все открытые треки (конец выгрузки)."""
+        closed = [self.close(track) for track in self.open.values()]
+        self.open.clear()
+        return closed
+
+
+def iter_trajectories(rows: Iterable[Dict[str, Any]], **params) -> Iterator[Dict[str, Any]]:
+    """Итоги треков по мере их закрытия; параметры — как у TrajectoryTracker."""
+    tracker = TrajectoryTracker(**params)
+    add = tracker.add
+    for row in rows:
+        closed = add(row)
+        if closed:
+            yield from closed
+    yield from tracker.flush()
+
+
+def summarize(trajectories: Iterable[Dict[str, Any]]) -> Dict[Any, Dict[str, float]]:
+    """Сводка по полосам: число машин, средние время проезда, задержка и остановки."""
+    totals: Dict[Any, Dict[str, float]] = {}
+    for item in trajectories:
+        lane = totals.setdefault(item['lane'], {'vehicles': 0, 'travel_time_s': 0.0, 'delay_s': 0.0,
+                                                'stops': 0, 'stopped_s': 0.0, 'stopped_vehicles': 0})
+        lane['vehicles'] += 1
+        lane['travel_time_s'] += item['travel_time_s']
+        lane['delay_s'] += item['delay_s']
+        lane['stops'] += item['stops']
+        lane['stopped_s'] += item['stopped_s']
+        lane['stopped_vehicles'] += item['stops'] > 0
+    return {
+        lane: {
+            'vehicles': t['vehicles'],
+            'avg_travel_time_s': t['travel_time_s'] / t['vehicles'],
+            'avg_delay_s': t['delay_s'] / t['vehicles'],
+            'total_delay_s': t['delay_s'],
+            'avg_stops': t['stops'] / t['vehicles'],
+            'avg_stopped_s': t['stopped_s'] / t['vehicles'],
+            'stopped_share': t['stopped_vehicles'] / t['vehicles'],
+        }
+        for lane, t in totals.items()
+    }
+
+
+def write_trajectories(trajectories: Iterable[Dict[str, Any]], output_file: str) -> List[Dict[str, Any]]:
+    """Пишет итоги треков JSON-массивом по мере их закрытия; возвращает их же для сводки."""
+    written = []
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for item in trajectories:
+            f.write(',\n' if written else '\n')
+            f.write(json.dumps(item, ensure_ascii=False))
+            written.append({key: item[key] for key in ('lane', 'travel_time_s', 'delay_s', 'stops', 'stopped_s')})
+        f.write('\n]\n')
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Траектории машин и задержки по JSON-выгрузке датчика.")
+    parser.add_argument('input_file')
+    parser.add_argument('--output', help='сохранить итоги по каждой машине в JSON')
+    parser.add_argument('--timeout', type=float, default=INACTIVITY_TIMEOUT, help='закрыть трек после, сек')
+    parser.add_argument('--stop-speed', type=float, default=STOP_SPEED, help='скорость остановки, м/с')
+    parser.add_argument('--stop-min', type=float, default=STOP_MIN_S, help='минимальная остановка, сек')
+    parser.add_argument('--free-flow-speed', type=float, default=FREE_FLOW_SPEED, help='скорость без задержки, м/с')
+    args = parser.parse_args(argv)
+
+    trajectories = iter_trajectories(iter_rows(args.input_file), timeout=args.timeout, stop_speed=args.stop_speed,
+                                     stop_min_s=args.stop_min, free_flow_speed=args.free_flow_speed)
+    if args.output:
+        trajectories = write_trajectories(trajectories, args.output)
+        print(f"Траектории сохранены в {args.output}")
+    print(json.dumps(summarize(trajectories), indent=4, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,36 @@
-import pygame
-import time
+import argparse
 import json
-from datetime import datetime
+import time
+
+import numpy as np
+import pygame
 
-# Инициализация Pygame
-pygame.init()
+from replay import DEFAULT_WINDOW, load_replay
+from timestamps import format_second
 
 # Константы для экрана
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 BACKGROUND_COLOR = (255, 255, 255)  # Белый фон
+FPS = 60
 
 # Цвета объектов
 RED_COLOR = (255, 0, 0)
 GREEN_COLOR = (0, 255, 0)
 BLUE_COLOR = (0, 0, 255)
 
-# Установки экрана
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Перекресток")
+# Воспроизведение: цвета полос, размеры машины и шкалы времени
+LANE_COLORS = [(0, 0, 255), (255, 0, 0), (0, 160, 0), (255, 140, 0), (160, 0, 160), (0, 160, 160)]
+VEHICLE_SIZE = (12, 6)
+TIMELINE_HEIGHT = 24
+MARGIN = 20
+SEEK_STEP = 10  # сек, стрелки влево/вправо
+SPEEDS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+TEXT_COLOR = (0, 0, 0)
+TIMELINE_COLOR = (200, 200, 200)
+CURSOR_COLOR = (255, 0, 0)
+
+RELOAD_INTERVAL = 1.0  # сек, как часто живой режим перечитывает файл
 
 
 # Пример объекта
@@ -28,15 +40,10 @@ class Vehicle:
         self.y = y
         self.color = color
 
-    def draw(self):
+    def draw(self, screen):
         pygame.draw.rect(screen, self.color, (self.x, self.y, 40, 20))
 
 
-# Функция для преобразования строки времени в datetime
-def parse_time(time_str):
-    return datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S.%f")
-
-
 # Функция для чтения объектов из JSON-файла
 def read_objects_from_json(filename):
     vehicles = []
@@ -62,35 +69,174 @@ def read_objects_from_json(filename):
     return vehicles
 
 
-# Основной цикл программы
-def main():
+def init_screen():
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Перекресток")
+    return screen
+
+
+# Живой режим: файл дописывается, объекты перечитываются раз в секунду
+def run_live(filename):
+    screen = init_screen()
     clock = pygame.time.Clock()
     running = True
-    filename = 'JSON\Олимпийский20_03_2025_17_35.json'  # Имя JSON-файла
+    vehicles = []
+    loaded_at = None
 
     while running:
-        screen.fill(BACKGROUND_COLOR)
-
-        # Чтение объектов из JSON-файла каждую секунду
-        vehicles = read_objects_from_json(filename)
+        # Перечитываем по таймеру, не останавливая обработку событий
+        now = time.monotonic()
+        if loaded_at is None or now - loaded_at >= RELOAD_INTERVAL:
+            vehicles = read_objects_from_json(filename)
+            loaded_at = now
 
+        screen.fill(BACKGROUND_COLOR)
         for vehicle in vehicles:
-            vehicle.draw()
-
+            vehicle.draw(screen)
         pygame.display.update()
 
-        # Ожидание 1 секунду
-        time.sleep(1)
-
         # Проверка на закрытие окна
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
 
-        clock.tick(60)  # Ограничение кадров в секунду
+        clock.tick(FPS)  # Ограничение кадров в секунду
 
     pygame.quit()
 
 
+class ReplayView:
+    """Воспроизведение выгрузки: скорость, перемотка и шкала времени."""
+
+    def __init__(self, replay, speed=1.0, window=DEFAULT_WINDOW):
+        self.replay = replay
+        self.window = window
+        self.t = 0.0
+        self.speed_index = min(range(len(SPEEDS)), key=lambda i: abs(SPEEDS[i] - speed))
+        self.playing = True
+        self.scrubbing = False
+
+        # Масштаб: вся выгрузка помещается в поле над шкалой времени
+        x_min, x_max, y_min, y_max = replay.bounds()
+        field_w = SCREEN_WIDTH - 2 * MARGIN - VEHICLE_SIZE[0]
+        field_h = SCREEN_HEIGHT - TIMELINE_HEIGHT - 2 * MARGIN - VEHICLE_SIZE[1]
+        self.scale = min(field_w / max(x_max - x_min, 1e-9), field_h / max(y_max - y_min, 1e-9))
+        self.origin = (x_min, y_min)
+
+        # Машины рисуются готовыми спрайтами одним вызовом blits
+        self.sprites = []
+        for color in LANE_COLORS:
+            sprite = pygame.Surface(VEHICLE_SIZE)
+            sprite.fill(color)
+            self.sprites.append(sprite)
+        self.font = pygame.font.Font(None, 22)
+
+    @property
+    def speed(self):
+        return SPEEDS[self.speed_index]
+
+    def seek(self, t):
+        self.t = min(max(t, 0.0), self.replay.duration)
+
+    def _timeline_rect(self):
+        return pygame.Rect(MARGIN, SCREEN_HEIGHT - TIMELINE_HEIGHT, SCREEN_WIDTH - 2 * MARGIN, TIMELINE_HEIGHT - 6)
+
+    def _seek_to_mouse(self, mouse_x):
+        rect = self._timeline_rect()
+        self.seek((mouse_x - rect.x) / rect.width * self.replay.duration)
+
+    def handle(self, event):
+        """Управление: пробел — пауза, вверх/вниз — скорость, влево/вправо — перемотка, мышь — шкала."""
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_SPACE:
+                self.playing = not self.playing
+            elif event.key == pygame.K_UP:
+                self.speed_index = min(self.speed_index + 1, len(SPEEDS) - 1)
+            elif event.key == pygame.K_DOWN:
+                self.speed_index = max(self.speed_index - 1, 0)
+            elif event.key == pygame.K_RIGHT:
+                self.seek(self.t + SEEK_STEP * self.speed)
+            elif event.key == pygame.K_LEFT:
+                self.seek(self.t - SEEK_STEP * self.speed)
+            elif event.key == pygame.K_HOME:
+                self.seek(0.0)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            if self._timeline_rect().collidepoint(event.pos):
+                self.scrubbing = True
+                self._seek_to_mouse(event.pos[0])
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.scrubbing = False
+        elif event.type == pygame.MOUSEMOTION and self.scrubbing:
+            self._seek_to_mouse(event.pos[0])
+
+    def advance(self, dt):
+        if self.playing and not self.scrubbing:
+            self.seek(self.t + dt * self.speed)
+
+    def draw(self, screen):
+        screen.fill(BACKGROUND_COLOR)
+        rows = self.replay.frame(self.t, self.window)
+        if rows.size:
+            # Перевод координат в пиксели — для всего кадра сразу
+            px = ((self.replay.x[rows] - self.origin[0]) * self.scale + MARGIN).astype(np.int32)
+            py = ((self.replay.y[rows] - self.origin[1]) * self.scale + MARGIN).astype(np.int32)
+            colors = (self.replay.lanes[rows] % len(self.sprites)).tolist()
+            screen.blits([(self.sprites[c], (x, y)) for c, x, y in zip(colors, px.tolist(), py.tolist())],
+                         doreturn=False)
+
+        rect = self._timeline_rect()
+        pygame.draw.rect(screen, TIMELINE_COLOR, rect)
+        if self.replay.duration:
+            cursor_x = rect.x + int(self.t / self.replay.duration * rect.width)
+            pygame.draw.line(screen, CURSOR_COLOR, (cursor_x, rect.top), (cursor_x, rect.bottom), 2)
+        status = "" if self.playing else " пауза"
+        text = (f"{format_second(self.replay.start_second + int(self.t))}  x{self.speed:g}{status}  "
+                f"машин: {rows.size}")
+        screen.blit(self.font.render(text, True, TEXT_COLOR), (MARGIN, 2))
+
+
+def run_replay(filename, speed=1.0, window=DEFAULT_WINDOW):
+    started = time.perf_counter()
+    replay = load_replay(filename)
+    print(f"Загружено {replay.times.size} строк ({replay.duration:.0f} с) за {time.perf_counter() - started:.1f} с")
+
+    screen = init_screen()
+    view = ReplayView(replay, speed, window)
+    clock = pygame.time.Clock()
+    running = True
+
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                running = False
+            else:
+                view.handle(event)
+
+        view.draw(screen)
+        pygame.display.update()
+        # Время воспроизведения идёт по реальному времени кадра, а не по числу кадров
+        view.advance(clock.tick(FPS) / 1000)
+
+    pygame.quit()
+
+
+# Основной цикл программы
+def main():
+    parser = argparse.ArgumentParser(description="Визуализация объектов перекрёстка.")
+    parser.add_argument('filename', nargs='?', default='JSON\\Олимпийский20_03_2025_17_35.json',
+                        help='JSON-файл выгрузки')
+    parser.add_argument('--replay', action='store_true', help='воспроизвести выгрузку по времени')
+    parser.add_argument('--speed', type=float, default=1.0, help='начальная скорость воспроизведения')
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW,
+                        help='сколько секунд машина видна после последнего сообщения')
+    args = parser.parse_args()
+
+    if args.replay:
+        run_replay(args.filename, args.speed, args.window)
+    else:
+        run_live(args.filename)
+
+
 if __name__ == "__main__":
     main()